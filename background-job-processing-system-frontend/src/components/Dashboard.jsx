@@ -46,10 +46,18 @@ function Dashboard() {
     wsRef.current.onmessage = (event) => {
       if (event.data) {
         const msg = JSON.parse(event.data);
+        // Updates arrive as a batched array (one entry per job); older servers send single objects.
+        const updates = new Map(
+          (Array.isArray(msg) ? msg : [msg]).map((update) => [update.id, update])
+        );
         setJobs((prevJobs) =>
           prevJobs.map((job) =>
-            job.id === msg.id
-              ? { ...job, status: msg.status, result: msg.result }
+            updates.has(job.id)
+              ? {
+                  ...job,
+                  status: updates.get(job.id).status,
+                  result: updates.get(job.id).result,
+                }
               : job
           )
         );
@@ -0,0 +1,141 @@
+"""
+Benchmark: I/O-bound jobs per second per core, prefork-style vs the asyncio worker.
+
+Starts a stub SMTP server and a stub HTTP server, each answering after --latency-ms, then runs
+send_email and fetch_data job handlers:
+
+- one at a time, as a single Celery prefork process does (jobs.handlers.run_handler)
+- as coroutines on one event loop, --concurrency at a time (jobs.handlers.run_handler_async)
+
+Reports wall-clock jobs/s and jobs per CPU-second of the benchmark process. Database updates are
+left out so only the handler I/O is compared.
+
+Requires aiosmtpd (pip install aiosmtpd). Run from the project root:
+
+    python benchmarks/async_throughput.py --jobs 2000 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'job_system.settings')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+import django  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+
+
+class SlowSink:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        return '250 OK'
+
+
+def start_http_stub(port, latency):
+    """Minimal HTTP/1.1 server that answers every request with a small JSON body after `latency`."""
+    body = b'{"ok": true}'
+    response = (b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s'
+                % (len(body), body))
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                request = await reader.readuntil(b'\r\n\r\n')
+                if not request:
+                    break
+                await asyncio.sleep(latency)
+                writer.write(response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    async def serve():
+        server = await asyncio.start_server(handle, '127.0.0.1', port, backlog=1024)
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=loop.run_until_complete, args=(serve(),), daemon=True).start()
+    started.wait()
+
+
+def run(label, execute, count):
+    wall, cpu = time.perf_counter(), time.process_time()
+    execute(count)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(f'{label:<36} {count} jobs in {wall:6.2f}s  ->  {count / wall:8,.0f} jobs/s  '
+          f'{count / cpu:8,.0f} jobs per CPU-second')
+    return count / wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=float, default=50, help='stub server response delay')
+    parser.add_argument('--concurrency', type=int, default=200, help='coroutines in flight')
+    parser.add_argument('--smtp-port', type=int, default=8025)
+    parser.add_argument('--http-port', type=int, default=8026)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    controller = Controller(SlowSink(latency), hostname='127.0.0.1', port=args.smtp_port)
+    controller.start()
+    start_http_stub(args.http_port, latency)
+    django.setup()
+    from django.conf import settings
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    settings.EMAIL_HOST, settings.EMAIL_PORT = '127.0.0.1', args.smtp_port
+    settings.EMAIL_HOST_USER = settings.EMAIL_HOST_PASSWORD = ''
+    settings.EMAIL_USE_TLS = False
+    settings.EMAIL_ASYNC_MAX_CONNECTIONS = args.concurrency
+    settings.JOB_FETCH_ALLOW_PRIVATE_NETWORKS = True  # the stub HTTP server listens on localhost
+
+    from jobs.handlers import run_handler, run_handler_async
+    from jobs.mail import close_mail_connection
+
+    def params(job_type, i):
+        if job_type == 'send_email':
+            return {'recipient': f'user{i}@example.com', 'subject': 'Benchmark', 'body': 'Hello'}
+        return {'url': f'http://127.0.0.1:{args.http_port}/item/{i}'}
+
+    def one_at_a_time(job_type):
+        def execute(count):
+            for i in range(count):
+                run_handler(job_type, params(job_type, i))
+            close_mail_connection()
+        return execute
+
+    def coroutines(job_type):
+        async def execute_all(count):
+            slots = asyncio.Semaphore(args.concurrency)
+
+            async def one(i):
+                async with slots:
+                    await run_handler_async(job_type, params(job_type, i))
+            await asyncio.gather(*(one(i) for i in range(count)))
+        return lambda count: asyncio.run(execute_all(count))
+
+    try:
+        for job_type in ('send_email', 'fetch_data'):
+            # The one-at-a-time path is latency bound; a tenth of the jobs is enough to measure it.
+            before = run(f'{job_type} one at a time', one_at_a_time(job_type), max(1, args.jobs // 10))
+            after = run(f'{job_type} asyncio x{args.concurrency}', coroutines(job_type), args.jobs)
+            print(f'{job_type} speed-up per process: {after / before:.1f}x')
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
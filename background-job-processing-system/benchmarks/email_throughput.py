@@ -0,0 +1,71 @@
+"""
+Benchmark: messages per second for send_email jobs against a local stub SMTP server.
+
+Compares the old path (django.core.mail.send_mail, one SMTP session per email) with the
+pooled connection used by the workers (jobs.mail.send_messages, one session for the batch).
+
+Requires aiosmtpd (pip install aiosmtpd). Run from the project root:
+
+    python benchmarks/email_throughput.py --messages 500
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'job_system.settings')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+import django  # noqa: E402
+from aiosmtpd.controller import Controller  # noqa: E402
+from aiosmtpd.handlers import Sink  # noqa: E402
+
+
+def run(label, send, count):
+    start = time.perf_counter()
+    send(count)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {count} messages in {elapsed:.2f}s  ->  {count / elapsed:,.0f} msg/s')
+    return count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    controller = Controller(Sink(), hostname='127.0.0.1', port=args.port)
+    controller.start()
+    django.setup()
+    from django.conf import settings
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    settings.EMAIL_HOST, settings.EMAIL_PORT = '127.0.0.1', args.port
+    settings.EMAIL_HOST_USER = settings.EMAIL_HOST_PASSWORD = ''
+    settings.EMAIL_USE_TLS = False
+
+    from django.core.mail import send_mail
+    from jobs.mail import build_email_message, close_mail_connection, send_messages
+
+    def per_message_connection(count):
+        for i in range(count):
+            send_mail('Benchmark', 'Hello', 'bench@example.com', [f'user{i}@example.com'])
+
+    def pooled_connection(count):
+        messages = [build_email_message({'recipient': f'user{i}@example.com', 'subject': 'Benchmark', 'body': 'Hello'})
+                    for i in range(count)]
+        errors = send_messages(messages)
+        assert not any(errors), errors
+        close_mail_connection()
+
+    try:
+        before = run('send_mail (per message)', per_message_connection, args.messages)
+        after = run('pooled send_messages', pooled_connection, args.messages)
+        print(f'speed-up: {after / before:.1f}x')
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
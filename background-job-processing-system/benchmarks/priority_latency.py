@@ -0,0 +1,125 @@
+"""
+Benchmark: latency of high-priority jobs while a large low-priority backlog drains.
+
+Publishes a backlog of short low-priority tasks, starts real Celery workers against the
+configured Redis broker, then sends a high-priority probe task at a fixed interval and records
+how long each probe waited before a worker ran it. Compares the old behaviour (every task on one
+queue, no priority) with priority routing (jobs.<band> queues, broker priority, one worker per
+band sized by JOB_QUEUE_CONCURRENCY).
+
+Requires a running Redis (REDIS_URL). Run from the project root:
+
+    python benchmarks/priority_latency.py --backlog 100000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'job_system.settings')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+
+import django  # noqa: E402
+
+django.setup()
+
+from celery import Celery, group  # noqa: E402
+from django.conf import settings  # noqa: E402
+from jobs.priority import priority_band, queue_name, route_options  # noqa: E402
+from jobs.redis_utils import get_redis  # noqa: E402
+
+LATENCY_KEY = 'benchmark:priority:latency'
+
+app = Celery('priority_benchmark')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.conf.task_ignore_result = True
+
+
+@app.task(name='benchmark.backlog')
+def backlog_task(duration_ms):
+    time.sleep(duration_ms / 1000)
+
+
+@app.task(name='benchmark.probe')
+def probe_task(sent_at):
+    get_redis().rpush(LATENCY_KEY, time.time() - sent_at)
+
+
+def clear_queues():
+    redis = get_redis()
+    keys = list(redis.scan_iter('jobs.*')) + [LATENCY_KEY]
+    redis.delete(*keys)
+
+
+def start_worker(queue, concurrency, name):
+    command = [
+        sys.executable, '-m', 'celery', '-A', 'priority_latency', 'worker', '-Q', queue,
+        '-c', str(concurrency), '-P', 'threads', '-n', f'{name}@%h', '-l', 'warning',
+    ]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=subprocess.DEVNULL)
+
+
+def run(label, backlog_options, probe_options, workers, args):
+    clear_queues()
+    start = time.perf_counter()
+    for offset in range(0, args.backlog, 1000):
+        count = min(1000, args.backlog - offset)
+        group(backlog_task.si(args.task_ms).set(**backlog_options) for _ in range(count)).apply_async()
+    print(f'{label}: published {args.backlog:,} low-priority tasks in {time.perf_counter() - start:.1f}s')
+
+    processes = [start_worker(queue, concurrency, name) for name, queue, concurrency in workers]
+    try:
+        time.sleep(args.warmup)
+        for _ in range(args.probes):
+            probe_task.apply_async(args=[time.time()], **probe_options)
+            time.sleep(args.interval)
+        deadline = time.time() + args.timeout
+        redis = get_redis()
+        while redis.llen(LATENCY_KEY) < args.probes and time.time() < deadline:
+            time.sleep(0.2)
+        latencies = sorted(float(value) * 1000 for value in redis.lrange(LATENCY_KEY, 0, -1))
+        remaining = sum(redis.llen(key) for key in redis.scan_iter('jobs.*'))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        clear_queues()
+
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f'{label}: {len(latencies)}/{args.probes} probes ran  '
+              f'p50 {statistics.median(latencies):,.0f} ms  p95 {p95:,.0f} ms  max {latencies[-1]:,.0f} ms  '
+              f'({remaining:,} backlog messages still queued)')
+    else:
+        print(f'{label}: 0/{args.probes} probes ran within {args.timeout}s ({remaining:,} messages still queued)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--backlog', type=int, default=100_000, help='low-priority tasks queued up front')
+    parser.add_argument('--task-ms', type=float, default=2, help='duration of each backlog task')
+    parser.add_argument('--probes', type=int, default=20, help='high-priority probes sent while draining')
+    parser.add_argument('--interval', type=float, default=0.25, help='seconds between probes')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds to let the workers start')
+    parser.add_argument('--timeout', type=float, default=30, help='seconds to wait for probes afterwards')
+    args = parser.parse_args()
+
+    concurrency = settings.JOB_QUEUE_CONCURRENCY
+    high, low = priority_band(10), priority_band(1)
+    total = concurrency.get(high, 1) + concurrency.get(low, 1)
+    # Before: delay() with no routing, so probes queue behind the whole backlog on one queue.
+    run('single queue', {'queue': 'jobs.default'}, {'queue': 'jobs.default'},
+        [('single', 'jobs.default', total)], args)
+    # After: same total concurrency, split into one worker per band.
+    run('priority routing', route_options(1), route_options(10),
+        [(high, queue_name(high), concurrency.get(high, 1)), (low, queue_name(low), concurrency.get(low, 1))], args)
+
+
+if __name__ == '__main__':
+    main()
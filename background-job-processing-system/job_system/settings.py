@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
+from kombu import Queue
 
 # Load environment variables from .env file
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -149,8 +150,11 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Redis (Celery broker, Channels layer and the jobs app's own keys)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
 # Celery Configuration
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -162,6 +166,139 @@ CELERY_RESULT_BACKEND = 'django-db'
 # CELERY BEAT
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 
+# Priority routing: job tasks go to the jobs.<band> queue of their priority band (band: lowest
+# Job.priority routed to it) and carry a broker priority within it. A worker started without -Q
+# consumes every band; `manage.py run_priority_workers` starts one worker per band instead, with
+# the concurrency below, so a low-priority backlog never occupies the high band's processes.
+JOB_PRIORITY_BANDS = {
+    band: int(minimum) for band, minimum in
+    (item.split(':') for item in os.getenv('JOB_PRIORITY_BANDS', 'high:8,default:4,low:1').split(','))
+}
+JOB_QUEUE_CONCURRENCY = {
+    band: int(concurrency) for band, concurrency in
+    (item.split(':') for item in os.getenv('JOB_QUEUE_CONCURRENCY', 'high:4,default:4,low:2').split(','))
+}
+CELERY_TASK_DEFAULT_QUEUE = 'jobs.default'
+CELERY_TASK_QUEUES = [Queue(name, routing_key=name) for name in dict.fromkeys([f'jobs.{band}' for band in JOB_PRIORITY_BANDS] + [CELERY_TASK_DEFAULT_QUEUE])]
+# Redis orders messages within a queue by priority 0 (first) .. 9 (last), and a worker consuming
+# several queues polls them in the order above (high band first).
+CELERY_BROKER_TRANSPORT_OPTIONS = {'priority_steps': list(range(10)), 'sep': ':', 'queue_order_strategy': 'priority'}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+# Prefetch one message at a time so a worker never sits on low-priority messages while
+# higher-priority ones arrive.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+
+# Job statistics: serve /api/jobs/stats/ from the incrementally maintained JobStatusCounter table
+# instead of a GROUP BY over all jobs. Run `manage.py reconcile_job_counters` after enabling.
+JOB_STATS_USE_COUNTERS = os.getenv('JOB_STATS_USE_COUNTERS', 'False') == 'True'
+
+
+# Bulk job creation: rows per INSERT and messages per Celery group publish.
+JOB_BULK_CREATE_BATCH_SIZE = int(os.getenv('JOB_BULK_CREATE_BATCH_SIZE', 1000))
+JOB_DISPATCH_BATCH_SIZE = int(os.getenv('JOB_DISPATCH_BATCH_SIZE', 500))
+
+# Transactional outbox: tasks for new jobs are stored with the jobs and published after commit by
+# the web process, or by `manage.py run_outbox_relay` (polling every JOB_OUTBOX_POLL_SECONDS) when
+# that fails or JOB_OUTBOX_PUBLISH_ON_COMMIT is False.
+JOB_OUTBOX_PUBLISH_ON_COMMIT = os.getenv('JOB_OUTBOX_PUBLISH_ON_COMMIT', 'True') == 'True'
+JOB_OUTBOX_POLL_SECONDS = float(os.getenv('JOB_OUTBOX_POLL_SECONDS', 0.5))
+
+# Job batches send at most one WebSocket progress event per this many milliseconds (plus the final one).
+JOB_BATCH_PROGRESS_INTERVAL_MS = int(os.getenv('JOB_BATCH_PROGRESS_INTERVAL_MS', 1000))
+
+# Handler progress reports (jobs/progress.py) are written to Redis and streamed at most once per
+# JOB_PROGRESS_INTERVAL_MS per job, and kept for JOB_PROGRESS_TTL seconds.
+JOB_PROGRESS_INTERVAL_MS = int(os.getenv('JOB_PROGRESS_INTERVAL_MS', 500))
+JOB_PROGRESS_TTL = int(os.getenv('JOB_PROGRESS_TTL', 3600))
+
+# Interval jobs are run by `manage.py run_scheduler` ('scheduler'), which claims up to
+# JOB_SCHEDULER_BATCH_SIZE due jobs per transaction and checks at least every JOB_SCHEDULER_POLL_SECONDS.
+# 'beat' creates one django-celery-beat PeriodicTask per job instead (the previous behavior).
+JOB_RECURRING_SCHEDULER = os.getenv('JOB_RECURRING_SCHEDULER', 'scheduler')
+JOB_SCHEDULER_BATCH_SIZE = int(os.getenv('JOB_SCHEDULER_BATCH_SIZE', 500))
+JOB_SCHEDULER_POLL_SECONDS = float(os.getenv('JOB_SCHEDULER_POLL_SECONDS', 1.0))
+
+# Missed runs of interval jobs (Job.misfire_policy): 'skip' still runs a job whose latest run is at most
+# JOB_MISFIRE_GRACE_SECONDS late; 'run_all' replays up to JOB_MISFIRE_MAX_RUNS missed runs (unless the
+# job sets misfire_max_runs), one at a time and at least JOB_MISFIRE_CATCHUP_SECONDS apart.
+JOB_MISFIRE_GRACE_SECONDS = int(os.getenv('JOB_MISFIRE_GRACE_SECONDS', 60))
+JOB_MISFIRE_MAX_RUNS = int(os.getenv('JOB_MISFIRE_MAX_RUNS', 10))
+JOB_MISFIRE_CATCHUP_SECONDS = int(os.getenv('JOB_MISFIRE_CATCHUP_SECONDS', 60))
+
+# A running job's lease (jobs/lease.py) is renewed every JOB_LEASE_SECONDS / 3 while its handler runs;
+# a job whose lease has expired (its worker died) can be claimed again by a redelivered or requeued message.
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 600))
+
+# fetch_data (jobs/http_client.py) only connects to public addresses and reads at most JOB_FETCH_MAX_BYTES
+# per response; JOB_FETCH_ALLOW_PRIVATE_NETWORKS=True also allows private and loopback hosts.
+JOB_FETCH_MAX_BYTES = int(os.getenv('JOB_FETCH_MAX_BYTES', 1024 * 1024))
+JOB_FETCH_ALLOW_PRIVATE_NETWORKS = os.getenv('JOB_FETCH_ALLOW_PRIVATE_NETWORKS', 'False') == 'True'
+
+# Version tokens (jobs/cancellation.py) let workers drop messages for deleted or rescheduled jobs
+# without a database query; keep them at least as long as a message can wait in the broker.
+JOB_VERSION_TOKEN_TTL = int(os.getenv('JOB_VERSION_TOKEN_TTL', 7 * 86400))
+
+# Retention (jobs/retention.py): `manage.py archive_jobs` moves jobs of each status in JOB_RETENTION_DAYS
+# ("status:days,...") finished longer ago than that into .jsonl.gz files under JOB_ARCHIVE_DIR,
+# JOB_ARCHIVE_BATCH_SIZE per transaction, and deletes Celery TaskResult rows older than
+# JOB_TASK_RESULT_RETENTION_DAYS (0 keeps them). `manage.py restore_jobs <file>` loads an archive back.
+JOB_RETENTION_DAYS = {
+    status: int(days) for status, days in
+    (item.split(':') for item in os.getenv('JOB_RETENTION_DAYS', 'completed:30,failed:90').split(',') if item)
+}
+JOB_TASK_RESULT_RETENTION_DAYS = int(os.getenv('JOB_TASK_RESULT_RETENTION_DAYS', 7))
+JOB_ARCHIVE_DIR = os.getenv('JOB_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+JOB_ARCHIVE_BATCH_SIZE = int(os.getenv('JOB_ARCHIVE_BATCH_SIZE', 1000))
+
+# backup_database jobs write gzipped dumpdata files here.
+JOB_BACKUP_DIR = os.getenv('JOB_BACKUP_DIR', os.path.join(BASE_DIR, 'backups'))
+
+# Per-job-type limits enforced across all workers through Redis, e.g. "send_email:10,upload_file:4"
+# for concurrency and "send_email:100/m" for rates (s, m or h). Jobs over a limit are re-queued after
+# the time until the next token (or JOB_LIMIT_DEFER_SECONDS when waiting on a slot), without
+# holding a worker process or using a retry. A slot held by a crashed worker expires after
+# JOB_LIMIT_LEASE_SECONDS.
+JOB_TYPE_CONCURRENCY_LIMITS = {
+    job_type: int(limit) for job_type, limit in
+    (item.split(':') for item in os.getenv('JOB_TYPE_CONCURRENCY_LIMITS', '').split(',') if item)
+}
+JOB_TYPE_RATE_LIMITS = dict(
+    item.split(':') for item in os.getenv('JOB_TYPE_RATE_LIMITS', '').split(',') if item
+)
+JOB_LIMIT_DEFER_SECONDS = float(os.getenv('JOB_LIMIT_DEFER_SECONDS', 1))
+JOB_LIMIT_LEASE_SECONDS = int(os.getenv('JOB_LIMIT_LEASE_SECONDS', 600))
+
+# Idempotent job creation: repeats of a create request with the same Idempotency-Key header within
+# JOB_IDEMPOTENCY_TTL seconds return the original response. JOB_DEDUPE_CONTENT_TTL > 0 also
+# deduplicates identical JSON request bodies without the header for that many seconds. A key is
+# locked for at most JOB_IDEMPOTENCY_LOCK_SECONDS while its first request runs.
+JOB_IDEMPOTENCY_TTL = int(os.getenv('JOB_IDEMPOTENCY_TTL', 86400))
+JOB_IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('JOB_IDEMPOTENCY_LOCK_SECONDS', 60))
+JOB_DEDUPE_CONTENT_TTL = int(os.getenv('JOB_DEDUPE_CONTENT_TTL', 0))
+
+# Retries of failed jobs (up to Job.max_retries) wait a random 0..min(cap, base * 2 ** (n - 1))
+# seconds before retry n. JOB_TYPE_RETRY_BACKOFF overrides base/cap per type, e.g. "fetch_data:5/600"
+# ("fetch_data:5" overrides only the base).
+# Jobs out of retries land in the dead-letter table; requeue them with `manage.py requeue_dead_jobs`.
+JOB_RETRY_BASE_DELAY = float(os.getenv('JOB_RETRY_BASE_DELAY', 2))
+JOB_RETRY_MAX_DELAY = float(os.getenv('JOB_RETRY_MAX_DELAY', 300))
+JOB_TYPE_RETRY_BACKOFF = {
+    job_type: tuple(float(value) for value in backoff.split('/')) for job_type, backoff in
+    (item.split(':') for item in os.getenv('JOB_TYPE_RETRY_BACKOFF', '').split(',') if item)
+}
+
+# I/O-bound job types listed here (e.g. "send_email,fetch_data,upload_file") are routed to the
+# jobs.async queue and run as coroutines by `manage.py run_async_worker`, up to
+# JOB_ASYNC_CONCURRENCY at once per process. Email there shares EMAIL_ASYNC_MAX_CONNECTIONS
+# aiosmtplib connections.
+JOB_ASYNC_JOB_TYPES = [job_type for job_type in os.getenv('JOB_ASYNC_JOB_TYPES', '').split(',') if job_type]
+JOB_ASYNC_CONCURRENCY = int(os.getenv('JOB_ASYNC_CONCURRENCY', 200))
+EMAIL_ASYNC_MAX_CONNECTIONS = int(os.getenv('EMAIL_ASYNC_MAX_CONNECTIONS', 10))
+
+# Process pool size for CPU-bound job handlers (unset: one process per CPU).
+JOB_CPU_WORKERS = int(os.getenv('JOB_CPU_WORKERS')) if os.getenv('JOB_CPU_WORKERS') else None
+
 
 # Django REST Framework settings (optional, can be extended)
 REST_FRAMEWORK = {
@@ -176,6 +313,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 5,
 }
 
+# Upper bound for the client-selectable ?page_size= on the job list.
+JOB_LIST_MAX_PAGE_SIZE = int(os.getenv('JOB_LIST_MAX_PAGE_SIZE', 100))
+
 # Email settings (update with your SMTP server details)
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -184,23 +324,48 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', 'your_email@gmail.com')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', 'your_password')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True') == 'True'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Pooled SMTP connections are reopened after this many idle seconds.
+EMAIL_CONNECTION_MAX_IDLE = int(os.getenv('EMAIL_CONNECTION_MAX_IDLE', 60))
+# Bulk email jobs are sent in batches of this size over one connection (1 disables batching).
+JOB_EMAIL_BATCH_SIZE = int(os.getenv('JOB_EMAIL_BATCH_SIZE', 100))
 
 # AWS S3 settings
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
 AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
+# Optional S3-compatible endpoint (e.g. MinIO or a local moto server).
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL') or None
+AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv('AWS_S3_MAX_POOL_CONNECTIONS', 50))
+# Files above the threshold are uploaded as multipart, MAX_CONCURRENCY parts at a time.
+AWS_S3_MULTIPART_THRESHOLD = int(os.getenv('AWS_S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+AWS_S3_MULTIPART_CHUNKSIZE = int(os.getenv('AWS_S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+AWS_S3_MAX_CONCURRENCY = int(os.getenv('AWS_S3_MAX_CONCURRENCY', 10))
+# 'local' spools uploads to media/uploads/ for the worker; 'direct' streams them to the bucket
+# while the web node reads the request (jobs/uploads.py) so the job only carries the object key.
+JOB_UPLOAD_STORAGE = os.getenv('JOB_UPLOAD_STORAGE', 'local')
+# Largest file accepted by the upload endpoints, in bytes.
+JOB_UPLOAD_MAX_SIZE = int(os.getenv('JOB_UPLOAD_MAX_SIZE', 10 * 1024 * 1024))
 
 # Channels layer (in-memory for dev)
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            'hosts': [os.getenv('REDIS_URL', 'redis://localhost:6379/0')],
+            'hosts': [REDIS_URL],
         },
     },
 }
 
+# Job status updates are coalesced per job for this window and sent as one batched message.
+JOB_STATUS_BROADCAST_WINDOW_MS = int(os.getenv('JOB_STATUS_BROADCAST_WINDOW_MS', 100))
+JOB_STATUS_BROADCAST_MAX_BATCH = int(os.getenv('JOB_STATUS_BROADCAST_MAX_BATCH', 500))
+# Topic groups are only published to when a client is subscribed; the subscriber counts kept in
+# Redis are re-read at most this often. Each web process renews its counts every third of the
+# lease, and the counts of a process that stopped are dropped once the lease runs out.
+JOB_STATUS_INTEREST_TTL_MS = int(os.getenv('JOB_STATUS_INTEREST_TTL_MS', 1000))
+JOB_STATUS_INTEREST_LEASE_SECONDS = int(os.getenv('JOB_STATUS_INTEREST_LEASE_SECONDS', 60))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -0,0 +1,178 @@
+"""
+asyncio worker for I/O-bound job types.
+
+A Celery prefork process runs one job at a time, so a job waiting on SMTP, S3 or HTTP holds a
+whole process. This worker consumes the jobs.async queue (job types in JOB_ASYNC_JOB_TYPES) and
+runs each job as a coroutine, so one process keeps hundreds of jobs in flight.
+
+The messages are ordinary execute_job_task messages. A broker consumer thread receives them and
+hands them to the event loop. The loop runs up to `concurrency` jobs at once, honoring eta and
+countdown, and acks each message when its job starts, as Celery does by default.
+"""
+import asyncio
+import queue
+import signal
+import socket
+import threading
+from datetime import datetime, timezone as dt_timezone
+from typing import Iterable, Optional, Set
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from kombu import Consumer, Queue
+from . import limits
+from .broadcast import broadcast_job_status
+from .cancellation import is_dropped, version_kwargs
+from .handlers import JobFailed, run_handler_async
+from .lease import Heartbeat
+from .models import Job
+from .priority import ASYNC_QUEUE, route_options
+from .tasks import claim_job, defer_job, execute_job_task, record_error, record_failure, record_success
+
+
+async def execute_job(job_id, retries: int = 0, version: int = 0) -> None:
+    """Coroutine counterpart of execute_job_task: same limits, state transitions and retries."""
+    if await asyncio.to_thread(is_dropped, job_id, version):
+        return
+    job = await Job.objects.filter(id=job_id).afirst()
+    if job is None:
+        await asyncio.to_thread(broadcast_job_status, job_id, 'deleted', {'error': 'Job was deleted before execution.'})
+        return
+    if job.version != version:
+        return
+    holder = f'job:{job.id}'
+    grant = await asyncio.to_thread(limits.acquire, job.job_type, holder)
+    if not grant.granted:
+        await asyncio.to_thread(defer_job, job, grant, retries)
+        return
+    try:
+        if not await sync_to_async(claim_job)(job):
+            return
+        try:
+            with Heartbeat(job.id):
+                result = await run_handler_async(job.job_type, job.parameters, job.id)
+        except JobFailed as failure:
+            await sync_to_async(record_failure)(job, failure)
+            return
+        except Exception as exc:
+            countdown = await sync_to_async(record_error)(job, exc)
+            if countdown is not None:
+                await asyncio.to_thread(
+                    execute_job_task.apply_async, args=[job.id], kwargs=version_kwargs(job), countdown=countdown, retries=retries + 1,
+                    **route_options(job.priority, job.job_type)
+                )
+            return
+        await sync_to_async(record_success)(job, result)
+    finally:
+        await asyncio.to_thread(limits.release, job.job_type, holder)
+
+
+def eta_delay(eta: Optional[str]) -> float:
+    if not eta:
+        return 0.0
+    moment = datetime.fromisoformat(eta)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return max(0.0, (moment - datetime.now(dt_timezone.utc)).total_seconds())
+
+
+class AsyncJobWorker:
+    """Consume job messages on a broker thread and run them as coroutines on one event loop."""
+
+    def __init__(self, queues: Iterable[str] = (ASYNC_QUEUE,), concurrency: int = 200):
+        self.queues = list(queues)
+        self.concurrency = concurrency
+        self.acks: 'queue.Queue' = queue.Queue()
+        self.stopping = threading.Event()
+        self.ready = threading.Event()
+        self.waiting: Set[asyncio.Task] = set()
+        self.running: Set[asyncio.Task] = set()
+
+    def run(self) -> None:
+        asyncio.run(self.main())
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    async def main(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self.stop)
+            except (ValueError, RuntimeError):
+                pass  # not the main thread (e.g. tests); call stop() instead
+        consumer = threading.Thread(target=self.consume, name='async-worker-consumer', daemon=True)
+        consumer.start()
+        ticks = 0
+        while not self.stopping.is_set():
+            await asyncio.sleep(0.1)
+            ticks += 1
+            if ticks % 600 == 0:
+                # What Celery does around each task: drop connections past CONN_MAX_AGE or broken.
+                await sync_to_async(close_old_connections)()
+        # Jobs not started yet were never acked; the broker redelivers them.
+        for task in list(self.waiting):
+            task.cancel()
+        if self.running:
+            await asyncio.gather(*self.running, return_exceptions=True)
+        await asyncio.to_thread(consumer.join)
+
+    def consume(self) -> None:
+        """Broker thread: owns the connection, receives messages and performs acks."""
+        with execute_job_task.app.connection_for_read() as connection:
+            queues = [Queue(name, routing_key=name) for name in self.queues]
+            with Consumer(connection, queues=queues, callbacks=[self.on_message], accept=['json']) as consumer:
+                self.consumer, self.prefetch = consumer, self.concurrency
+                consumer.qos(prefetch_count=self.prefetch)
+                self.ready.set()
+                while not self.stopping.is_set():
+                    self.flush_acks()
+                    try:
+                        connection.drain_events(timeout=0.1)
+                    except socket.timeout:
+                        pass
+                self.flush_acks()
+
+    def on_message(self, body, message) -> None:
+        if message.headers.get('task') != execute_job_task.name:
+            print(f"[✗] Async worker only runs {execute_job_task.name}; dropping {message.headers.get('task')}")
+            message.reject()
+            return
+        delay = eta_delay(message.headers.get('eta'))
+        if delay:
+            # Waiting messages must not use up the prefetch window of jobs that can run now.
+            self.prefetch += 1
+            self.consumer.qos(prefetch_count=self.prefetch)
+        self.loop.call_soon_threadsafe(self.schedule, body, message, delay)
+
+    def flush_acks(self) -> None:
+        while True:
+            try:
+                message, delayed = self.acks.get_nowait()
+            except queue.Empty:
+                return
+            message.ack()
+            if delayed:
+                self.prefetch -= 1
+                self.consumer.qos(prefetch_count=self.prefetch)
+
+    def schedule(self, body, message, delay: float) -> None:
+        task = self.loop.create_task(self.run_message(body, message, delay))
+        self.waiting.add(task)
+        task.add_done_callback(self.waiting.discard)
+
+    async def run_message(self, body, message, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        async with self.slots:
+            task = asyncio.current_task()
+            self.waiting.discard(task)
+            self.running.add(task)
+            self.acks.put((message, bool(delay)))
+            try:
+                args, kwargs, _ = body
+                await execute_job(*args, retries=message.headers.get('retries') or 0, **kwargs)
+            except Exception as exc:
+                print(f"[✗] Async job {body[0]} crashed: {exc}")
+            finally:
+                self.running.discard(task)
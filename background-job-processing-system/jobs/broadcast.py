@@ -0,0 +1,293 @@
+"""
+Coalesced WebSocket broadcasting of job status updates.
+
+Workers publish every status change here instead of calling group_send directly. Updates are
+buffered per job (the latest one wins) and flushed as a single batched channel-layer message
+every JOB_STATUS_BROADCAST_WINDOW_MS, or as soon as JOB_STATUS_BROADCAST_MAX_BATCH jobs are
+pending. Consumers forward each batch to the browser as one JSON array frame.
+
+Each update is published to the global group (clients without filters) and to per-topic groups
+for its job id, job type and status. Topic groups nobody listens to are skipped, keeping fan-out
+proportional to interested clients: each web process counts its own subscribers per group and
+keeps them in a Redis hash of its own, renewed by a heartbeat and expiring
+JOB_STATUS_INTEREST_LEASE_SECONDS after its process stops, so counts of a process that died
+without its clients disconnecting cleanly disappear instead of drifting.
+
+Job batches publish a single progress event to their own group at most once per
+JOB_BATCH_PROGRESS_INTERVAL_MS (and always when they finish), however many children complete.
+"""
+import asyncio
+import atexit
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+from asgiref.sync import async_to_sync
+from redis.exceptions import RedisError
+from celery.signals import worker_process_shutdown
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .redis_utils import get_redis
+
+JOB_STATUS_GROUP = 'job_status'
+# Sorted set of the per-process interest hashes, scored by when each expires.
+INTEREST_KEY = 'job_status:interest:instances'
+
+
+def job_group(job_id) -> str:
+    return f'{JOB_STATUS_GROUP}.job.{job_id}'
+
+
+def job_type_group(job_type: str) -> str:
+    return f'{JOB_STATUS_GROUP}.type.{job_type}'
+
+
+def status_group(status: str) -> str:
+    return f'{JOB_STATUS_GROUP}.status.{status}'
+
+
+def batch_group(batch_id) -> str:
+    return f'{JOB_STATUS_GROUP}.batch.{batch_id}'
+
+
+def groups_for(update: Dict[str, Any]) -> List[str]:
+    """Every group an update is relevant to."""
+    groups = [JOB_STATUS_GROUP, job_group(update['id'])]
+    if update.get('job_type'):
+        groups.append(job_type_group(update['job_type']))
+    if update.get('status'):
+        groups.append(status_group(update['status']))
+    return groups
+
+
+class GroupInterest:
+    """Cached view of how many WebSocket clients are subscribed to each group."""
+
+    def __init__(self):
+        self._snapshot = None
+        self._fetched_at = 0.0
+
+    def snapshot(self) -> Optional[Dict[str, int]]:
+        """Subscriber count per group, or None when unknown (then every group is published to)."""
+        ttl = getattr(settings, 'JOB_STATUS_INTEREST_TTL_MS', 1000) / 1000
+        if time.monotonic() - self._fetched_at >= ttl:
+            try:
+                redis = get_redis()
+                instances = redis.zrangebyscore(INTEREST_KEY, time.time(), '+inf')
+                with redis.pipeline(transaction=False) as pipe:
+                    for instance in instances:
+                        pipe.hgetall(instance)
+                    counts = Counter()
+                    for raw in pipe.execute():
+                        counts.update({key.decode(): int(value) for key, value in raw.items()})
+                self._snapshot = dict(counts)
+            except RedisError:
+                self._snapshot = None
+            self._fetched_at = time.monotonic()
+        return self._snapshot
+
+
+class LocalInterest:
+    """This process's subscriber count per group, mirrored to a Redis hash that expires unless renewed."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.counts: Counter = Counter()
+        self.key = f'job_status:interest:{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}'
+        self._thread = None
+
+    @property
+    def lease(self) -> int:
+        return getattr(settings, 'JOB_STATUS_INTEREST_LEASE_SECONDS', 60)
+
+    def register(self, groups: Iterable[str], delta: int) -> None:
+        if self._pid != os.getpid():
+            self._reset()
+        # Held while writing too, so a heartbeat cannot overwrite a newer count with an older one.
+        with self._lock:
+            changed = {}
+            for group in groups:
+                self.counts[group] += delta
+                changed[group] = max(self.counts[group], 0)
+                if changed[group] == 0:
+                    del self.counts[group]
+            try:
+                with get_redis().pipeline(transaction=False) as pipe:
+                    for group, count in changed.items():
+                        if count:
+                            pipe.hset(self.key, group, count)
+                        else:
+                            pipe.hdel(self.key, group)
+                    self._renew(pipe)
+                    pipe.execute()
+            except RedisError as exc:
+                print(f"[✗] Could not record WebSocket subscription: {exc}")
+        self._ensure_heartbeat()
+
+    def _renew(self, pipe) -> None:
+        pipe.expire(self.key, self.lease)
+        pipe.zadd(INTEREST_KEY, {self.key: time.time() + self.lease})
+
+    def heartbeat(self) -> None:
+        """Rewrite this process's counts and extend their expiry; drop processes that stopped renewing."""
+        with self._lock, get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(self.key)
+            if self.counts:
+                pipe.hset(self.key, mapping=dict(self.counts))
+                self._renew(pipe)
+            else:
+                pipe.zrem(INTEREST_KEY, self.key)
+            pipe.zremrangebyscore(INTEREST_KEY, '-inf', time.time())
+            pipe.execute()
+
+    def _ensure_heartbeat(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='job-status-interest', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(max(self.lease / 3, 0.01))
+            try:
+                self.heartbeat()
+            except RedisError as exc:
+                print(f"[✗] Could not renew WebSocket subscriptions: {exc}")
+
+    def clear(self) -> None:
+        """Withdraw this process's counts (at exit)."""
+        if self._pid != os.getpid() or not self.counts:
+            return
+        try:
+            with get_redis().pipeline(transaction=False) as pipe:
+                pipe.delete(self.key)
+                pipe.zrem(INTEREST_KEY, self.key)
+                pipe.execute()
+        except RedisError:
+            pass
+
+
+def register_interest(groups: Iterable[str], delta: int) -> None:
+    """Adjust this process's subscriber counts of groups as clients join (+1) or leave (-1)."""
+    local_interest.register(groups, delta)
+
+
+class JobStatusBroadcaster:
+    """Buffers status updates per job and publishes them in batches from a background thread."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+        self._thread = None
+
+    @property
+    def window(self) -> float:
+        return getattr(settings, 'JOB_STATUS_BROADCAST_WINDOW_MS', 100) / 1000
+
+    @property
+    def max_batch(self) -> int:
+        return getattr(settings, 'JOB_STATUS_BROADCAST_MAX_BATCH', 500)
+
+    def publish(self, data: Dict[str, Any]) -> None:
+        """Queue an update; a newer update for the same job replaces the pending one."""
+        if self._pid != os.getpid():
+            # Forked worker child: the parent's lock and flusher thread do not carry over.
+            self._reset()
+        with self._lock:
+            self._pending.pop(data['id'], None)
+            self._pending[data['id']] = data
+            full = len(self._pending) >= self.max_batch
+        if full or self.window <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def flush(self) -> None:
+        with self._lock:
+            batch: List[Dict[str, Any]] = list(self._pending.values())
+            self._pending.clear()
+        if batch:
+            send_batch(batch)
+
+    def _ensure_flusher(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='job-status-broadcaster', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(max(self.window, 0.01))
+            try:
+                self.flush()
+            except Exception as exc:
+                print(f"[✗] Job status broadcast failed: {exc}")
+
+
+def send_batch(batch: List[Dict[str, Any]]) -> None:
+    """Publish one batched message per interested group, concurrently over the channel layer."""
+    messages = defaultdict(list)
+    for update in batch:
+        for group in groups_for(update):
+            messages[group].append(update)
+    interest = group_interest.snapshot()
+    layer = get_channel_layer()
+
+    async def send_all():
+        await asyncio.gather(*(
+            layer.group_send(group, {'type': 'job_status_batch', 'data': updates})
+            for group, updates in messages.items()
+            if interest is None or interest.get(group, 0) > 0
+        ))
+
+    async_to_sync(send_all)()
+
+
+group_interest = GroupInterest()
+local_interest = LocalInterest()
+broadcaster = JobStatusBroadcaster()
+
+
+def broadcast_job_status(job_id, status: str, result: Any = None, job_type: str = None) -> None:
+    broadcaster.publish({'id': job_id, 'job_type': job_type, 'status': status, 'result': result})
+
+
+def batch_progress_due(batch_id) -> bool:
+    """Claim the batch's next progress tick; across all workers one claim succeeds per interval."""
+    interval = getattr(settings, 'JOB_BATCH_PROGRESS_INTERVAL_MS', 1000)
+    try:
+        return bool(get_redis().set(f'jobs:batch:{batch_id}:tick', 1, nx=True, px=max(interval, 1)))
+    except RedisError:
+        return True
+
+
+def broadcast_batch_progress(progress: Dict[str, Any]) -> None:
+    """Send one progress event to the batch's subscribers (skipped when it has none)."""
+    group = batch_group(progress['batch_id'])
+    interest = group_interest.snapshot()
+    if interest is not None and interest.get(group, 0) <= 0:
+        return
+    async_to_sync(get_channel_layer().group_send)(group, {'type': 'job_batch_progress', 'data': progress})
+
+
+def broadcast_notification(notification: Dict[str, Any]) -> None:
+    """Send a notification to the clients of the catch-all stream (not to topic-only subscribers)."""
+    async_to_sync(get_channel_layer().group_send)(JOB_STATUS_GROUP, {'type': 'job_notification', 'data': notification})
+
+
+def flush_broadcasts(**kwargs) -> None:
+    broadcaster.flush()
+
+
+worker_process_shutdown.connect(flush_broadcasts)
+atexit.register(flush_broadcasts)
+atexit.register(local_interest.clear)
@@ -0,0 +1,84 @@
+"""
+Cheap cancellation and rescheduling of jobs whose tasks are already in the broker.
+
+A message published for a job cannot be taken back, so deleting or rescheduling the job used to
+leave it to fire anyway. Instead, every job has a version (Job.version), and messages for a job
+carry the version they were published for (as the task's `version` kwarg, left out while it is 0).
+Rescheduling or retrying a job bumps its version; deleting it cancels it. Either way the new state
+is mirrored to a Redis token (jobs:version:<id>, "cancelled" or the current version) once the
+transaction commits, and kept for JOB_VERSION_TOKEN_TTL seconds.
+
+Workers check the token before loading the job, so stale and cancelled messages are dropped with
+one Redis GET and no database query or WebSocket broadcast. The version on the row is checked as
+well once the job is loaded, which covers the moment between the commit and the token write and
+Redis being unavailable.
+"""
+from typing import Dict, Iterable, List
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from redis.exceptions import RedisError
+from .models import Job
+from .redis_utils import get_redis
+
+CANCELLED = b'cancelled'
+
+
+def token_key(job_id) -> str:
+    return f'jobs:version:{job_id}'
+
+
+def version_kwargs(job: Job) -> Dict[str, int]:
+    """Task kwargs identifying the version a message is published for."""
+    return {'version': job.version} if job.version else {}
+
+
+def bump_version(job: Job) -> int:
+    """Invalidate every message published for job so far; new messages carry the new version."""
+    Job.objects.filter(id=job.id).update(version=F('version') + 1)
+    job.version = Job.objects.filter(id=job.id).values_list('version', flat=True).get()
+    transaction.on_commit(lambda: write_tokens({job.id: job.version}))
+    return job.version
+
+
+def cancel(job_ids: Iterable[int]) -> None:
+    """Drop every message published for these jobs (call it in the transaction deleting them)."""
+    tokens = {job_id: CANCELLED for job_id in job_ids}
+    transaction.on_commit(lambda: write_tokens(tokens))
+
+
+def write_tokens(tokens: Dict[int, object]) -> None:
+    ttl = getattr(settings, 'JOB_VERSION_TOKEN_TTL', 7 * 86400)
+    try:
+        with get_redis().pipeline(transaction=False) as pipe:
+            for job_id, token in tokens.items():
+                pipe.set(token_key(job_id), token, ex=ttl)
+            pipe.execute()
+    except RedisError as exc:
+        # Workers still compare the version on the row; only the fast path is lost.
+        print(f"[✗] Could not store version tokens for jobs {sorted(tokens)}: {exc}")
+
+
+def is_stale(token, version: int) -> bool:
+    if token is None:
+        return False
+    return token == CANCELLED or int(token) > version
+
+
+def is_dropped(job_id, version: int = 0) -> bool:
+    """True when the message for (job_id, version) has been cancelled or superseded."""
+    try:
+        return is_stale(get_redis().get(token_key(job_id)), version)
+    except RedisError:
+        return False
+
+
+def live_job_ids(job_ids: List[int]) -> List[int]:
+    """The job ids among job_ids that have not been cancelled (one MGET for the lot)."""
+    if not job_ids:
+        return []
+    try:
+        tokens = get_redis().mget([token_key(job_id) for job_id in job_ids])
+    except RedisError:
+        return list(job_ids)
+    return [job_id for job_id, token in zip(job_ids, tokens) if token != CANCELLED]
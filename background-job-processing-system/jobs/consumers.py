@@ -1,17 +1,122 @@
 import json
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .broadcast import JOB_STATUS_GROUP, batch_group, job_group, job_type_group, status_group, register_interest
+from .models import JOB_TYPE_CHOICES, JOB_STATUS_PENDING, JOB_STATUS_RUNNING, JOB_STATUS_COMPLETED, JOB_STATUS_FAILED
+
+JOB_TYPES = {key for key, _ in JOB_TYPE_CHOICES}
+JOB_STATUSES = {JOB_STATUS_PENDING, JOB_STATUS_RUNNING, JOB_STATUS_COMPLETED, JOB_STATUS_FAILED, 'deleted'}
+
+
+def topic_groups(job_ids=(), job_types=(), statuses=(), batch_ids=()):
+    """Validate subscription filters and return the matching group names."""
+    groups = set()
+    for batch_id in batch_ids:
+        if not str(batch_id).isdigit():
+            raise ValueError(f'Invalid batch_id: {batch_id}')
+        groups.add(batch_group(int(batch_id)))
+    for job_id in job_ids:
+        if not str(job_id).isdigit():
+            raise ValueError(f'Invalid job_id: {job_id}')
+        groups.add(job_group(int(job_id)))
+    for job_type in job_types:
+        if job_type not in JOB_TYPES:
+            raise ValueError(f'Unknown job_type: {job_type}')
+        groups.add(job_type_group(job_type))
+    for status in statuses:
+        if status not in JOB_STATUSES:
+            raise ValueError(f'Unknown status: {status}')
+        groups.add(status_group(status))
+    return groups
+
+
+def as_list(value):
+    if value is None:
+        return []
+    values = value if isinstance(value, list) else [value]
+    return [item for value in values for item in str(value).split(',') if item]
+
 
 class JobStatusConsumer(AsyncWebsocketConsumer):
     """
-    WebSocket consumer for broadcasting job status updates to all connected clients.
+    WebSocket consumer for job status updates.
+    Clients without filters receive every update. Filters from the URL route, the query string
+    (?job_id=1&job_type=send_email&status=failed, comma-separated for several) or
+    {"action": "subscribe", ...} messages restrict the connection to per-topic groups.
+    A batch_id filter delivers the batch's progress events rather than its children's updates.
     """
     async def connect(self):
-        await self.channel_layer.group_add('job_status', self.channel_name)
+        self.groups_joined = set()
+        route = self.scope.get('url_route', {}).get('kwargs', {})
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            groups = topic_groups(
+                job_ids=as_list(route.get('job_id')) + as_list(query.get('job_id')),
+                job_types=as_list(route.get('job_type')) + as_list(query.get('job_type')),
+                statuses=as_list(route.get('status')) + as_list(query.get('status')),
+                batch_ids=as_list(route.get('batch_id')) + as_list(query.get('batch_id')),
+            )
+        except ValueError:
+            await self.close(code=4400)
+            return
+        await self.join(groups or {JOB_STATUS_GROUP})
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard('job_status', self.channel_name)
+        await self.leave(set(getattr(self, 'groups_joined', ())))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Handle {"action": "subscribe"|"unsubscribe", "job_id"|"job_type"|"status"|"batch_id": value or list}."""
+        try:
+            message = json.loads(text_data or '')
+            action = message.get('action')
+            if action not in ('subscribe', 'unsubscribe'):
+                raise ValueError('action must be subscribe or unsubscribe.')
+            groups = topic_groups(
+                job_ids=as_list(message.get('job_id')),
+                job_types=as_list(message.get('job_type')),
+                statuses=as_list(message.get('status')),
+                batch_ids=as_list(message.get('batch_id')),
+            )
+        except (ValueError, AttributeError) as exc:
+            await self.send(text_data=json.dumps({'error': str(exc)}))
+            return
+        if action == 'subscribe':
+            # Explicit topics replace the catch-all stream.
+            await self.leave({JOB_STATUS_GROUP} & self.groups_joined)
+            await self.join(groups)
+        else:
+            await self.leave(groups & self.groups_joined)
+        await self.send(text_data=json.dumps({'subscriptions': sorted(self.groups_joined)}))
+
+    async def join(self, groups):
+        groups = set(groups) - self.groups_joined
+        for group in groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined |= groups
+        if groups:
+            await sync_to_async(register_interest)(groups, 1)
+
+    async def leave(self, groups):
+        for group in groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups_joined -= set(groups)
+        if groups:
+            await sync_to_async(register_interest)(groups, -1)
 
     async def job_status_update(self, event):
         """Send the job update to the WebSocket client."""
         await self.send(text_data=json.dumps(event['data']))
+
+    async def job_status_batch(self, event):
+        """Send a coalesced batch of job updates to the WebSocket client as one array frame."""
+        await self.send(text_data=json.dumps(event['data']))
+
+    async def job_batch_progress(self, event):
+        """Send a batch progress event ({"type": "batch_progress", ...}) to the WebSocket client."""
+        await self.send(text_data=json.dumps(event['data']))
+
+    async def job_notification(self, event):
+        """Send a send_notification job's message ({"type": "notification", ...}) to the WebSocket client."""
+        await self.send(text_data=json.dumps(event['data']))
@@ -0,0 +1,20 @@
+"""
+Database connections of executor threads.
+
+The asyncio worker runs sync handlers (and sync email backends) in asgiref's thread_sensitive=False
+executor threads. Celery closes stale connections around each task and Django around each
+request, but nothing does for those threads, so each one kept its connection open past
+CONN_MAX_AGE, and after a database restart kept a broken one. Code run there goes through
+run_with_fresh_connection, which does for each call what Celery does for each task.
+"""
+from typing import Any, Callable
+from django.db import close_old_connections
+
+
+def run_with_fresh_connection(func: Callable, *args, **kwargs) -> Any:
+    """Call func, closing this thread's unusable or expired database connections before and after."""
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
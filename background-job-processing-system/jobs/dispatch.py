@@ -0,0 +1,104 @@
+from collections import Counter, defaultdict
+from typing import Iterable, List
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import DeadLetterJob, Job, JobBatch, JobStatusCounter, JOB_STATUS_FAILED, JOB_STATUS_PENDING
+from .cancellation import version_kwargs
+from .outbox import enqueue
+from .priority import route_options
+from .tasks import execute_job_task, send_email_batch_task
+
+
+def chunked(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def is_delayed(job: Job, now=None) -> bool:
+    """A scheduled job whose time has not come yet."""
+    return job.schedule_type == 'scheduled' and job.scheduled_time is not None and job.scheduled_time > (now or timezone.now())
+
+
+def delay_jobs(jobs: List[Job]) -> None:
+    """
+    Park scheduled jobs in the delayed store until manage.py run_scheduler promotes them (see
+    jobs/scheduler.py), instead of publishing eta tasks that workers would prefetch and hold in
+    memory until they are due. Rescheduling is then a single indexed update of next_run_at.
+    """
+    Job.objects.filter(id__in=[job.id for job in jobs]).update(next_run_at=F('scheduled_time'))
+    for job in jobs:
+        job.next_run_at = job.scheduled_time
+
+
+def job_signature(job: Job):
+    """Build the execute_job_task signature for a job that is due (for its current version)."""
+    return execute_job_task.si(job.id, **version_kwargs(job)).set(**route_options(job.priority, job.job_type))
+
+
+def email_batch_signatures(jobs: List[Job]) -> List:
+    """One send_email_batch_task per chunk of email jobs sharing the same priority."""
+    batch_size = getattr(settings, 'JOB_EMAIL_BATCH_SIZE', 100)
+    by_priority = defaultdict(list)
+    for job in jobs:
+        by_priority[job.priority].append(job.id)
+    return [
+        send_email_batch_task.si(chunk).set(**route_options(priority))
+        for priority, job_ids in by_priority.items()
+        for chunk in chunked(job_ids, batch_size)
+    ]
+
+
+def job_signatures(jobs: List[Job]) -> List:
+    """Signatures running the given pending jobs now; email jobs are sent in batches over one SMTP connection."""
+    signatures = []
+    # Email batches are not needed when the asyncio worker multiplexes send_email jobs itself.
+    if getattr(settings, 'JOB_EMAIL_BATCH_SIZE', 100) > 1 and 'send_email' not in getattr(settings, 'JOB_ASYNC_JOB_TYPES', ()):
+        emails = [job for job in jobs if job.job_type == 'send_email']
+        jobs = [job for job in jobs if job.job_type != 'send_email']
+        signatures.extend(email_batch_signatures(emails))
+    signatures.extend(job_signature(job) for job in jobs)
+    return signatures
+
+
+def dispatch_jobs(jobs: List[Job]) -> None:
+    """
+    Queue the tasks for many immediate/scheduled jobs through the outbox (jobs/outbox.py).
+    Call it in the transaction that creates the jobs; the tasks are published after it commits,
+    over one producer connection per JOB_DISPATCH_BATCH_SIZE messages. Scheduled jobs that are not
+    due yet go to the delayed store instead.
+    Email jobs are sent in batches over one SMTP connection when JOB_EMAIL_BATCH_SIZE > 1.
+    """
+    now = timezone.now()
+    delayed = [job for job in jobs if is_delayed(job, now)]
+    if delayed:
+        delay_jobs(delayed)
+        jobs = [job for job in jobs if not is_delayed(job, now)]
+    enqueue(job_signatures(jobs))
+
+
+def requeue_dead_letters(letters, spread: float = 0) -> List[Job]:
+    """
+    Send the jobs of not yet requeued dead letters back to the queue with their retries reset.
+    With spread, their tasks are staggered evenly over that many seconds (highest priority first)
+    so a large requeue does not hit the downstream service all at once.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        letters = list(letters.select_for_update().filter(requeued_at__isnull=True).values_list('id', 'job_id'))
+        jobs = list(
+            Job.objects.select_for_update()
+            .filter(id__in={job_id for _, job_id in letters}, status=JOB_STATUS_FAILED)
+            .order_by('-priority', 'id')
+        )
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(status=JOB_STATUS_PENDING, retries=0, retry_at=None, updated_at=now)
+        JobStatusCounter.record_transition(JOB_STATUS_FAILED, JOB_STATUS_PENDING, len(jobs))
+        DeadLetterJob.objects.filter(id__in=[letter_id for letter_id, _ in letters]).update(requeued_at=now)
+        for batch_id, count in Counter(job.batch_id for job in jobs if job.batch_id).items():
+            JobBatch.reopen(batch_id, failed=count)
+        enqueue([
+            job_signature(job).set(countdown=round(spread * index / len(jobs), 3))
+            for index, job in enumerate(jobs)
+        ])
+    return jobs
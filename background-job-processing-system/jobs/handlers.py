@@ -0,0 +1,384 @@
+"""
+Job handlers keyed by job type.
+
+execute_job_task looks the handler up in HANDLERS and runs it according to its kind:
+- sync:  called inline on the worker's own pool (blocking I/O, ORM access)
+- async: a coroutine run on an event loop, so it can overlap many awaits within one job
+- cpu:   sent to a process pool so heavy computation does not hold the GIL of a threaded worker
+
+The asyncio worker (manage.py run_async_worker) awaits async handlers directly, awaits the
+coroutine variant registered with register_async when there is one (e.g. send_email over
+aiosmtplib), and otherwise runs the handler in a thread so it never blocks the event loop (with
+that thread's database connection recycled around each run, see jobs/db.py).
+
+Handlers receive the job's parameters and return the job result. Raise JobFailed to fail a job
+permanently (no retry); any other exception is retried according to the handler's RetryPolicy
+(see jobs/retry.py). Long-running handlers report progress through current_progress() (see
+jobs/progress.py).
+
+Register a new job type with:
+
+    @register('my_job_type', kind=SYNC, retry=RetryPolicy(give_up_on=(PermissionError,)))
+    def my_job(params):
+        return {'message': 'done'}
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import smtplib
+import ssl
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import timedelta
+from functools import lru_cache, partial
+from typing import Any, Awaitable, Callable, Dict, Optional
+import aiosmtplib
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .broadcast import broadcast_notification
+from .db import run_with_fresh_connection
+from .images import image_info
+from .http_client import BlockedAddress, RefusedFetch, check_scheme, public_client, read_capped
+from .mail import build_email_message, send_async, send_pooled
+from .progress import current_progress, run_tracked, tracking
+from .retry import RetryPolicy, resolve
+from .models import Job, JobBatch, StoredObject, JOB_STATUS_FAILED, JOB_STATUS_PENDING, JOB_STATUS_RUNNING, JOB_TYPE_CHOICES, bulk_create_jobs, job_status_counts
+from .storage import content_object_key, object_exists, object_url, read_object, upload_path
+
+SYNC = 'sync'
+ASYNC = 'async'
+CPU = 'cpu'
+
+
+class JobFailed(Exception):
+    """Permanent failure: the job is marked failed with this result and not retried."""
+
+    def __init__(self, result: Dict[str, Any]):
+        super().__init__(result.get('error'))
+        self.result = result
+
+    def __reduce__(self):
+        # Rebuilt from the result when a cpu handler's failure comes back from the process pool.
+        return type(self), (self.result,)
+
+
+@dataclass(frozen=True)
+class Handler:
+    func: Callable[[Dict[str, Any]], Any]
+    kind: str = SYNC
+    aio: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None
+    retry: Optional[RetryPolicy] = None
+
+
+HANDLERS: Dict[str, Handler] = {}
+
+
+def register(job_type: str, kind: str = SYNC, retry: Optional[RetryPolicy] = None):
+    """Decorator registering func as the handler for job_type, optionally with its own retry policy."""
+    if job_type not in dict(JOB_TYPE_CHOICES):
+        raise ValueError(f"Unknown job type: {job_type}")
+    if kind not in (SYNC, ASYNC, CPU):
+        raise ValueError(f"Unknown handler kind: {kind}")
+
+    def decorator(func):
+        HANDLERS[job_type] = Handler(func, kind, retry=retry)
+        return func
+    return decorator
+
+
+def register_async(job_type: str):
+    """Decorator registering a coroutine variant of job_type's handler for the asyncio worker."""
+    def decorator(func):
+        HANDLERS[job_type] = replace(HANDLERS[job_type], aio=func)
+        return func
+    return decorator
+
+
+def retry_policy(job_type: str) -> RetryPolicy:
+    """The retry policy for job_type's errors, with delays filled in from settings."""
+    handler = HANDLERS.get(job_type)
+    return resolve(handler.retry if handler else None, job_type)
+
+
+@lru_cache(maxsize=None)
+def _process_pool(pid: int) -> ProcessPoolExecutor:
+    # Keyed by pid so a forked worker never reuses its parent's pool.
+    return ProcessPoolExecutor(max_workers=getattr(settings, 'JOB_CPU_WORKERS', None))
+
+
+def run_handler(job_type: str, params: Dict[str, Any], job_id=None) -> Any:
+    """Run the registered handler for job_type in the executor matching its kind."""
+    try:
+        handler = HANDLERS[job_type]
+    except KeyError:
+        raise JobFailed({'error': f"No handler registered for job type {job_type}."})
+    with tracking(job_id, job_type):
+        if handler.kind == ASYNC:
+            return async_to_sync(handler.func)(params)
+        if handler.kind == CPU and not multiprocessing.current_process().daemon:
+            # Prefork pool children are daemonic and cannot start processes; they already give the
+            # handler a process of its own, so it runs inline there.
+            return _process_pool(os.getpid()).submit(run_tracked, handler.func, params, job_id, job_type).result()
+        return handler.func(params)
+
+
+async def run_handler_async(job_type: str, params: Dict[str, Any], job_id=None) -> Any:
+    """Await the handler for job_type on the running event loop (used by the asyncio worker)."""
+    try:
+        handler = HANDLERS[job_type]
+    except KeyError:
+        raise JobFailed({'error': f"No handler registered for job type {job_type}."})
+    # Each job runs in its own asyncio task, so its reporter is not seen by other jobs on the loop.
+    with tracking(job_id, job_type):
+        if handler.kind == ASYNC:
+            return await handler.func(params)
+        if handler.aio is not None:
+            return await handler.aio(params)
+        if handler.kind == CPU:
+            tracked = partial(run_tracked, handler.func, params, job_id, job_type)
+            return await asyncio.get_running_loop().run_in_executor(_process_pool(os.getpid()), tracked)
+        return await sync_to_async(run_with_fresh_connection, thread_sensitive=False)(handler.func, params)
+
+
+# --- Handlers ---
+
+@register('send_email', retry=RetryPolicy(
+    # A refused recipient or sender is refused again on every attempt.
+    give_up_on=(smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused),
+))
+def send_email(params):
+    # Reuse the worker's pooled SMTP connection instead of a fresh connection per email.
+    send_pooled(build_email_message(params))
+    return {'message': f"Email sent to {params.get('recipient')}", 'recipient': params.get('recipient')}
+
+
+@register_async('send_email')
+async def send_email_async(params):
+    await send_async(build_email_message(params))
+    return {'message': f"Email sent to {params.get('recipient')}", 'recipient': params.get('recipient')}
+
+
+@register('upload_file')
+def upload_file(params):
+    file_name = params['file_name']
+    sha256 = params.get('sha256')
+    temp_path = params.get('temp_path')
+    stored = StoredObject.objects.filter(sha256=sha256).first() if sha256 else None
+    if stored is not None:
+        # Identical content is already in the bucket: finish without any transfer.
+        object_key, deduplicated = stored.object_key, True
+    elif params.get('object_key'):
+        # Already streamed to the bucket by the web node or the client; just confirm it landed.
+        object_key, deduplicated = params['object_key'], False
+        if not object_exists(object_key):
+            raise FileNotFoundError(f"Object {object_key} is not in the bucket.")
+    elif not temp_path or not os.path.exists(temp_path):
+        raise JobFailed({'error': f"File {file_name} not found at {temp_path}. It may have been deleted before the scheduled job ran."})
+    else:
+        object_key, deduplicated = (content_object_key(sha256) if sha256 else file_name), False
+        # Cached per-process client; large files go up as concurrent multipart parts.
+        upload_path(temp_path, object_key)
+        if sha256:
+            StoredObject.record(sha256, object_key, os.path.getsize(temp_path))
+    if temp_path:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass  # removed by cleanup_files or by an earlier run of this job
+    return {
+        'message': f"File {file_name} uploaded to S3.",
+        'file_url': object_url(object_key),
+        'object_key': object_key,
+        'deduplicated': deduplicated,
+    }
+
+
+@lru_cache(maxsize=None)
+def ssl_context() -> ssl.SSLContext:
+    # Building a context loads the CA bundle (~50 ms of CPU); do it once, not per job.
+    return ssl.create_default_context()
+
+
+async def fetch_url(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
+    check_scheme(url)
+    try:
+        async with client.stream('GET', url, headers={'Accept': 'application/json'}) as response:
+            response.raise_for_status()
+            body = await read_capped(response)
+    except httpx.ConnectError as exc:
+        if isinstance(exc.__cause__, BlockedAddress):
+            raise RefusedFetch(str(exc.__cause__)) from exc
+        raise
+    is_json = response.headers.get('content-type', '').startswith('application/json')
+    text = body.decode(response.encoding or 'utf-8', errors='replace')
+    return {'url': url, 'status': response.status_code, 'data': json.loads(text) if is_json else text}
+
+
+@register('fetch_data', kind=ASYNC)
+async def fetch_data(params):
+    """
+    Fetch one url or a list of urls concurrently; a failing url is reported, not retried. Only
+    public http(s) hosts are fetched, redirects included (see jobs/http_client.py).
+    """
+    urls = params.get('urls') or ([params['url']] if params.get('url') else [])
+    if not urls:
+        raise JobFailed({'error': 'fetch_data needs a url or a list of urls.'})
+    async with public_client(params.get('timeout', 10), ssl_context()) as client:
+        responses = await asyncio.gather(*(fetch_url(client, url) for url in urls), return_exceptions=True)
+    results = [
+        {'url': url, 'error': str(response)} if isinstance(response, Exception) else response
+        for url, response in zip(urls, responses)
+    ]
+    if all(isinstance(response, RefusedFetch) for response in responses):
+        raise JobFailed({'error': f"Refused to fetch {', '.join(urls)}.", 'results': results})
+    if all('error' in result for result in results):
+        raise ConnectionError(f"Could not fetch {', '.join(urls)}.")
+    return {'message': f"Fetched {len(urls)} url(s).", 'results': results}
+
+
+@register('batch_process')
+def batch_process(params):
+    """
+    Fan a batch out into child jobs: {"job_type": ..., "items": [parameters, ...]} creates one child
+    job per item, or {"jobs": [{"job_type": ..., "parameters": ...}, ...]} lists them explicitly.
+    The children form a JobBatch; an optional "on_complete" {"job_type": ..., "parameters": ...}
+    job runs once they have all finished.
+    """
+    from .dispatch import dispatch_jobs  # dispatch imports the tasks module, which imports this one
+    specs = params.get('jobs') or [{'job_type': params.get('job_type'), 'parameters': item} for item in params.get('items', [])]
+    for spec in specs:
+        if spec.get('job_type') not in HANDLERS or spec['job_type'] == 'batch_process':
+            raise JobFailed({'error': f"Invalid batch job type: {spec.get('job_type')}"})
+    on_complete = params.get('on_complete')
+    if on_complete and on_complete.get('job_type') not in HANDLERS:
+        raise JobFailed({'error': f"Invalid on_complete job type: {on_complete.get('job_type')}"})
+    progress = current_progress()
+    progress.update(total=len(specs), step='creating jobs')
+    with transaction.atomic():
+        batch = JobBatch.objects.create(total=len(specs), on_complete=on_complete or None) if specs else None
+        jobs = bulk_create_jobs([
+            Job(job_type=spec['job_type'], parameters=spec.get('parameters', {}), priority=params.get('priority', 5), batch=batch)
+            for spec in specs
+        ])
+        progress.update(step='dispatching')
+        dispatch_jobs(jobs)
+    progress.update(done=len(jobs), step='queued')
+    return {'message': f"Queued {len(jobs)} job(s).", 'batch_id': batch and batch.id, 'job_ids': [job.id for job in jobs]}
+
+
+@register('cleanup_files')
+def cleanup_files(params):
+    """Remove spooled uploads older than max_age_hours that no unfinished upload job still needs."""
+    directory = os.path.join(settings.MEDIA_ROOT, 'uploads')
+    if not os.path.isdir(directory):
+        return {'message': f"Nothing to clean up in {directory}.", 'removed': 0, 'bytes_freed': 0}
+    cutoff = time.time() - params.get('max_age_hours', 24) * 3600
+    # Pending or running jobs, and failed ones that may still be retried, read their file later.
+    unfinished = Q(status__in=(JOB_STATUS_PENDING, JOB_STATUS_RUNNING)) | Q(
+        Q(retry_at__isnull=False) | Q(retries__lt=F('max_retries')), status=JOB_STATUS_FAILED
+    )
+    in_use = {
+        path for path in Job.objects.filter(unfinished, job_type='upload_file')
+        .values_list('parameters__temp_path', flat=True) if path
+    }
+    removed, freed = 0, 0
+    progress = current_progress()
+    progress.update(step='scanning')
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            progress.advance()
+            if not entry.is_file() or entry.path in in_use:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed, freed = removed + 1, freed + stat.st_size
+    return {'message': f"Removed {removed} file(s) from {directory}.", 'removed': removed, 'bytes_freed': freed}
+
+
+@register('generate_report')
+def generate_report(params):
+    """Summarize jobs per status over the last `days` days (all time when omitted)."""
+    progress = current_progress()
+    progress.update(total=1, step='counting jobs')
+    jobs = Job.objects.all()
+    if params.get('days'):
+        jobs = jobs.filter(created_at__gte=timezone.now() - timedelta(days=params['days']))
+    counts = job_status_counts(jobs)
+    progress.update(done=1, step='done')
+    return {'message': 'Report generated.', 'total': sum(counts.values()), 'by_status': counts}
+
+
+@register('process_image', kind=CPU)
+def process_image(params):
+    """Inspect an uploaded image (temp_path under MEDIA_ROOT/uploads, or object_key in the bucket)."""
+    progress = current_progress()
+    progress.update(total=2, step='reading')
+    if params.get('object_key'):
+        source = params['object_key']
+        try:
+            data = read_object(source)
+        except ClientError as exc:
+            raise JobFailed({'error': f"Could not read {source} from the bucket: {exc}"})
+    elif params.get('temp_path'):
+        source = os.path.realpath(params['temp_path'])
+        if os.path.dirname(source) != os.path.realpath(os.path.join(settings.MEDIA_ROOT, 'uploads')):
+            raise JobFailed({'error': f"{params['temp_path']} is not an uploaded file."})
+        try:
+            with open(source, 'rb') as image:
+                data = image.read()
+        except FileNotFoundError:
+            raise JobFailed({'error': f"File {params['temp_path']} not found."})
+    else:
+        raise JobFailed({'error': 'process_image needs a temp_path or an object_key.'})
+    progress.update(done=1, step='inspecting')
+    try:
+        info = image_info(data)
+    except ValueError as exc:
+        raise JobFailed({'error': f"{source}: {exc}"})
+    progress.update(done=2, step='done')
+    return {'message': f"Processed {info['width']}x{info['height']} {info['format']} image.", **info}
+
+
+@register('backup_database')
+def backup_database(params):
+    """Dump the database (or only the listed `apps`) as gzipped JSON into JOB_BACKUP_DIR."""
+    directory = getattr(settings, 'JOB_BACKUP_DIR', 'backups')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"backup-{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.json.gz")
+    progress = current_progress()
+    progress.update(total=1, step='dumping')
+    try:
+        call_command('dumpdata', *params.get('apps', []), output=path, verbosity=0,
+                     exclude=['contenttypes', 'auth.permission', 'sessions'])
+    except CommandError as exc:
+        raise JobFailed({'error': str(exc)})
+    progress.update(done=1, step='done')
+    return {'message': f"Database backed up to {path}.", 'path': path, 'size': os.path.getsize(path)}
+
+
+@register('send_notification')
+def send_notification(params):
+    """Push {"type": "notification", "message": ...} to every WebSocket client on the catch-all stream."""
+    batch = params.get('batch')  # the batch's final counts when run as its on_complete job
+    message = params.get('message') or (batch and f"Batch {batch['batch_id']} finished: {batch['completed']} completed, {batch['failed']} failed.")
+    if not message:
+        raise JobFailed({'error': 'send_notification needs a message.'})
+    notification = {'type': 'notification', 'message': message}
+    if batch is not None:
+        notification['batch'] = batch
+    broadcast_notification(notification)
+    return {'message': f"Notification sent: {message}"}
@@ -0,0 +1,95 @@
+"""
+HTTP client for fetching user-supplied URLs (the fetch_data job type).
+
+The job API accepts any URL, so fetches must not reach the worker's own network: cloud metadata
+endpoints, internal services, localhost. Only http and https URLs are fetched, and the client
+connects through a network backend that resolves every host itself and refuses private,
+loopback, link-local and other non-public addresses. The check runs on each connection, after
+resolution, so redirects to internal hosts and DNS answers that change between a check and the
+connection are refused as well. Response bodies are read up to JOB_FETCH_MAX_BYTES.
+
+JOB_FETCH_ALLOW_PRIVATE_NETWORKS=True lifts the address check (local development, benchmarks).
+"""
+import asyncio
+import ipaddress
+import socket
+from typing import Optional
+import httpcore
+import httpx
+from django.conf import settings
+
+SCHEMES = ('http', 'https')
+
+
+class RefusedFetch(Exception):
+    """The URL may not be fetched (scheme, address or size); retrying would be refused again."""
+
+
+class BlockedAddress(httpcore.ConnectError):
+    pass
+
+
+def is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_scheme(url: str) -> None:
+    if httpx.URL(url).scheme not in SCHEMES:
+        raise RefusedFetch(f"Only {' and '.join(SCHEMES)} URLs can be fetched: {url}")
+
+
+class PublicNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Connects only to public addresses, checked after resolving the host."""
+
+    def __init__(self):
+        self.backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if getattr(settings, 'JOB_FETCH_ALLOW_PRIVATE_NETWORKS', False):
+            address = host
+        else:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = [info[4][0] for info in infos]
+            refused = [address for address in addresses if not is_public(address)]
+            if refused:
+                raise BlockedAddress(f"{host} resolves to a non-public address ({refused[0]}).")
+            # Connect to the address that was checked; TLS still verifies the certificate for host.
+            address = addresses[0]
+        return await self.backend.connect_tcp(address, port, timeout=timeout, local_address=local_address, socket_options=socket_options)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise BlockedAddress('Unix sockets cannot be fetched.')
+
+    async def sleep(self, seconds: float) -> None:
+        await self.backend.sleep(seconds)
+
+
+class PublicTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, verify, **kwargs):
+        # Proxies from the environment would connect on our behalf and bypass the address check.
+        super().__init__(verify=verify, trust_env=False, **kwargs)
+        self._pool = httpcore.AsyncConnectionPool(ssl_context=verify, network_backend=PublicNetworkBackend())
+
+
+def public_client(timeout: float, verify) -> httpx.AsyncClient:
+    """Client that follows redirects but only ever connects to public http(s) hosts."""
+    return httpx.AsyncClient(
+        timeout=timeout, follow_redirects=True, verify=verify, trust_env=False, transport=PublicTransport(verify),
+    )
+
+
+async def read_capped(response: httpx.Response, limit: Optional[int] = None) -> bytes:
+    """The response body, refusing bodies larger than limit (JOB_FETCH_MAX_BYTES) without reading them whole."""
+    limit = limit or getattr(settings, 'JOB_FETCH_MAX_BYTES', 1024 * 1024)
+    declared = response.headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise RefusedFetch(f"Response of {response.url} is {declared} bytes; the limit is {limit}.")
+    body = bytearray()
+    async for chunk in response.aiter_bytes():
+        body.extend(chunk)
+        if len(body) > limit:
+            raise RefusedFetch(f"Response of {response.url} exceeds {limit} bytes.")
+    return bytes(body)
@@ -0,0 +1,172 @@
+"""
+Idempotent job creation.
+
+A client that retries a create request after a timeout sends the same Idempotency-Key header, and
+gets back the response of the first request instead of a second set of jobs and emails. With
+JOB_DEDUPE_CONTENT_TTL set, JSON requests without the header are deduplicated by a hash of their
+body for that many seconds.
+
+Each request key is checked in Redis first: SET NX claims it, and a repeat within the TTL is
+answered from the cached response without touching the database or the broker (or gets 409 while
+the first request is still running). The in-progress claim only lasts JOB_IDEMPOTENCY_LOCK_SECONDS,
+so a request whose process died mid-way does not block retries for the whole TTL; the response is
+cached for the TTL once it exists. Every job created under a key also stores a dedupe_key
+("<request hash>:<position>") behind a unique index, and the body fingerprint of its request, so a
+repeat that misses Redis (evicted, or Redis down) still cannot insert duplicates: it is answered
+from the jobs that exist, or with 422 when the key was used with a different body.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError
+from django.utils import timezone
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.response import Response
+from .models import Job
+from .redis_utils import get_redis
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+IN_PROGRESS = b'in-progress'
+
+
+def request_scope(request) -> Optional[Tuple[str, int]]:
+    """(request hash, ttl) identifying a create request for dedupe, or None when it is not deduplicated."""
+    key = request.headers.get(HEADER)
+    if key:
+        return hashlib.sha256(f'{request.path}\n{key}'.encode()).hexdigest(), getattr(settings, 'JOB_IDEMPOTENCY_TTL', 86400)
+    ttl = getattr(settings, 'JOB_DEDUPE_CONTENT_TTL', 0)
+    if ttl and request.content_type.startswith('application/json'):
+        return hashlib.sha256(f'{request.path}\n{canonical(request.data)}'.encode()).hexdigest(), ttl
+    return None
+
+
+def dedupe_key(scope: Optional[str], index: int = 0) -> Optional[str]:
+    """dedupe_key of the index-th job created by the request with this scope."""
+    return f'{scope}:{index}' if scope else None
+
+
+def dedupe_fields(validated_data: Dict[str, Any], index: int = 0) -> Dict[str, Optional[str]]:
+    """dedupe_key and dedupe_fingerprint for the index-th job created from a serializer's validated_data."""
+    scope = validated_data.get('dedupe_scope')
+    return {'dedupe_key': dedupe_key(scope, index), 'dedupe_fingerprint': validated_data.get('dedupe_fingerprint') if scope else None}
+
+
+def canonical(data) -> str:
+    # default=str also covers uploaded files in multipart bodies (by name).
+    return json.dumps(data, sort_keys=True, default=str)
+
+
+def fingerprint(request) -> str:
+    return hashlib.sha256(canonical(request.data).encode()).hexdigest()
+
+
+def cache_key(scope: str) -> str:
+    return f'jobs:idempotency:{scope}'
+
+
+def existing_jobs(scope: str) -> List[Job]:
+    return list(Job.objects.filter(dedupe_key__startswith=f'{scope}:').order_by('id'))
+
+
+def release_expired(scope: str, ttl: int) -> int:
+    """Free the dedupe keys of jobs created under scope more than ttl seconds ago so it can be reused."""
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    return Job.objects.filter(dedupe_key__startswith=f'{scope}:', created_at__lt=cutoff).update(dedupe_key=None)
+
+
+def idempotent(view_method):
+    """
+    Make a job-creating ViewSet action idempotent. The action passes self.dedupe_scope and
+    self.dedupe_fingerprint to the serializer's save() and builds its 201 response for existing jobs
+    with self.created_response(jobs).
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        self.dedupe_scope = self.dedupe_fingerprint = None
+        scope = request_scope(request)
+        if scope is None:
+            return view_method(self, request, *args, **kwargs)
+        self.dedupe_scope, ttl = scope
+        key, body_hash = cache_key(self.dedupe_scope), fingerprint(request)
+        self.dedupe_fingerprint = body_hash
+        # Long enough for the request to finish; if its process dies, retries are unblocked soon after.
+        lock = min(ttl, getattr(settings, 'JOB_IDEMPOTENCY_LOCK_SECONDS', 60))
+        try:
+            redis = get_redis()
+            if not redis.set(key, IN_PROGRESS, nx=True, ex=lock):
+                cached = redis.get(key)
+                if cached is not None and cached != IN_PROGRESS:
+                    return replay(json.loads(cached), body_hash)
+                # Still running, or the key expired in between and another request may claim it first.
+                if cached == IN_PROGRESS or not redis.set(key, IN_PROGRESS, nx=True, ex=lock):
+                    return in_progress()
+        except RedisError as exc:
+            # The unique dedupe_key index still prevents duplicates; only the fast path is lost.
+            print(f"[✗] Idempotency pre-check unavailable, relying on the database: {exc}")
+            redis = None
+        try:
+            response = create_once(self, view_method, request, ttl, body_hash, *args, **kwargs)
+        except BaseException:
+            forget(redis, key)
+            raise
+        if response.status_code >= 400:
+            forget(redis, key)  # nothing was created; let the client fix the request and retry
+        elif redis is not None:
+            cached = {'status': response.status_code, 'data': response.data, 'fingerprint': body_hash}
+            try:
+                redis.set(key, json.dumps(cached, cls=DjangoJSONEncoder), ex=ttl)
+            except RedisError as exc:
+                print(f"[✗] Could not cache idempotent response: {exc}")
+        return response
+    return wrapper
+
+
+def create_once(view, view_method, request, ttl, body_hash, *args, **kwargs) -> Response:
+    """Run the action; if its jobs already exist (dedupe_key conflict), answer with those instead."""
+    for _ in range(2):
+        try:
+            return view_method(view, request, *args, **kwargs)
+        except IntegrityError:
+            jobs = existing_jobs(view.dedupe_scope)
+            if not jobs:
+                raise
+            if not release_expired(view.dedupe_scope, ttl):
+                # Jobs from before fingerprints were stored have none and are taken as a match.
+                if any(job.dedupe_fingerprint not in (None, body_hash) for job in jobs):
+                    return body_mismatch()
+                response = view.created_response(jobs)
+                response[REPLAYED_HEADER] = 'true'
+                return response
+    raise IntegrityError(f'Could not create jobs for {HEADER} scope {view.dedupe_scope}.')
+
+
+def in_progress() -> Response:
+    return Response({'error': f'A request with this {HEADER} is still in progress.'}, status=status.HTTP_409_CONFLICT)
+
+
+def body_mismatch() -> Response:
+    return Response(
+        {'error': f'This {HEADER} was already used with a different request body.'},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def replay(cached, body_hash: str) -> Response:
+    if cached['fingerprint'] != body_hash:
+        return body_mismatch()
+    return Response(cached['data'], status=cached['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+def forget(redis, key: str) -> None:
+    if redis is None:
+        return
+    try:
+        redis.delete(key)
+    except RedisError:
+        pass
@@ -0,0 +1,72 @@
+"""
+Image inspection for process_image jobs, without an imaging library.
+
+image_info reads the dimensions from the PNG, GIF, JPEG or BMP header and digests the whole file.
+Hashing and scanning JPEG segments is CPU work on the full image, so process_image is registered
+as a cpu handler and runs in the worker's process pool rather than on its threads or event loop.
+"""
+import hashlib
+import struct
+from typing import Any, Dict, Tuple
+
+# JPEG start-of-frame markers carry the dimensions; C4, C8 and CC share the range but are not frames.
+JPEG_FRAME_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def png_size(data: bytes) -> Tuple[int, int]:
+    if data[12:16] != b'IHDR':
+        raise ValueError('PNG without an IHDR chunk.')
+    return struct.unpack('>II', data[16:24])
+
+
+def gif_size(data: bytes) -> Tuple[int, int]:
+    return struct.unpack('<HH', data[6:10])
+
+
+def bmp_size(data: bytes) -> Tuple[int, int]:
+    width, height = struct.unpack('<ii', data[18:26])
+    return width, abs(height)  # a negative height means the rows are stored top-down
+
+
+def jpeg_size(data: bytes) -> Tuple[int, int]:
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            raise ValueError('Corrupt JPEG segment.')
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1  # fill byte
+            continue
+        length, = struct.unpack('>H', data[offset + 2:offset + 4])
+        if marker in JPEG_FRAME_MARKERS:
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    raise ValueError('JPEG without a frame header.')
+
+
+FORMATS = (
+    (b'\x89PNG\r\n\x1a\n', 'png', png_size),
+    (b'GIF87a', 'gif', gif_size),
+    (b'GIF89a', 'gif', gif_size),
+    (b'\xff\xd8', 'jpeg', jpeg_size),
+    (b'BM', 'bmp', bmp_size),
+)
+
+
+def image_info(data: bytes) -> Dict[str, Any]:
+    """Return the format, width, height, size and sha256 of an image, or raise ValueError."""
+    for signature, name, size in FORMATS:
+        if data.startswith(signature):
+            try:
+                width, height = size(data)
+            except struct.error:
+                raise ValueError(f'Truncated {name} header.')
+            return {
+                'format': name,
+                'width': width,
+                'height': height,
+                'size': len(data),
+                'sha256': hashlib.sha256(data).hexdigest(),
+            }
+    raise ValueError('Unsupported image format (expected PNG, GIF, JPEG or BMP).')
@@ -0,0 +1,59 @@
+"""
+Leases on running jobs.
+
+claim_job marks a job running with a lease (lease_expires_at, JOB_LEASE_SECONDS ahead), and while
+its handler runs a heartbeat thread renews the lease every third of that. A job left running by a
+worker that died is no longer renewed, so once its lease has expired a redelivered or requeued
+message may claim it again; a job whose worker is alive is never claimed a second time.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from .models import JOB_STATUS_RUNNING, Job
+
+
+def lease_seconds() -> int:
+    return getattr(settings, 'JOB_LEASE_SECONDS', 600)
+
+
+def lease_deadline(now: Optional[datetime] = None) -> datetime:
+    return (now or timezone.now()) + timedelta(seconds=lease_seconds())
+
+
+def expired(now: Optional[datetime] = None) -> Q:
+    """Running jobs whose worker stopped renewing the lease (or, from before leases, that ran for a whole lease)."""
+    now = now or timezone.now()
+    return Q(lease_expires_at__lt=now) | Q(lease_expires_at__isnull=True, updated_at__lt=now - timedelta(seconds=lease_seconds()))
+
+
+class Heartbeat:
+    """Context manager renewing the lease of a running job from a background thread."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f'job-{job_id}-heartbeat', daemon=True)
+
+    def __enter__(self) -> 'Heartbeat':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+
+    def run(self) -> None:
+        renewed = False
+        try:
+            while not self.stopped.wait(lease_seconds() / 3):
+                renewed = True
+                Job.objects.filter(id=self.job_id, status=JOB_STATUS_RUNNING).update(lease_expires_at=lease_deadline())
+        except Exception as exc:
+            print(f"[✗] Could not renew the lease of job {self.job_id}: {exc}")
+        finally:
+            if renewed:
+                # The thread's own database connection.
+                connection.close()
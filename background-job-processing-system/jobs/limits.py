@@ -0,0 +1,107 @@
+"""
+Per-job-type concurrency caps and rate limits shared by every worker node.
+
+JOB_TYPE_CONCURRENCY_LIMITS caps how many jobs of a type run at once, using a Redis sorted set of
+leases (so a crashed worker's slot frees itself after JOB_LIMIT_LEASE_SECONDS).
+JOB_TYPE_RATE_LIMITS ('100/m', '5/s', ...) is a token bucket holding at most that many tokens.
+Both are checked and taken in one Lua script, so a job never takes a token it cannot use.
+
+A job over its limits is re-queued with a countdown by the task instead of occupying a worker
+process, and its status and retry count are left alone.
+"""
+import random
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from django.conf import settings
+from redis.exceptions import RedisError
+from .redis_utils import get_redis
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600}
+
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local want = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local lease = tonumber(ARGV[4])
+local rate = tonumber(ARGV[5])
+local capacity = tonumber(ARGV[6])
+local granted = want
+if limit > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+    if redis.call('ZCARD', KEYS[1]) >= limit then
+        return {0, '-1'}
+    end
+end
+if rate > 0 then
+    local state = redis.call('HMGET', KEYS[2], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    granted = math.min(want, math.floor(tokens))
+    if granted > 0 then
+        tokens = tokens - granted
+    end
+    redis.call('HSET', KEYS[2], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[2], math.ceil(capacity / rate) + 1)
+    if granted < 1 then
+        return {0, tostring((1 - tokens) / rate)}
+    end
+end
+if limit > 0 then
+    redis.call('ZADD', KEYS[1], now + lease, ARGV[1])
+    redis.call('EXPIRE', KEYS[1], math.ceil(lease) + 1)
+end
+return {granted, '0'}
+"""
+
+
+@dataclass(frozen=True)
+class Grant:
+    granted: int
+    wait: Optional[float] = None  # seconds until a token is due; None when waiting on a free slot
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """'100/m' -> (bucket capacity 100, refill of 100/60 tokens per second)."""
+    count, _, period = rate.partition('/')
+    return int(count), int(count) / PERIODS[period or 's']
+
+
+def limit_keys(job_type: str) -> Tuple[str, str]:
+    return f'jobs:limit:{job_type}:running', f'jobs:limit:{job_type}:tokens'
+
+
+def acquire(job_type: str, holder: str, want: int = 1) -> Grant:
+    """Take a concurrency slot for holder and up to want rate tokens; granted is 0 when over a limit."""
+    limit = getattr(settings, 'JOB_TYPE_CONCURRENCY_LIMITS', {}).get(job_type, 0)
+    rate = getattr(settings, 'JOB_TYPE_RATE_LIMITS', {}).get(job_type)
+    if not limit and not rate:
+        return Grant(want, 0)
+    capacity, per_second = parse_rate(rate) if rate else (0, 0)
+    lease = getattr(settings, 'JOB_LIMIT_LEASE_SECONDS', 600)
+    try:
+        granted, wait = get_redis().eval(
+            ACQUIRE_SCRIPT, 2, *limit_keys(job_type), holder, want, limit, lease, per_second, capacity
+        )
+    except RedisError as exc:
+        # Limits protect downstream services; losing Redis should not stop the jobs themselves.
+        print(f"[✗] Could not check limits for {job_type}, running unthrottled: {exc}")
+        return Grant(want, 0)
+    wait = float(wait)
+    return Grant(int(granted), None if wait < 0 else wait)
+
+
+def release(job_type: str, holder: str) -> None:
+    if not getattr(settings, 'JOB_TYPE_CONCURRENCY_LIMITS', {}).get(job_type):
+        return
+    try:
+        get_redis().zrem(limit_keys(job_type)[0], holder)
+    except RedisError as exc:
+        print(f"[✗] Could not release {job_type} slot for {holder}; it expires with its lease: {exc}")
+
+
+def defer_delay(grant: Grant) -> float:
+    """Countdown before trying again, jittered so deferred jobs do not all return at once."""
+    base = grant.wait if grant.wait else getattr(settings, 'JOB_LIMIT_DEFER_SECONDS', 1.0)
+    return round(base * random.uniform(1.0, 1.5), 3)
@@ -0,0 +1,144 @@
+"""
+Worker-lifetime SMTP connection reuse for send_email jobs.
+
+Each worker process (or thread) keeps one open connection from the configured email
+backend and reuses it across tasks, reconnecting when the server drops it. The asyncio worker
+instead shares a small pool of aiosmtplib connections between all of its in-flight jobs.
+"""
+import asyncio
+import smtplib
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+import aiosmtplib
+from asgiref.sync import sync_to_async
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from .db import run_with_fresh_connection
+
+# Errors that mean the connection itself is unusable and should be reopened.
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+_local = threading.local()
+
+
+def get_mail_connection():
+    """Return this worker's open email connection, opening a fresh one if needed."""
+    max_idle = getattr(settings, 'EMAIL_CONNECTION_MAX_IDLE', 60)
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and time.monotonic() - _local.last_used > max_idle:
+        # Servers drop idle sessions; reopen proactively rather than failing the next send.
+        close_mail_connection()
+        connection = None
+    if connection is None:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+        _local.connection = connection
+    _local.last_used = time.monotonic()
+    return connection
+
+
+def close_mail_connection(**kwargs) -> None:
+    connection = getattr(_local, 'connection', None)
+    _local.connection = None
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+worker_process_shutdown.connect(close_mail_connection)
+
+
+def build_email_message(params: Dict[str, Any]) -> EmailMessage:
+    """Build the message for a send_email job's parameters."""
+    return EmailMessage(
+        subject=params.get('subject', ''),
+        body=params.get('body', ''),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@example.com'),
+        to=[params.get('recipient')],
+    )
+
+
+def send_pooled(message: EmailMessage) -> None:
+    """Send one message over the pooled connection, reconnecting once if the server dropped it."""
+    try:
+        sent = get_mail_connection().send_messages([message])
+    except RECONNECT_ERRORS:
+        close_mail_connection()
+        sent = get_mail_connection().send_messages([message])
+    if not sent:
+        raise smtplib.SMTPException(f"Message to {', '.join(message.to)} was not sent.")
+
+
+def send_messages(messages: List[EmailMessage]) -> List[Optional[Exception]]:
+    """
+    Send many messages over one connection and return the error for each (None on success).
+    Any error is caught per message: the callers have already claimed every job in the batch, and
+    an exception escaping here would leave the rest of them running with nothing to send them.
+    """
+    errors = []
+    for message in messages:
+        try:
+            send_pooled(message)
+            errors.append(None)
+        except Exception as exc:
+            if isinstance(exc, RECONNECT_ERRORS):
+                close_mail_connection()
+            errors.append(exc)
+    return errors
+
+
+class AsyncMailPool:
+    """Up to `size` open aiosmtplib connections shared by the coroutines of one event loop."""
+
+    def __init__(self, size: int):
+        self.slots = asyncio.Semaphore(size)
+        self.idle: List[aiosmtplib.SMTP] = []
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            start_tls=getattr(settings, 'EMAIL_USE_TLS', False),
+            use_tls=getattr(settings, 'EMAIL_USE_SSL', False),
+            timeout=getattr(settings, 'EMAIL_TIMEOUT', None) or 60,
+        )
+        await client.connect()
+        if settings.EMAIL_HOST_USER:
+            await client.login(settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD)
+        return client
+
+    async def send(self, message: EmailMessage) -> None:
+        mime, recipients = message.message(), message.recipients()
+        async with self.slots:
+            client = self.idle.pop() if self.idle else None
+            try:
+                if client is None or not client.is_connected:
+                    client = await self.connect()
+                try:
+                    await client.send_message(mime, sender=message.from_email, recipients=recipients)
+                except aiosmtplib.SMTPServerDisconnected:
+                    client = await self.connect()
+                    await client.send_message(mime, sender=message.from_email, recipients=recipients)
+            finally:
+                if client is not None and client.is_connected:
+                    self.idle.append(client)
+
+
+_async_pools: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncMailPool]' = weakref.WeakKeyDictionary()
+
+
+async def send_async(message: EmailMessage) -> None:
+    """Send one message from a coroutine without blocking the event loop."""
+    if settings.EMAIL_BACKEND != 'django.core.mail.backends.smtp.EmailBackend':
+        # Other backends (console, locmem in tests, ...) are synchronous; run them in a thread.
+        await sync_to_async(run_with_fresh_connection, thread_sensitive=False)(send_pooled, message)
+        return
+    loop = asyncio.get_running_loop()
+    if loop not in _async_pools:
+        _async_pools[loop] = AsyncMailPool(getattr(settings, 'EMAIL_ASYNC_MAX_CONNECTIONS', 10))
+    await _async_pools[loop].send(message)
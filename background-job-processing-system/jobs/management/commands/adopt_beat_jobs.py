@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django_celery_beat.models import PeriodicTask
+from jobs.models import Job
+from jobs.scheduler import schedule_recurring
+
+
+class Command(BaseCommand):
+    """Move interval jobs created with django-celery-beat PeriodicTasks onto run_scheduler."""
+    help = 'Give interval jobs a next_run_at and delete their job-<id> / enable-job-<id> PeriodicTasks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='jobs moved per transaction')
+
+    def handle(self, *args, **options):
+        adopted, last_id = 0, 0
+        while True:
+            jobs = list(
+                Job.objects.filter(schedule_type='interval', next_run_at__isnull=True, id__gt=last_id)
+                .order_by('id')[:options['batch_size']]
+            )
+            if not jobs:
+                break
+            with transaction.atomic():
+                for job in jobs:
+                    try:
+                        schedule_recurring(job)
+                    except ValueError as exc:
+                        self.stderr.write(f'[✗] Job {job.id} left on beat: {exc}')
+                        continue
+                    adopted += 1
+                names = [name for job in jobs if job.next_run_at for name in (f'job-{job.id}', f'enable-job-{job.id}')]
+                PeriodicTask.objects.filter(name__in=names).delete()
+            last_id = jobs[-1].id
+        self.stdout.write(self.style.SUCCESS(f'Moved {adopted} interval job(s) to the scheduler.'))
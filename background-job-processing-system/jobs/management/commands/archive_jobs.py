@@ -0,0 +1,25 @@
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jobs.retention import apply_retention, archive_path
+
+
+class Command(BaseCommand):
+    """Move finished jobs past their retention into a compressed archive and purge old task results."""
+    help = 'Archive completed/failed jobs older than JOB_RETENTION_DAYS to a .jsonl.gz file and purge old TaskResults.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='archive file to append to (default: a new file in JOB_ARCHIVE_DIR)')
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_ARCHIVE_BATCH_SIZE,
+                            help='jobs archived per transaction')
+
+    def handle(self, *args, **options):
+        path = Path(options['output']) if options['output'] else archive_path()
+        counts = apply_retention(path=path, batch_size=options['batch_size'])
+        for name, count in counts.items():
+            self.stdout.write(f'{name}: {count}')
+        archived = sum(count for name, count in counts.items() if name != 'task_results')
+        if archived:
+            self.stdout.write(self.style.SUCCESS(f'Archived {archived} job(s) to {path}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No jobs past their retention.'))
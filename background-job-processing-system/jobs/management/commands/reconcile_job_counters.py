@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from jobs.models import JobStatusCounter
+
+
+class Command(BaseCommand):
+    """Recompute the JobStatusCounter rows from the jobs table."""
+    help = 'Recompute per-status job counters from the jobs table.'
+
+    def handle(self, *args, **options):
+        before = JobStatusCounter.snapshot()
+        counts = JobStatusCounter.reconcile()
+        for status in sorted(set(before) | set(counts)):
+            old, new = before.get(status, 0), counts.get(status, 0)
+            marker = '' if old == new else f' (was {old})'
+            self.stdout.write(f'{status}: {new}{marker}')
+        self.stdout.write(self.style.SUCCESS('Job status counters reconciled.'))
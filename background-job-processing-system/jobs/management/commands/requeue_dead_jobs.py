@@ -0,0 +1,33 @@
+from collections import Counter
+from django.core.management.base import BaseCommand
+from jobs.dispatch import requeue_dead_letters
+from jobs.models import DeadLetterJob
+
+
+class Command(BaseCommand):
+    """Send dead-lettered jobs back to the queue in bulk."""
+    help = 'Requeue jobs from the dead-letter table, optionally filtered and spread over time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-type', help='only requeue jobs of this type')
+        parser.add_argument('--exception', help='only requeue jobs whose error class contains this text, e.g. SMTPServerDisconnected')
+        parser.add_argument('--limit', type=int, help='requeue at most this many dead letters, oldest first')
+        parser.add_argument('--spread', type=float, default=0, help='stagger the requeued tasks over this many seconds')
+        parser.add_argument('--dry-run', action='store_true', help='list what would be requeued and exit')
+
+    def handle(self, *args, **options):
+        letters = DeadLetterJob.objects.filter(requeued_at__isnull=True).order_by('created_at')
+        if options['job_type']:
+            letters = letters.filter(job_type=options['job_type'])
+        if options['exception']:
+            letters = letters.filter(exception__contains=options['exception'])
+        if options['limit']:
+            letters = DeadLetterJob.objects.filter(id__in=list(letters.values_list('id', flat=True)[:options['limit']]))
+        if options['dry_run']:
+            for (job_type, exception), count in sorted(Counter(letters.values_list('job_type', 'exception')).items()):
+                self.stdout.write(f'{job_type}: {count} ({exception})')
+            return
+        jobs = requeue_dead_letters(letters, spread=options['spread'])
+        for job_type, count in sorted(Counter(job.job_type for job in jobs).items()):
+            self.stdout.write(f'{job_type}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Requeued {len(jobs)} dead-lettered job(s).'))
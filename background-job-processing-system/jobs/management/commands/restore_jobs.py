@@ -0,0 +1,20 @@
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jobs.retention import restore
+
+
+class Command(BaseCommand):
+    """Load jobs archived by archive_jobs back into the database."""
+    help = 'Restore jobs (and their dead letters) from archive_jobs .jsonl.gz files; rows already present are skipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archives', nargs='+', help='archive files written by archive_jobs')
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_ARCHIVE_BATCH_SIZE,
+                            help='rows restored per transaction')
+
+    def handle(self, *args, **options):
+        for archive in options['archives']:
+            restored, skipped = restore(Path(archive), batch_size=options['batch_size'])
+            self.stdout.write(f'{archive}: {restored} restored, {skipped} already present')
+        self.stdout.write(self.style.SUCCESS('Restore finished.'))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jobs.async_worker import AsyncJobWorker
+from jobs.priority import ASYNC_QUEUE
+
+
+class Command(BaseCommand):
+    """Run I/O-bound jobs (JOB_ASYNC_JOB_TYPES) as coroutines in a single process."""
+    help = 'Run the asyncio job worker for the jobs.async queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'JOB_ASYNC_CONCURRENCY', 200),
+                            help='Jobs in flight at once (default: JOB_ASYNC_CONCURRENCY).')
+        parser.add_argument('--queues', default=ASYNC_QUEUE, help='Comma-separated queues to consume.')
+
+    def handle(self, *args, **options):
+        queues = options['queues'].split(',')
+        self.stdout.write(self.style.SUCCESS(
+            f"Async worker consuming {', '.join(queues)} with {options['concurrency']} jobs in flight"
+        ))
+        AsyncJobWorker(queues, options['concurrency']).run()
@@ -0,0 +1,40 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from jobs.outbox import relay
+
+
+class Command(BaseCommand):
+    """Publish task messages left in the outbox (broker errors, killed web processes, or all of them
+    when JOB_OUTBOX_PUBLISH_ON_COMMIT is off)."""
+    help = 'Drain the job outbox to the broker in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_DISPATCH_BATCH_SIZE,
+                            help='messages published per producer connection')
+        parser.add_argument('--interval', type=float, default=settings.JOB_OUTBOX_POLL_SECONDS,
+                            help='seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                try:
+                    published = relay(limit=options['batch_size'])
+                except Exception as exc:
+                    if options['once']:
+                        raise
+                    # Broker or database unavailable: the messages stay in the outbox for the next pass.
+                    self.stderr.write(f'[✗] Outbox relay failed, retrying: {exc}')
+                    close_old_connections()
+                    published = 0
+                total += published
+                if published < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Published {total} outbox message(s).'))
@@ -0,0 +1,42 @@
+import signal
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jobs.priority import priority_bands, queue_name
+
+
+class Command(BaseCommand):
+    """Start one Celery worker per priority band, sized by JOB_QUEUE_CONCURRENCY."""
+    help = 'Run a dedicated Celery worker for each job priority band.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bands', help='Comma-separated bands to run (default: all).')
+        parser.add_argument('--pool', default='prefork', help='Celery worker pool (default: prefork).')
+        parser.add_argument('--dry-run', action='store_true', help='Print the worker commands without running them.')
+
+    def worker_command(self, band, pool):
+        concurrency = settings.JOB_QUEUE_CONCURRENCY.get(band, 1)
+        return [
+            sys.executable, '-m', 'celery', '-A', 'job_system', 'worker',
+            '-Q', queue_name(band), '-c', str(concurrency), '-P', pool,
+            '-n', f'{band}@%h', '-l', 'info',
+        ]
+
+    def handle(self, *args, **options):
+        bands = options['bands'].split(',') if options['bands'] else list(priority_bands())
+        commands = [self.worker_command(band, options['pool']) for band in bands]
+        if options['dry_run']:
+            for command in commands:
+                self.stdout.write(' '.join(command))
+            return
+        workers = [subprocess.Popen(command) for command in commands]
+        self.stdout.write(self.style.SUCCESS(f"Started workers for: {', '.join(bands)}"))
+        try:
+            for worker in workers:
+                worker.wait()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.send_signal(signal.SIGTERM)
+            for worker in workers:
+                worker.wait()
@@ -0,0 +1,54 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from jobs.scheduler import next_due, overdue, run_due
+
+
+class Command(BaseCommand):
+    """Queue recurring and scheduled jobs as they fall due (instead of PeriodicTasks and eta tasks)."""
+    help = 'Run due interval and scheduled jobs in batches; several schedulers can run side by side.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_SCHEDULER_BATCH_SIZE,
+                            help='due jobs claimed per transaction')
+        parser.add_argument('--interval', type=float, default=settings.JOB_SCHEDULER_POLL_SECONDS,
+                            help='longest wait between checks for due jobs, in seconds')
+        parser.add_argument('--once', action='store_true', help='queue the jobs due now and exit')
+
+    def handle(self, *args, **options):
+        total = 0
+        # Runs missed while no scheduler was running go through the first passes, batch by batch.
+        late = overdue()
+        if late:
+            self.stdout.write(f'{late} job(s) missed runs; applying their misfire policies.')
+        try:
+            while True:
+                try:
+                    queued = run_due(limit=options['batch_size'])
+                except Exception as exc:
+                    if options['once']:
+                        raise
+                    # The due jobs keep their next_run_at and are picked up on the next pass.
+                    self.stderr.write(f'[✗] Scheduler pass failed, retrying: {exc}')
+                    close_old_connections()
+                    queued = 0
+                total += queued
+                if queued < options['batch_size']:
+                    if options['once']:
+                        break
+                    time.sleep(self.wait(options['interval']))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Queued {total} due job run(s).'))
+
+    def wait(self, interval):
+        """Sleep until the earliest next run, but never longer than interval (new jobs may be due sooner)."""
+        try:
+            due = next_due()
+        except Exception:
+            return interval
+        if due is None:
+            return interval
+        return min(interval, max(0.0, (due - timezone.now()).total_seconds()))
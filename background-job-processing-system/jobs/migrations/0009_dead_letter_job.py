@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0008_stored_object'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeadLetterJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(choices=[('send_email', 'Send Email'), ('process_image', 'Process Image'), ('generate_report', 'Generate Report'), ('backup_database', 'Backup Database'), ('fetch_data', 'Fetch Data'), ('batch_process', 'Batch Process'), ('send_notification', 'Send Notification'), ('cleanup_files', 'Cleanup Files'), ('upload_file', 'Upload File to S3')], max_length=50)),
+                ('exception', models.CharField(max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('requeued_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letters', to='jobs.job')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['requeued_at', 'job_type', 'created_at'], name='dead_letter_pending_idx')],
+            },
+        ),
+    ]
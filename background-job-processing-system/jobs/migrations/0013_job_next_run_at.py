@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0012_job_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['next_run_at'], name='job_next_run_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:46
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0014_job_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='misfire_max_runs',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='misfire_policy',
+            field=models.CharField(choices=[('run_once', 'Run once'), ('skip', 'Skip'), ('run_all', 'Run all')], default='run_once', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='missed_runs',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:56
+
+from django.db import migrations, models
+
+
+def route_beat_jobs_through_rearm(apps, schema_editor):
+    # Workers no longer run completed jobs again, so beat must make a recurring job pending before each run.
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(name__startswith='job-', task='jobs.tasks.execute_job_task').update(task='jobs.tasks.run_recurring_job_task')
+
+
+def route_beat_jobs_directly(apps, schema_editor):
+    PeriodicTask = apps.get_model('django_celery_beat', 'PeriodicTask')
+    PeriodicTask.objects.filter(name__startswith='job-', task='jobs.tasks.run_recurring_job_task').update(task='jobs.tasks.execute_job_task')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0015_job_misfire_policy'),
+        ('django_celery_beat', '0019_alter_periodictasks_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(route_beat_jobs_through_rearm, route_beat_jobs_directly),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0016_job_claim_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='dedupe_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
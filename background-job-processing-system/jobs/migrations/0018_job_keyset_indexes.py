@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0017_job_dedupe_fingerprint'),
+    ]
+
+    operations = [
+        # New indexes first, so the list never runs without one while the old ones are dropped.
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['-created_at', '-id'], name='job_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='job_status_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['job_type', '-created_at', '-id'], name='job_type_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['job_type', 'status', '-created_at', '-id'], name='job_type_status_created_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_status_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_type_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_type_status_created_idx',
+        ),
+    ]
@@ -1,5 +1,11 @@
-from django.db import models
-from typing import Any
+from django.conf import settings
+from django.core.validators import MinValueValidator
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from collections import Counter as StatusTally
+import uuid
+from typing import Any, Dict, List, Optional
 
 # --- Constants for Choices and Statuses ---
 JOB_TYPE_CHOICES = [
@@ -27,11 +33,70 @@ FREQUENCY_CHOICES = [
     ('hourly', 'Hourly'),
 ]
 
+# What the scheduler does with the runs of an interval job that fell due while it was not running
+# (see jobs/scheduler.py).
+MISFIRE_POLICY_CHOICES = [
+    ('run_once', 'Run once'),
+    ('skip', 'Skip'),
+    ('run_all', 'Run all'),
+]
+
 JOB_STATUS_PENDING = 'pending'
 JOB_STATUS_RUNNING = 'running'
 JOB_STATUS_COMPLETED = 'completed'
 JOB_STATUS_FAILED = 'failed'
 
+class JobBatch(models.Model):
+    """
+    A group of jobs created together (a bulk email, a batch_process run) and tracked as one.
+    Children reference it through Job.batch; completed and failed count their final outcomes and
+    are only changed with atomic F() updates, so any number of workers can report at once.
+    on_complete ({"job_type": ..., "parameters": {...}}) is run as a job once every child has finished.
+    """
+    total = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    on_complete = models.JSONField(null=True, blank=True)
+    callback_job = models.ForeignKey('Job', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Batch {self.id}: {self.completed + self.failed}/{self.total}"
+
+    @property
+    def pending(self) -> int:
+        return max(0, self.total - self.completed - self.failed)
+
+    @property
+    def status(self) -> str:
+        if self.finished_at is None:
+            return 'running'
+        return 'completed' if not self.failed else 'completed_with_failures'
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+            'type': 'batch_progress', 'batch_id': self.id, 'status': self.status, 'total': self.total,
+            'completed': self.completed, 'failed': self.failed, 'pending': self.pending,
+        }
+
+    @classmethod
+    def record(cls, batch_id, completed: int = 0, failed: int = 0) -> bool:
+        """Add child outcomes to the counters; True for the one call that finished the batch."""
+        with transaction.atomic():
+            cls.objects.filter(id=batch_id).update(completed=F('completed') + completed, failed=F('failed') + failed)
+            finished = cls.objects.filter(
+                id=batch_id, finished_at__isnull=True, total__lte=F('completed') + F('failed')
+            ).update(finished_at=timezone.now())
+        return bool(finished)
+
+    @classmethod
+    def reopen(cls, batch_id, failed: int) -> None:
+        """Take requeued dead-lettered children out of the failed count; the batch runs again."""
+        if batch_id is not None and failed:
+            cls.objects.filter(id=batch_id).update(failed=F('failed') - failed, finished_at=None)
+
+
 class Job(models.Model):
     """
     Model representing a background job of various types (email, file upload, etc).
@@ -49,6 +114,242 @@ class Job(models.Model):
     schedule_type = models.CharField(max_length=20, choices=SCHEDULE_TYPE_CHOICES, default='immediate')
     scheduled_time = models.DateTimeField(null=True, blank=True)
     frequency = models.CharField(choices=FREQUENCY_CHOICES, blank=True, null=True, default='daily')
+    # Next run of an interval job; the index is the scheduler's queue (see jobs/scheduler.py).
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    # Bumped when the job is rescheduled or retried; messages for older versions are dropped (jobs/cancellation.py).
+    version = models.PositiveIntegerField(default=0)
+    # Set while a failed job waits for its automatic retry; only then may a worker claim a failed job.
+    retry_at = models.DateTimeField(null=True, blank=True)
+    # A running job whose lease has expired was left behind by a dead worker and can be claimed again (jobs/lease.py).
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    misfire_policy = models.CharField(max_length=10, choices=MISFIRE_POLICY_CHOICES, default='run_once')
+    # Most missed runs replayed under run_all (JOB_MISFIRE_MAX_RUNS when unset); missed_runs are still to go.
+    misfire_max_runs = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(1)])
+    missed_runs = models.PositiveIntegerField(default=0)
+    batch = models.ForeignKey(JobBatch, null=True, blank=True, on_delete=models.SET_NULL, related_name='jobs')
+    # Set for jobs created under an Idempotency-Key (or content dedupe); see jobs/idempotency.py.
+    dedupe_key = models.CharField(max_length=80, unique=True, null=True, blank=True)
+    dedupe_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+
+    class Meta:
+        # Composite indexes matching the list/filter/order access patterns of JobViewSet.
+        indexes = [
+            # id breaks created_at ties, so keyset pages (jobs/pagination.py) are one range scan each.
+            models.Index(fields=['-created_at', '-id'], name='job_created_id_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='job_status_created_id_idx'),
+            models.Index(fields=['job_type', '-created_at', '-id'], name='job_type_created_id_idx'),
+            models.Index(fields=['job_type', 'status', '-created_at', '-id'], name='job_type_status_created_id_idx'),
+            models.Index(fields=['priority', 'created_at'], name='job_priority_created_idx'),
+            models.Index(fields=['next_run_at'], name='job_next_run_idx'),
+        ]
 
     def __str__(self) -> str:
         return f"{self.job_type} (Priority: {self.priority})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted status so save() can keep the status counters in step.
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def save(self, *args, **kwargs) -> None:
+        if not JobStatusCounter.enabled():
+            if self.dedupe_key and self._state.adding:
+                # Savepoint: a duplicate dedupe_key must not break the caller's transaction.
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            super().save(*args, **kwargs)
+            return
+        previous_status = getattr(self, '_loaded_status', None)
+        if not self._state.adding and previous_status is None:
+            # Status was deferred when loaded, so the transition is unknown; reconcile_job_counters fixes drift.
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            JobStatusCounter.record_transition(previous_status, self.status)
+        self._loaded_status = self.status
+
+    @classmethod
+    def transition(cls, job_id, from_status: str, to_status: str, condition: Optional[Q] = None, **fields: Any) -> bool:
+        """
+        Move a job from from_status to to_status with one conditional UPDATE that writes only the
+        status, updated_at and the given fields. Returns False when the job is gone or no longer in
+        from_status (e.g. another worker already claimed it) or does not match condition, in which
+        case nothing is written.
+        """
+        with transaction.atomic():
+            updated = cls.objects.filter(condition or Q(), id=job_id, status=from_status).update(
+                status=to_status, updated_at=timezone.now(), **fields
+            )
+            if updated:
+                JobStatusCounter.record_transition(from_status, to_status)
+        return bool(updated)
+
+    def delete(self, *args, **kwargs):
+        if not JobStatusCounter.enabled():
+            return super().delete(*args, **kwargs)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            JobStatusCounter.record_transition(getattr(self, '_loaded_status', self.status), None)
+        return result
+
+
+class JobStatusCounter(models.Model):
+    """
+    Incrementally maintained number of jobs per status.
+    Enabled with JOB_STATS_USE_COUNTERS so /api/jobs/stats/ reads a handful of rows instead of scanning jobs.
+    """
+    status = models.CharField(max_length=20, unique=True)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.status}: {self.count}"
+
+    @staticmethod
+    def enabled() -> bool:
+        return getattr(settings, 'JOB_STATS_USE_COUNTERS', False)
+
+    @classmethod
+    def adjust(cls, status: str, delta: int) -> None:
+        """Atomically add delta to the counter for status, creating the row on first use."""
+        if not cls.objects.filter(status=status).update(count=F('count') + delta):
+            cls.objects.get_or_create(status=status)
+            cls.objects.filter(status=status).update(count=F('count') + delta)
+
+    @classmethod
+    def record_transition(cls, from_status: str, to_status: str, count: int = 1) -> None:
+        """Move count jobs from one status to another; None means the job was created or deleted."""
+        if not cls.enabled() or from_status == to_status or not count:
+            return
+        with transaction.atomic():
+            if from_status:
+                cls.adjust(from_status, -count)
+            if to_status:
+                cls.adjust(to_status, count)
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, int]:
+        return dict(cls.objects.values_list('status', 'count'))
+
+    @classmethod
+    def reconcile(cls) -> Dict[str, int]:
+        """Recompute every counter from the jobs table and return the corrected counts."""
+        with transaction.atomic():
+            # Lock the counters first so concurrent transitions queue up behind the recount.
+            list(cls.objects.select_for_update())
+            counts = job_status_counts()
+            cls.objects.exclude(status__in=counts.keys()).update(count=0)
+            for status, count in counts.items():
+                cls.objects.update_or_create(status=status, defaults={'count': count})
+        return counts
+
+
+class StoredObject(models.Model):
+    """
+    Dedupe index of uploaded content: one row per SHA-256 already present in the bucket.
+    upload_file jobs whose content is listed here finish without transferring anything.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    object_key = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.object_key
+
+    @classmethod
+    def record(cls, sha256: str, object_key: str, size: int) -> 'StoredObject':
+        return cls.objects.get_or_create(sha256=sha256, defaults={'object_key': object_key, 'size': size})[0]
+
+
+class DeadLetterJob(models.Model):
+    """
+    A job that failed for good: out of retries, failed with an error its retry policy does not
+    retry, or failed permanently with JobFailed.
+    requeued_at is set once the job has been sent back to the queue (manage.py requeue_dead_jobs).
+    """
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='dead_letters')
+    job_type = models.CharField(max_length=50, choices=JOB_TYPE_CHOICES)
+    exception = models.CharField(max_length=255)
+    error = models.TextField(blank=True)
+    attempts = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    requeued_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['requeued_at', 'job_type', 'created_at'], name='dead_letter_pending_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.job_type} job {self.job_id}: {self.exception}"
+
+    @classmethod
+    def record(cls, job: Job, exc: BaseException) -> 'DeadLetterJob':
+        return cls.objects.create(
+            job_id=job.id, job_type=job.job_type, attempts=job.retries,
+            exception=f"{type(exc).__module__}.{type(exc).__qualname__}"[:255], error=str(exc),
+        )
+
+
+class OutboxMessage(models.Model):
+    """
+    A task message written in the same transaction as the job it runs, published after commit
+    (see jobs/outbox.py). Rows are deleted once published.
+    """
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    options = models.JSONField(default=dict)  # queue, priority and eta (ISO 8601)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return f"{self.task}{tuple(self.args)}"
+
+
+def job_status_counts(jobs=None) -> Dict[str, int]:
+    """Count jobs (all, or the given queryset) per status with a single GROUP BY query."""
+    rows = (Job.objects.all() if jobs is None else jobs).order_by().values('status').annotate(count=Count('id'))
+    return {row['status']: row['count'] for row in rows}
+
+
+def bulk_create_jobs(jobs: List[Job]) -> List[Job]:
+    """Insert many unsaved jobs in chunks inside one transaction and return them with primary keys set."""
+    batch_size = getattr(settings, 'JOB_BULK_CREATE_BATCH_SIZE', 1000)
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            created = Job.objects.bulk_create(jobs, batch_size=batch_size)
+        else:
+            created = bulk_create_and_fetch_ids(jobs, batch_size)
+        for status, count in StatusTally(job.status for job in created).items():
+            JobStatusCounter.record_transition(None, status, count)
+    for job in created:
+        job._loaded_status = job.status
+    return created
+
+
+def bulk_create_and_fetch_ids(jobs: List[Job], batch_size: int) -> List[Job]:
+    """
+    bulk_create for backends that do not return primary keys from bulk inserts (MySQL), while
+    dispatch needs them: every job is inserted with a unique dedupe_key (its own, or a temporary
+    marker) and the ids are read back by it. Ids are not assumed to be contiguous.
+    """
+    marker = f'bulk:{uuid.uuid4().hex}:'
+    temporary = [job for job in jobs if job.dedupe_key is None]
+    for index, job in enumerate(temporary):
+        job.dedupe_key = f'{marker}{index}'
+    created = Job.objects.bulk_create(jobs, batch_size=batch_size)
+    keys = [job.dedupe_key for job in created]
+    ids = {}
+    for start in range(0, len(keys), batch_size):
+        ids.update(Job.objects.filter(dedupe_key__in=keys[start:start + batch_size]).values_list('dedupe_key', 'id'))
+    for job in created:
+        job.id = ids[job.dedupe_key]
+    if temporary:
+        Job.objects.filter(dedupe_key__startswith=marker).update(dedupe_key=None)
+        for job in temporary:
+            job.dedupe_key = None
+    return created
@@ -0,0 +1,78 @@
+"""
+Transactional outbox for task messages.
+
+Publishing straight after saving a job has two failure modes: a worker can receive the task
+before the job row is committed (Job.DoesNotExist), and a broker error after the commit loses the
+job for good. Instead, the tasks for new jobs are written to the OutboxMessage table in the same
+transaction as the jobs, so either both exist or neither does.
+
+After the transaction commits, the web process publishes its own messages right away (unless
+JOB_OUTBOX_PUBLISH_ON_COMMIT is off). Whatever that misses (broker down, process killed) is
+published by the relay (manage.py run_outbox_relay), which drains the table in batches of
+JOB_DISPATCH_BATCH_SIZE over a single producer connection. A message is deleted only in the
+transaction that published it, so it is delivered at least once; claim_job makes a duplicate
+delivery harmless.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxMessage
+
+
+def enqueue(signatures: Iterable) -> List[OutboxMessage]:
+    """Store the task signatures in the outbox as part of the current transaction."""
+    messages = OutboxMessage.objects.bulk_create([message_for(signature) for signature in signatures])
+    if messages and getattr(settings, 'JOB_OUTBOX_PUBLISH_ON_COMMIT', True):
+        ids = [message.id for message in messages if message.id is not None]
+        # Without primary keys from the bulk insert (MySQL), publish the oldest pending messages instead.
+        transaction.on_commit(lambda: publish_after_commit(ids or None, len(messages)))
+    return messages
+
+
+def message_for(signature) -> OutboxMessage:
+    options = {key: value for key, value in signature.options.items() if key in ('queue', 'priority')}
+    eta = signature.options.get('eta')
+    if signature.options.get('countdown') is not None:
+        eta = timezone.now() + timedelta(seconds=signature.options['countdown'])
+    if eta is not None:
+        options['eta'] = eta.isoformat()
+    return OutboxMessage(task=signature.task, args=list(signature.args), kwargs=dict(signature.kwargs), options=options)
+
+
+def publish_after_commit(ids: Optional[List[int]], count: int) -> None:
+    try:
+        relay(ids=ids, limit=count)
+    except Exception as exc:
+        # The messages stay in the outbox; the relay publishes them.
+        print(f"[✗] Could not publish {count} outbox message(s), leaving them to the relay: {exc}")
+
+
+def relay(ids: Optional[List[int]] = None, limit: Optional[int] = None) -> int:
+    """Publish up to limit pending messages (only the given ids, if any) and delete them; returns the count."""
+    limit = limit or getattr(settings, 'JOB_DISPATCH_BATCH_SIZE', 500)
+    with transaction.atomic():
+        # Rows another relay (or web process) is publishing are skipped, not waited on.
+        pending = OutboxMessage.objects.select_for_update(skip_locked=True).order_by('id')
+        if ids is not None:
+            pending = pending.filter(id__in=ids)
+        messages = list(pending[:limit])
+        if not messages:
+            return 0
+        publish(messages)
+        OutboxMessage.objects.filter(id__in=[message.id for message in messages]).delete()
+    return len(messages)
+
+
+def publish(messages: List[OutboxMessage]) -> None:
+    """Send every message over one producer connection instead of one broker round-trip each."""
+    with current_app.producer_or_acquire() as producer:
+        for message in messages:
+            options = dict(message.options)
+            if options.get('eta'):
+                options['eta'] = datetime.fromisoformat(options['eta'])
+            if message.kwargs:
+                options['kwargs'] = message.kwargs
+            current_app.tasks[message.task].apply_async(args=message.args, producer=producer, **options)
@@ -0,0 +1,109 @@
+import base64
+from collections import OrderedDict
+from urllib import parse
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class JobPagination(PageNumberPagination):
+    """
+    Page-number pagination with a client-selectable page_size and an opt-in keyset mode.
+
+    Passing ``?cursor=`` (empty for the first page) switches to keyset pagination on
+    (created_at, id) descending: each page is a range scan of a (created_at, id) index (prefixed
+    with status and/or job_type when the list is filtered) from the cursor position, so deep pages
+    cost the same as page 1 and no COUNT(*) is issued unless ``include_count=true``.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'JOB_LIST_MAX_PAGE_SIZE', 100)
+    cursor_query_param = 'cursor'
+    count_query_param = 'include_count'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_keyset(queryset, request)
+
+    def paginate_keyset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true'):
+            self.count = queryset.count()
+
+        results = list(self.keyset_queryset(queryset, position, reverse)[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results:
+            if has_more or reverse:
+                self.next_position = results[-1]
+            if position is not None and (has_more or not reverse):
+                self.previous_position = results[0]
+        return results
+
+    def keyset_queryset(self, queryset, position, reverse):
+        """The jobs after position (before it when reverse), in page order."""
+        if position is None:
+            return queryset.order_by('-created_at', '-id')
+        created_at, pk = position
+        if reverse:
+            # One range on created_at (the index's leading column) minus the rows at the cursor's
+            # own timestamp that were already shown. An OR of the two conditions is not a range,
+            # and makes the planner merge index scans and sort the result instead.
+            return queryset.filter(created_at__gte=created_at).exclude(
+                created_at=created_at, id__lte=pk
+            ).order_by('created_at', 'id')
+        return queryset.filter(created_at__lte=created_at).exclude(
+            created_at=created_at, id__gte=pk
+        ).order_by('-created_at', '-id')
+
+    def decode_cursor(self, cursor):
+        """Return ((created_at, id), reverse) for a cursor, or (None, False) for the first page."""
+        if not cursor:
+            return None, False
+        try:
+            decoded = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+            fields = parse.parse_qs(decoded, strict_parsing=True)
+            created_at = parse_datetime(fields['p'][0])
+            pk = int(fields['i'][0])
+            reverse = fields.get('r', ['0'])[0] == '1'
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (created_at, pk), reverse
+
+    def encode_cursor(self, job, reverse):
+        fields = {'p': job.created_at.isoformat(), 'i': job.id}
+        if reverse:
+            fields['r'] = '1'
+        return base64.urlsafe_b64encode(parse.urlencode(fields).encode('ascii')).decode('ascii')
+
+    def get_cursor_link(self, job, reverse):
+        if job is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(remove_query_param(url, 'page'), self.cursor_query_param, self.encode_cursor(job, reverse))
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_cursor_link(self.next_position, reverse=False)
+        payload['previous'] = self.get_cursor_link(self.previous_position, reverse=True)
+        payload['results'] = data
+        return Response(payload)
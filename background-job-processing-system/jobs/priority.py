@@ -0,0 +1,52 @@
+"""
+Priority routing for job tasks.
+
+Job.priority runs from 1 (lowest) to 10 (highest). Each job's task is published to the queue of
+its priority band (JOB_PRIORITY_BANDS), so workers dedicated to the high band keep urgent jobs
+moving while a low-priority backlog drains elsewhere. The task also carries a broker priority so
+jobs sharing a queue are ordered by priority too.
+
+Job types listed in JOB_ASYNC_JOB_TYPES go to the jobs.async queue instead, which is consumed by
+the asyncio worker (manage.py run_async_worker); they keep their broker priority there.
+"""
+from typing import Any, Dict, List
+from django.conf import settings
+
+MIN_PRIORITY = 1
+MAX_PRIORITY = 10
+QUEUE_PREFIX = 'jobs.'
+ASYNC_QUEUE = 'jobs.async'
+
+
+def priority_bands() -> Dict[str, int]:
+    """Band name -> lowest job priority routed to it, highest band first."""
+    bands = getattr(settings, 'JOB_PRIORITY_BANDS', {'high': 8, 'default': 4, 'low': 1})
+    return dict(sorted(bands.items(), key=lambda item: -item[1]))
+
+
+def queue_name(band: str) -> str:
+    return f'{QUEUE_PREFIX}{band}'
+
+
+def priority_queues() -> List[str]:
+    return [queue_name(band) for band in priority_bands()]
+
+
+def priority_band(priority: int) -> str:
+    bands = priority_bands()
+    for band, minimum in bands.items():
+        if priority >= minimum:
+            return band
+    return list(bands)[-1]
+
+
+def broker_priority(priority: int) -> int:
+    """Map job priority 10..1 onto the Redis transport's levels, where 0 is consumed first and 9 last."""
+    return MAX_PRIORITY - min(max(priority, MIN_PRIORITY), MAX_PRIORITY)
+
+
+def route_options(priority: int, job_type: str = None) -> Dict[str, Any]:
+    """apply_async/signature options that route the task for a job of this priority (and type)."""
+    if job_type and job_type in getattr(settings, 'JOB_ASYNC_JOB_TYPES', ()):
+        return {'queue': ASYNC_QUEUE, 'priority': broker_priority(priority)}
+    return {'queue': queue_name(priority_band(priority)), 'priority': broker_priority(priority)}
@@ -0,0 +1,127 @@
+"""
+Incremental progress reporting for long-running jobs.
+
+A handler reports how far it has got through the reporter of the job it is running:
+
+    from jobs.progress import current_progress
+
+    def my_job(params):
+        progress = current_progress()
+        progress.update(total=len(items), step='loading')
+        for item in items:
+            handle(item)
+            progress.advance()
+
+Reports are throttled to one write per JOB_PROGRESS_INTERVAL_MS per job (the first and the final
+one are always written). Each write goes to a Redis hash (jobs:progress:<id>, kept for
+JOB_PROGRESS_TTL seconds) and to the job's WebSocket subscribers as a "running" update carrying a
+"progress" object, never to the Job row, so reporting costs no database writes at all.
+GET /api/jobs/<id>/progress/ returns the latest report with the job's status.
+
+Outside a job (tests, shell) current_progress() returns a reporter that discards everything.
+"""
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from django.conf import settings
+from redis.exceptions import RedisError
+from .broadcast import broadcaster
+from .redis_utils import get_redis
+
+
+def progress_key(job_id) -> str:
+    return f'jobs:progress:{job_id}'
+
+
+class ProgressReporter:
+    """Tracks one job's progress and publishes it at most once per JOB_PROGRESS_INTERVAL_MS."""
+
+    def __init__(self, job_id=None, job_type: Optional[str] = None):
+        self.job_id = job_id
+        self.job_type = job_type
+        self.done = 0
+        self.total: Optional[int] = None
+        self.step: Optional[str] = None
+        self.started = time.monotonic()
+        self.written_at: Optional[float] = None
+
+    def update(self, done: Optional[int] = None, total: Optional[int] = None, step: Optional[str] = None) -> None:
+        """Set any of the items done, the total and the current step, then report if due."""
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if step is not None:
+            self.step = step
+        self.report()
+
+    def advance(self, count: int = 1, step: Optional[str] = None) -> None:
+        self.update(done=self.done + count, step=step)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        percent = None
+        if self.total:
+            percent = round(min(100.0, 100.0 * self.done / self.total), 1)
+        eta = None
+        if self.total and rate > 0:
+            eta = round(max(0, self.total - self.done) / rate, 1)
+        return {
+            'done': self.done, 'total': self.total, 'percent': percent, 'step': self.step,
+            'rate': round(rate, 2), 'eta_seconds': eta, 'updated_at': time.time(),
+        }
+
+    def report(self, force: bool = False) -> None:
+        if self.job_id is None:
+            return
+        interval = getattr(settings, 'JOB_PROGRESS_INTERVAL_MS', 500) / 1000
+        finished = self.total is not None and self.done >= self.total
+        now = time.monotonic()
+        if not (force or finished or self.written_at is None or now - self.written_at >= interval):
+            return
+        self.written_at = now
+        snapshot = self.snapshot()
+        try:
+            with get_redis().pipeline(transaction=False) as pipe:
+                pipe.hset(progress_key(self.job_id), mapping={key: json.dumps(value) for key, value in snapshot.items()})
+                pipe.expire(progress_key(self.job_id), getattr(settings, 'JOB_PROGRESS_TTL', 3600))
+                pipe.execute()
+        except RedisError as exc:
+            print(f"[✗] Could not store progress of job {self.job_id}: {exc}")
+        # Coalesced with the job's other status updates; the final status update supersedes it.
+        broadcaster.publish({'id': self.job_id, 'job_type': self.job_type, 'status': 'running', 'result': None, 'progress': snapshot})
+
+
+_current: ContextVar[Optional[ProgressReporter]] = ContextVar('job_progress', default=None)
+
+
+def current_progress() -> ProgressReporter:
+    """The reporter of the job running in this context (a discarding one outside jobs)."""
+    return _current.get() or ProgressReporter()
+
+
+@contextmanager
+def tracking(job_id, job_type: Optional[str] = None):
+    """Make a reporter for job_id the current one while the job's handler runs."""
+    token = _current.set(ProgressReporter(job_id, job_type) if job_id is not None else None)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def run_tracked(func, params, job_id, job_type):
+    """Run func(params) with job_id's reporter current; picklable for the CPU process pool."""
+    with tracking(job_id, job_type):
+        return func(params)
+
+
+def read_progress(job_id) -> Optional[Dict[str, Any]]:
+    """The latest progress report stored for job_id, or None."""
+    raw = get_redis().hgetall(progress_key(job_id))
+    if not raw:
+        return None
+    return {key.decode(): json.loads(value) for key, value in raw.items()}
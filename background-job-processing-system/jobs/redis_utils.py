@@ -0,0 +1,15 @@
+import os
+from functools import lru_cache
+import redis
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def _build_redis(pid: int) -> redis.Redis:
+    # Keyed by pid so forked workers open their own connections.
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+def get_redis() -> redis.Redis:
+    """Return this process's Redis client for the jobs app's own keys."""
+    return _build_redis(os.getpid())
@@ -0,0 +1,148 @@
+"""
+Retention of finished jobs and Celery task results.
+
+Job rows were never purged, and the django-db result backend adds a TaskResult row for every
+execution, so both tables (and every list, stats query and index over them) grew without bound.
+manage.py archive_jobs moves completed and failed jobs older than the retention of their status
+(JOB_RETENTION_DAYS, e.g. "completed:30,failed:90") out of the database, into a gzipped JSON Lines
+file under JOB_ARCHIVE_DIR, in batches of JOB_ARCHIVE_BATCH_SIZE jobs (with their dead letters) per
+transaction. It also deletes TaskResult rows older than JOB_TASK_RESULT_RETENTION_DAYS, which
+only duplicate what the jobs record. manage.py restore_jobs loads archived jobs back.
+
+Archives use Django's jsonl serialization (so `manage.py loaddata` reads them too). Each batch is
+appended and synced to disk before its rows are deleted, so a crash can archive a batch twice but
+never lose one; restoring skips rows that already exist. Recurring jobs and jobs that still have
+a next run or a retry due are never archived, and only completed and failed jobs can be given a
+retention.
+"""
+import gzip
+import os
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+from .models import JOB_STATUS_COMPLETED, JOB_STATUS_FAILED, DeadLetterJob, Job, JobBatch, JobStatusCounter
+
+FINISHED = (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED)
+
+
+def retention_days() -> Dict[str, int]:
+    """Days a finished job is kept, per status; statuses not listed are kept forever."""
+    days = getattr(settings, 'JOB_RETENTION_DAYS', {JOB_STATUS_COMPLETED: 30, JOB_STATUS_FAILED: 90})
+    unfinished = sorted(set(days) - set(FINISHED))
+    if unfinished:
+        raise ValueError(f"JOB_RETENTION_DAYS only applies to {' and '.join(FINISHED)} jobs, not: {', '.join(unfinished)}")
+    return days
+
+
+def archive_path(now: Optional[datetime] = None) -> Path:
+    now = now or timezone.now()
+    return Path(getattr(settings, 'JOB_ARCHIVE_DIR', 'archive')) / f'jobs-{now:%Y%m%dT%H%M%S}.jsonl.gz'
+
+
+def expired_jobs(status: str, before: datetime):
+    # A job finished before the cutoff was also created before it, so the (status, created_at) index narrows the scan.
+    return Job.objects.filter(
+        status=status, created_at__lt=before, updated_at__lt=before, next_run_at__isnull=True, retry_at__isnull=True,
+    ).exclude(schedule_type='interval')  # beat-driven and unscheduled interval jobs have no next_run_at either
+
+
+def append(path: Path, objects: Iterable) -> None:
+    """Append objects to the archive as a new gzip member and sync it to disk."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+            archive.write(serializers.serialize('jsonl', objects).encode())
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def archive_jobs(path: Path, status: str, before: datetime, batch_size: Optional[int] = None) -> int:
+    """Move jobs with status that finished before the cutoff into the archive at path; returns how many."""
+    batch_size = batch_size or getattr(settings, 'JOB_ARCHIVE_BATCH_SIZE', 1000)
+    archived, last_id = 0, 0
+    while True:
+        with transaction.atomic():
+            # Rows locked by a worker or another archiver are left for the next run.
+            jobs = list(expired_jobs(status, before).select_for_update(skip_locked=True).filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not jobs:
+                return archived
+            ids = [job.id for job in jobs]
+            # Jobs first, so a restore inserts them before the dead letters pointing at them.
+            append(path, jobs + list(DeadLetterJob.objects.filter(job_id__in=ids).order_by('id')))
+            Job.objects.filter(id__in=ids).delete()
+            JobStatusCounter.record_transition(status, None, count=len(ids))
+        archived += len(ids)
+        last_id = ids[-1]
+
+
+def purge_task_results(before: datetime, batch_size: Optional[int] = None) -> int:
+    """Delete Celery TaskResult rows finished before the cutoff in batches; returns how many."""
+    batch_size = batch_size or getattr(settings, 'JOB_ARCHIVE_BATCH_SIZE', 1000)
+    purged = 0
+    while True:
+        ids = list(TaskResult.objects.filter(date_done__lt=before).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return purged
+        purged += TaskResult.objects.filter(id__in=ids).delete()[0]
+
+
+def apply_retention(path: Optional[Path] = None, now: Optional[datetime] = None, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Archive expired jobs of every status with a retention and purge old task results; returns the counts."""
+    now = now or timezone.now()
+    path = path or archive_path(now)
+    counts = {
+        status: archive_jobs(path, status, now - timedelta(days=days), batch_size)
+        for status, days in sorted(retention_days().items())
+    }
+    result_days = getattr(settings, 'JOB_TASK_RESULT_RETENTION_DAYS', 7)
+    if result_days:
+        counts['task_results'] = purge_task_results(now - timedelta(days=result_days), batch_size)
+    return counts
+
+
+def restore(path: Path, batch_size: Optional[int] = None) -> Tuple[int, int]:
+    """Load the jobs and dead letters of an archive back; returns (restored, skipped as already present)."""
+    batch_size = batch_size or getattr(settings, 'JOB_ARCHIVE_BATCH_SIZE', 1000)
+    restored = skipped = 0
+    with gzip.open(path, 'rt') as archive:
+        objects = serializers.deserialize('jsonl', archive)
+        while True:
+            chunk = list(islice(objects, batch_size))
+            if not chunk:
+                return restored, skipped
+            with transaction.atomic():
+                count = restore_chunk(chunk)
+            restored += count
+            skipped += len(chunk) - count
+
+
+def restore_chunk(chunk: List) -> int:
+    existing = set()
+    for model in {item.object.__class__ for item in chunk}:
+        pks = [item.object.pk for item in chunk if isinstance(item.object, model)]
+        existing |= {(model, pk) for pk in model.objects.filter(pk__in=pks).values_list('pk', flat=True)}
+    jobs = [item.object for item in chunk if isinstance(item.object, Job)]
+    batches = set(JobBatch.objects.filter(id__in={job.batch_id for job in jobs if job.batch_id}).values_list('id', flat=True))
+    restored, statuses = 0, {}
+    for item in chunk:
+        obj = item.object
+        if (obj.__class__, obj.pk) in existing:
+            continue
+        if isinstance(obj, Job):
+            if obj.batch_id not in batches:
+                obj.batch_id = None
+            # Dedupe keys expire long before jobs are archived, and a new job may hold the same one now.
+            obj.dedupe_key = obj.dedupe_fingerprint = None
+            statuses[obj.status] = statuses.get(obj.status, 0) + 1
+        # A raw save keeps the archived created_at and updated_at (to the millisecond, as serialized).
+        item.save()
+        restored += 1
+    for status, count in statuses.items():
+        JobStatusCounter.record_transition(None, status, count=count)
+    return restored
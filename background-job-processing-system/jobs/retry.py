@@ -0,0 +1,59 @@
+"""
+Retry policy for jobs whose handler raised.
+
+A job is retried until it has failed Job.max_retries + 1 times. Each retry waits a random delay
+between 0 and min(max_delay, base_delay * 2 ** (attempt - 1)) seconds ("full jitter"), so jobs
+that failed together (an SMTP outage, a flaky API) come back spread out instead of in waves.
+
+Handlers can declare which exceptions are worth retrying (retry_on) and which never are
+(give_up_on) when they register; the delays come from JOB_RETRY_BASE_DELAY / JOB_RETRY_MAX_DELAY,
+overridden per job type by JOB_TYPE_RETRY_BACKOFF ("fetch_data:5/600" = base 5 s, cap 600 s).
+
+A job that is out of retries, or fails with an error that is not retried, is recorded in the
+dead-letter table (DeadLetterJob) and can be requeued in bulk with manage.py requeue_dead_jobs.
+JobFailed is a deliberate outcome of the handler, not an error, and never reaches the policy.
+"""
+import random
+from dataclasses import dataclass, replace
+from typing import Optional, Tuple, Type
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    base_delay: Optional[float] = None  # None: JOB_RETRY_BASE_DELAY
+    max_delay: Optional[float] = None  # None: JOB_RETRY_MAX_DELAY
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,)
+    give_up_on: Tuple[Type[BaseException], ...] = ()
+
+    def retryable(self, exc: BaseException) -> bool:
+        return isinstance(exc, self.retry_on) and not isinstance(exc, self.give_up_on)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number attempt (1 for the first retry)."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return round(random.uniform(0, ceiling), 3)
+
+    def next_delay(self, exc: BaseException, attempt: int, max_retries: int) -> Optional[float]:
+        """Countdown before retrying after failure number attempt, or None to give up."""
+        if attempt > max_retries or not self.retryable(exc):
+            return None
+        return self.backoff(attempt)
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+def resolve(policy: Optional[RetryPolicy], job_type: str) -> RetryPolicy:
+    """Fill in the delays a policy leaves unset from settings (per job type first)."""
+    policy = policy or DEFAULT_POLICY
+    backoff = getattr(settings, 'JOB_TYPE_RETRY_BACKOFF', {}).get(job_type)
+    base, cap = getattr(settings, 'JOB_RETRY_BASE_DELAY', 2.0), getattr(settings, 'JOB_RETRY_MAX_DELAY', 300.0)
+    if backoff:
+        # "job_type:base" without "/cap" keeps the global cap.
+        base, cap = backoff[0], backoff[1] if len(backoff) > 1 else cap
+    return replace(
+        policy,
+        base_delay=base if backoff or policy.base_delay is None else policy.base_delay,
+        max_delay=cap if backoff or policy.max_delay is None else policy.max_delay,
+    )
@@ -2,6 +2,15 @@ from django.urls import re_path
 from . import consumers
 
 # WebSocket URL patterns for job status updates
+# - ws/jobs/status/                      every update (or filtered with ?job_id=&job_type=&status=)
+# - ws/jobs/<id>/status/                 updates for one job
+# - ws/jobs/type/<job_type>/status/      updates for one job type
+# - ws/jobs/status/<status>/             updates entering one status
+# - ws/jobs/batch/<id>/status/           progress events of one job batch
 websocket_urlpatterns = [
     re_path(r'ws/jobs/status/$', consumers.JobStatusConsumer.as_asgi()),
+    re_path(r'ws/jobs/(?P<job_id>\d+)/status/$', consumers.JobStatusConsumer.as_asgi()),
+    re_path(r'ws/jobs/type/(?P<job_type>\w+)/status/$', consumers.JobStatusConsumer.as_asgi()),
+    re_path(r'ws/jobs/status/(?P<status>\w+)/$', consumers.JobStatusConsumer.as_asgi()),
+    re_path(r'ws/jobs/batch/(?P<batch_id>\d+)/status/$', consumers.JobStatusConsumer.as_asgi()),
 ]
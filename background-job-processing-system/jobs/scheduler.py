@@ -0,0 +1,194 @@
+"""
+Scheduler for recurring (interval) jobs and delayed store for scheduled jobs.
+
+django-celery-beat's DatabaseScheduler keeps one PeriodicTask (plus CrontabSchedule and
+ClockedSchedule rows) per recurring job and reloads and re-evaluates all of them, so beat gets
+slower and bigger with every recurring job. Instead, each interval job stores its next run in
+Job.next_run_at. The index on that column is the scheduler's priority queue: finding what is due
+is a range scan from the oldest entry, whatever the number of recurring jobs.
+
+Scheduled (one-off) jobs wait in the same column until scheduled_time rather than as eta tasks,
+which Redis-broker workers prefetch and hold in memory until due (and which a reschedule could
+not take back). Rescheduling one is a single indexed update.
+
+manage.py run_scheduler claims due jobs in batches of JOB_SCHEDULER_BATCH_SIZE with
+SELECT ... FOR UPDATE SKIP LOCKED, moves interval jobs to their next run (and clears it for
+scheduled jobs) and queues their tasks through the outbox in the same transaction. Any number of
+scheduler processes can run side by side; each batch is claimed by exactly one of them.
+
+Runs of an interval job that fell due while no scheduler was running (or while it lagged) are
+handled by the job's misfire_policy when it is next claimed, so recovery after an outage is
+bounded by the batch size rather than by the length of the outage:
+
+- run_once (default): the missed runs are coalesced into one run.
+- skip: missed runs are dropped; the job runs only if its latest run is less than
+  JOB_MISFIRE_GRACE_SECONDS late.
+- run_all: every missed run is replayed, up to misfire_max_runs (JOB_MISFIRE_MAX_RUNS). Replays
+  are queued one at a time, at least JOB_MISFIRE_CATCHUP_SECONDS apart and never while the job is
+  running, so they neither pile up in the broker nor race each other for claim_job.
+
+JOB_RECURRING_SCHEDULER=beat keeps the old behavior (one PeriodicTask per job) for new jobs;
+manage.py adopt_beat_jobs moves existing PeriodicTask jobs onto this scheduler.
+"""
+import calendar
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import JOB_STATUS_COMPLETED, JOB_STATUS_FAILED, JOB_STATUS_PENDING, JOB_STATUS_RUNNING, Job, JobStatusCounter
+from .dispatch import job_signature, job_signatures
+from .outbox import enqueue
+
+PERIODS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+MONTHS = {'monthly': 1, 'yearly': 12}
+
+
+def add_months(moment: datetime, months: int) -> datetime:
+    """moment shifted by whole months, clamped to the end of shorter months (Jan 31 -> Feb 28)."""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+
+def next_run_after(frequency: str, anchor: datetime, after: datetime) -> datetime:
+    """The first run of a job recurring at frequency from anchor that is later than after."""
+    if anchor > after:
+        return anchor
+    if frequency in PERIODS:
+        period = PERIODS[frequency]
+        return anchor + period * ((after - anchor) // period + 1)
+    if frequency in MONTHS:
+        step = MONTHS[frequency]
+        months = (after.year - anchor.year) * 12 + after.month - anchor.month
+        months -= months % step
+        # Counted from the anchor every time so a clamped month does not shift later runs.
+        while add_months(anchor, months) <= after:
+            months += step
+        return add_months(anchor, months)
+    raise ValueError(f"Unsupported schedule type: {frequency}")
+
+
+def runs_until(frequency: str, anchor: datetime, moment: datetime) -> Tuple[int, Optional[datetime]]:
+    """How many runs of a job recurring at frequency from anchor fell at or before moment, and the latest of them."""
+    if moment < anchor:
+        return 0, None
+    if frequency in PERIODS:
+        period = PERIODS[frequency]
+        count = (moment - anchor) // period + 1
+        return count, anchor + period * (count - 1)
+    if frequency in MONTHS:
+        step = MONTHS[frequency]
+        months = (moment.year - anchor.year) * 12 + moment.month - anchor.month
+        months -= months % step
+        if add_months(anchor, months) > moment:
+            months -= step
+        return months // step + 1, add_months(anchor, months)
+    raise ValueError(f"Unsupported schedule type: {frequency}")
+
+
+def anchor(job: Job) -> datetime:
+    return job.scheduled_time or job.created_at
+
+
+def schedule_recurring(job: Job) -> Optional[datetime]:
+    """Set the next run of an interval job (its scheduled_time while that is still ahead)."""
+    job.next_run_at = next_run_after(job.frequency, anchor(job), timezone.now())
+    Job.objects.filter(id=job.id).update(next_run_at=job.next_run_at)
+    return job.next_run_at
+
+
+def rearm(job_ids) -> None:
+    """
+    Make recurring jobs that finished their last run pending again for the run being queued:
+    workers only claim pending jobs (or failed ones with a retry due), so this is what lets the
+    new run start while a duplicate of an old message cannot. Running jobs are left alone.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for status in (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED):
+            count = Job.objects.filter(id__in=job_ids, status=status).update(status=JOB_STATUS_PENDING, retry_at=None, updated_at=now)
+            JobStatusCounter.record_transition(status, JOB_STATUS_PENDING, count)
+
+
+def plan_runs(job: Job, now: datetime) -> int:
+    """
+    How many runs to queue now for a due interval job under its misfire_policy (0 or 1). Moves
+    job.next_run_at to the next run, or to the next replay while run_all replays are owed.
+    """
+    start = anchor(job)
+    upcoming = next_run_after(job.frequency, start, now)
+    # next_run_at may be a replay slot between runs, so count the runs since it rather than assume one.
+    total, latest = runs_until(job.frequency, start, now)
+    due = total - runs_until(job.frequency, start, job.next_run_at - timedelta(microseconds=1))[0]
+    job.next_run_at = upcoming
+    if job.misfire_policy == 'run_all':
+        owed = job.missed_runs + due
+        cap = job.misfire_max_runs or getattr(settings, 'JOB_MISFIRE_MAX_RUNS', 10)
+        if owed > cap:
+            print(f"[✗] Job {job.id} missed {owed} run(s); replaying the last {cap}.")
+            owed = cap
+        runs = 1 if owed and job.status != JOB_STATUS_RUNNING else 0
+        job.missed_runs = owed - runs
+        if job.missed_runs:
+            job.next_run_at = min(upcoming, now + timedelta(seconds=getattr(settings, 'JOB_MISFIRE_CATCHUP_SECONDS', 60)))
+        return runs
+    job.missed_runs = 0
+    if job.misfire_policy == 'skip':
+        grace = timedelta(seconds=getattr(settings, 'JOB_MISFIRE_GRACE_SECONDS', 60))
+        runs = 1 if due and now - latest <= grace else 0
+        if due > runs:
+            print(f"[✗] Job {job.id} missed {due - runs} run(s); skipped.")
+        return runs
+    return 1
+
+
+def run_due(limit: Optional[int] = None, now: Optional[datetime] = None) -> int:
+    """Queue up to limit due jobs and move interval jobs to their next run; returns how many."""
+    limit = limit or getattr(settings, 'JOB_SCHEDULER_BATCH_SIZE', 500)
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Rows claimed by another scheduler are skipped, not waited on.
+        due = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(next_run_at__lte=now)
+            .order_by('next_run_at')
+            .only(
+                'id', 'job_type', 'priority', 'status', 'schedule_type', 'frequency', 'scheduled_time', 'created_at',
+                'next_run_at', 'version', 'misfire_policy', 'misfire_max_runs', 'missed_runs',
+            )[:limit]
+        )
+        recurring, scheduled = [], []
+        for job in due:
+            if job.schedule_type != 'interval':
+                job.next_run_at = None
+                scheduled.append(job)
+                continue
+            try:
+                if plan_runs(job, now):
+                    recurring.append(job)
+            except ValueError as exc:
+                job.next_run_at = None
+                print(f"[✗] Job {job.id} unscheduled: {exc}")
+        Job.objects.bulk_update(due, ['next_run_at', 'missed_runs'])
+        rearm([job.id for job in recurring])
+        # Scheduled jobs are still pending, so email jobs among them can go out in batches.
+        signatures = job_signatures(scheduled)
+        signatures.extend(job_signature(job) for job in recurring)
+        enqueue(signatures)
+    return len(due)
+
+
+def overdue(now: Optional[datetime] = None) -> int:
+    """How many jobs have a run more than JOB_MISFIRE_GRACE_SECONDS late (an indexed range count)."""
+    grace = timedelta(seconds=getattr(settings, 'JOB_MISFIRE_GRACE_SECONDS', 60))
+    return Job.objects.filter(next_run_at__lt=(now or timezone.now()) - grace).count()
+
+
+def next_due() -> Optional[datetime]:
+    """When the earliest scheduled run is due (one index lookup), or None when nothing is scheduled."""
+    return Job.objects.filter(next_run_at__isnull=False).order_by('next_run_at').values_list('next_run_at', flat=True).first()
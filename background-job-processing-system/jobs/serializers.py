@@ -1,5 +1,10 @@
+from botocore.exceptions import ClientError
+from django.conf import settings
 from rest_framework import serializers
-from .models import Job
+from .idempotency import dedupe_fields
+from .models import Job, JobBatch, StoredObject, JOB_TYPE_CHOICES, bulk_create_jobs
+from .storage import complete_multipart_upload, delete_object, spool_upload
+from .uploads import StreamedFile
 import os
 from typing import Any, Dict
 
@@ -42,6 +47,12 @@ class JobSerializer(serializers.ModelSerializer, ScheduleValidationMixin):
     class Meta:
         model = Job
         fields = '__all__'
+        read_only_fields = ['dedupe_key', 'dedupe_fingerprint', 'batch', 'next_run_at', 'version', 'missed_runs', 'retry_at', 'lease_expires_at']
+
+    def create(self, validated_data: Dict[str, Any]) -> Job:
+        validated_data.update(dedupe_fields(validated_data))
+        validated_data.pop('dedupe_scope', None)
+        return super().create(validated_data)
 
     def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
         # For partial updates, use instance values for missing fields
@@ -81,32 +92,107 @@ class FileUploadJobSerializer(serializers.Serializer, ScheduleValidationMixin):
         return data
 
     def validate_file(self, value):
-        max_size = 10 * 1024 * 1024  # 10 MB
+        max_size = getattr(settings, 'JOB_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
         if value.size > max_size:
-            raise serializers.ValidationError('File size must not exceed 10 MB.')
+            raise serializers.ValidationError(f'File size must not exceed {max_size // (1024 * 1024)} MB.')
         return value
 
     def create(self, validated_data: Dict[str, Any]) -> Job:
         file = validated_data['file']
         file_name = file.name
-        temp_dir = 'media/uploads/'
-        os.makedirs(temp_dir, exist_ok=True)
-        temp_path = os.path.join(temp_dir, file_name)
-        with open(temp_path, 'wb+') as destination:
-            for chunk in file.chunks():
-                destination.write(chunk)
-        job = Job.objects.create(
-            job_type='upload_file',
-            parameters={
-                'file_name': file_name,
-                'temp_path': temp_path
-            },
-            priority=validated_data.get('priority', 5),
-            max_retries=validated_data.get('max_retries', 3),
-            schedule_type=validated_data.get('schedule_type', 'immediate'),
-            scheduled_time=validated_data.get('scheduled_time', None)
-        )
-        return job
+        if isinstance(file, StreamedFile):
+            # Direct mode: already in the bucket (jobs/uploads.py); the job only carries the object key.
+            # Identical content stored before keeps its object; discard_unused_uploads deletes this one.
+            stored = StoredObject.record(file.sha256, file.object_key, file.size)
+            return create_upload_job(validated_data, {'file_name': file_name, 'sha256': file.sha256, 'object_key': stored.object_key})
+        # Content-addressed temp storage: same-name uploads never overwrite each other.
+        temp_path, sha256, size = spool_upload(file, os.path.join(settings.MEDIA_ROOT, 'uploads'))
+        parameters = {'file_name': file_name, 'sha256': sha256, 'size': size}
+        if StoredObject.objects.filter(sha256=sha256).exists():
+            # Content is already in the bucket; the job will finish without a transfer.
+            os.remove(temp_path)
+        else:
+            parameters['temp_path'] = temp_path
+        return create_upload_job(validated_data, parameters)
+
+
+def create_upload_job(validated_data: Dict[str, Any], parameters: Dict[str, Any]) -> Job:
+    return Job.objects.create(
+        job_type='upload_file',
+        parameters=parameters,
+        priority=validated_data.get('priority', 5),
+        max_retries=validated_data.get('max_retries', 3),
+        schedule_type=validated_data.get('schedule_type', 'immediate'),
+        scheduled_time=validated_data.get('scheduled_time', None),
+        **dedupe_fields(validated_data),
+    )
+
+# --- Presigned Multipart Upload Serializers ---
+class PresignedUploadSerializer(serializers.Serializer):
+    """Request a presigned multipart upload so the client sends the file straight to S3."""
+    file_name = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_size(self, value):
+        max_size = getattr(settings, 'JOB_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+        if value > max_size:
+            raise serializers.ValidationError(f'File size must not exceed {max_size // (1024 * 1024)} MB.')
+        return value
+
+class UploadedPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1, max_value=10000)
+    etag = serializers.CharField()
+
+class CompleteUploadJobSerializer(serializers.Serializer, ScheduleValidationMixin):
+    """Complete a presigned multipart upload and create the upload_file job for it."""
+    object_key = serializers.CharField()
+    upload_id = serializers.CharField()
+    file_name = serializers.CharField(max_length=255)
+    parts = UploadedPartSerializer(many=True, allow_empty=False)
+    priority = serializers.IntegerField(default=5)
+    max_retries = serializers.IntegerField(default=3)
+    schedule_type = serializers.ChoiceField(choices=[('immediate', 'Immediate'), ('scheduled', 'Scheduled')], default='immediate', required=False)
+    scheduled_time = serializers.DateTimeField(required=False, allow_null=True)
+
+    def validate_object_key(self, value):
+        if not value.startswith('uploads/') or '..' in value:
+            raise serializers.ValidationError('object_key must be a key issued by upload-url.')
+        return value
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return self.validate_schedule(data)
+
+    def create(self, validated_data: Dict[str, Any]) -> Job:
+        key = validated_data['object_key']
+        try:
+            size = complete_multipart_upload(key, validated_data['upload_id'], validated_data['parts'])
+        except ClientError as exc:
+            # Unknown upload id, missing parts, wrong ETags: the client's request, not a server error.
+            raise serializers.ValidationError({'upload_id': exc.response.get('Error', {}).get('Message') or str(exc)})
+        max_size = getattr(settings, 'JOB_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+        if size > max_size:
+            delete_object(key)
+            raise serializers.ValidationError({'parts': f'File size must not exceed {max_size // (1024 * 1024)} MB.'})
+        return create_upload_job(validated_data, {
+            'file_name': validated_data['file_name'],
+            'object_key': validated_data['object_key'],
+        })
+
+# --- Job Batch Serializers ---
+class BatchCallbackSerializer(serializers.Serializer):
+    """The job to run once every job of a batch has finished (JobBatch.on_complete)."""
+    job_type = serializers.ChoiceField(choices=JOB_TYPE_CHOICES)
+    parameters = serializers.DictField(default=dict)
+    priority = serializers.IntegerField(default=5)
+
+class JobBatchSerializer(serializers.ModelSerializer):
+    """Aggregated progress of a job batch."""
+    status = serializers.CharField(read_only=True)
+    pending = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = JobBatch
+        fields = ['id', 'status', 'total', 'completed', 'failed', 'pending', 'on_complete', 'callback_job', 'created_at', 'finished_at']
 
 # --- Email Message Serializer ---
 class EmailMessageSerializer(serializers.Serializer):
@@ -128,6 +214,7 @@ class SendEmailJobSerializer(serializers.Serializer, ScheduleValidationMixin):
     schedule_type = serializers.ChoiceField(choices=[('immediate', 'Immediate'), ('scheduled', 'Scheduled')], default='immediate', required=False)
     scheduled_time = serializers.DateTimeField(required=False, allow_null=True)
     frequency = serializers.ChoiceField(choices=FREQUENCY_CHOICES, default='daily', required=False, allow_blank=True)
+    on_complete = BatchCallbackSerializer(required=False)
 
     def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
         data = self.validate_schedule(data)
@@ -148,42 +235,42 @@ class SendEmailJobSerializer(serializers.Serializer, ScheduleValidationMixin):
         return data
 
     def create(self, validated_data: Dict[str, Any]) -> Any:
-        jobs = []
         if validated_data.get('emails'):
-            for email_obj in validated_data['emails']:
-                job = Job.objects.create(
-                    job_type='send_email',
-                    parameters={
-                        'recipient': email_obj['recipient'],
-                        'subject': email_obj['subject'],
-                        'body': email_obj['body'],
-                    },
-                    priority=validated_data.get('priority', 5),
-                    max_retries=validated_data.get('max_retries', 3),
-                    schedule_type=validated_data.get('schedule_type', 'immediate'),
-                    scheduled_time=validated_data.get('scheduled_time', None),
-                    frequency=validated_data.get('frequency', 'daily'),
-                )
-                jobs.append(job)
+            messages = [
+                (email_obj['recipient'], email_obj['subject'], email_obj['body'])
+                for email_obj in validated_data['emails']
+            ]
         else:
             recipients = []
             if validated_data.get('recipient'):
                 recipients = [validated_data['recipient']]
             elif validated_data.get('recipients'):
                 recipients = validated_data['recipients']
-            for email in recipients:
-                job = Job.objects.create(
-                    job_type='send_email',
-                    parameters={
-                        'recipient': email,
-                        'subject': validated_data['subject'],
-                        'body': validated_data['body'],
-                    },
-                    priority=validated_data.get('priority', 5),
-                    max_retries=validated_data.get('max_retries', 3),
-                    schedule_type=validated_data.get('schedule_type', 'immediate'),
-                    scheduled_time=validated_data.get('scheduled_time', None),
-                    frequency=validated_data.get('frequency', 'daily'),
-                )
-                jobs.append(job)
-        return jobs if len(jobs) > 1 else jobs[0]
+            messages = [(email, validated_data['subject'], validated_data['body']) for email in recipients]
+        jobs = [
+            Job(
+                job_type='send_email',
+                parameters={
+                    'recipient': recipient,
+                    'subject': subject,
+                    'body': body,
+                },
+                priority=validated_data.get('priority', 5),
+                max_retries=validated_data.get('max_retries', 3),
+                schedule_type=validated_data.get('schedule_type', 'immediate'),
+                scheduled_time=validated_data.get('scheduled_time', None),
+                frequency=validated_data.get('frequency', 'daily'),
+                **dedupe_fields(validated_data, index),
+            )
+            for index, (recipient, subject, body) in enumerate(messages)
+        ]
+        if len(jobs) == 1 and not validated_data.get('on_complete'):
+            jobs[0].save()
+            return jobs[0]
+        # Bulk path: the jobs are tracked as one batch (progress at /api/batches/<id>/), inserted
+        # in chunks inside one transaction instead of one INSERT per recipient. A single email with
+        # an on_complete job gets a batch of one, which runs it.
+        batch = JobBatch.objects.create(total=len(jobs), on_complete=validated_data.get('on_complete'))
+        for job in jobs:
+            job.batch = batch
+        return bulk_create_jobs(jobs)
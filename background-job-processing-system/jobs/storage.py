@@ -0,0 +1,152 @@
+"""
+Shared S3 access for upload_file jobs and the download endpoint.
+
+Clients are expensive to build (credential resolution, endpoint discovery, a new connection
+pool), so each process builds one and reuses it; boto3 clients are thread-safe.
+"""
+import hashlib
+import math
+import tempfile
+import os
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+MB = 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def _build_s3_client(pid: int):
+    # Keyed by pid so a forked worker never shares its parent's pooled sockets.
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        region_name=settings.AWS_REGION,
+        endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+        config=Config(
+            max_pool_connections=getattr(settings, 'AWS_S3_MAX_POOL_CONNECTIONS', 50),
+            retries={'max_attempts': 5, 'mode': 'adaptive'},
+        ),
+    )
+
+
+def get_s3_client():
+    """Return this process's cached S3 client."""
+    return _build_s3_client(os.getpid())
+
+
+def reset_s3_client() -> None:
+    _build_s3_client.cache_clear()
+
+
+def transfer_config() -> TransferConfig:
+    """Multipart settings: files above the threshold are uploaded in concurrent parts."""
+    return TransferConfig(
+        multipart_threshold=getattr(settings, 'AWS_S3_MULTIPART_THRESHOLD', 8 * MB),
+        multipart_chunksize=getattr(settings, 'AWS_S3_MULTIPART_CHUNKSIZE', 8 * MB),
+        max_concurrency=getattr(settings, 'AWS_S3_MAX_CONCURRENCY', 10),
+        use_threads=True,
+    )
+
+
+def upload_path(path: str, key: str, bucket: str = None) -> None:
+    """Upload a local file, switching to parallel multipart for large files."""
+    get_s3_client().upload_file(path, bucket or settings.AWS_STORAGE_BUCKET_NAME, key, Config=transfer_config())
+
+
+def object_url(key: str, bucket: str = None) -> str:
+    bucket = bucket or settings.AWS_STORAGE_BUCKET_NAME
+    endpoint = getattr(settings, 'AWS_S3_ENDPOINT_URL', None)
+    if endpoint:
+        return f"{endpoint.rstrip('/')}/{bucket}/{key}"
+    return f"https://{bucket}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
+
+
+def content_object_key(sha256: str) -> str:
+    """Bucket key derived from the content hash, so identical files share one object."""
+    return f"objects/{sha256[:2]}/{sha256}"
+
+
+def spool_upload(fileobj, directory: str) -> Tuple[str, str, int]:
+    """
+    Write an uploaded file under directory/<sha256>-<random>, hashing the chunks as they stream.
+    Every upload gets a file of its own, even for identical content, so the job that finishes first
+    cannot delete the file of another still waiting; identical content is deduplicated in the
+    bucket by hash (StoredObject) instead.
+    """
+    os.makedirs(directory, exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as destination:
+        for chunk in fileobj.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+            destination.write(chunk)
+    sha256 = digest.hexdigest()
+    path = os.path.join(directory, f'{sha256}-{uuid.uuid4().hex}')
+    os.replace(destination.name, path)
+    return path, sha256, size
+
+
+def new_object_key(file_name: str) -> str:
+    """Unique key for a file streamed straight to the bucket."""
+    return f"uploads/{uuid.uuid4().hex}/{os.path.basename(file_name)}"
+
+
+def create_presigned_multipart_upload(key: str, size: int, expires_in: int = 3600) -> Dict[str, Any]:
+    """Start a multipart upload and presign one PUT URL per part for the client."""
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    part_size = getattr(settings, 'AWS_S3_MULTIPART_CHUNKSIZE', 8 * MB)
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+    parts = [
+        {
+            'part_number': number,
+            'url': s3.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': bucket, 'Key': key, 'UploadId': upload_id, 'PartNumber': number},
+                ExpiresIn=expires_in,
+            ),
+        }
+        for number in range(1, max(1, math.ceil(size / part_size)) + 1)
+    ]
+    return {'object_key': key, 'upload_id': upload_id, 'part_size': part_size, 'expires_in': expires_in, 'parts': parts}
+
+
+def complete_multipart_upload(key: str, upload_id: str, parts: List[Dict[str, Any]]) -> int:
+    """
+    Assemble the uploaded parts and return the object's size, read back from the bucket: the size
+    the client declared when it asked for the URLs is not what it necessarily uploaded.
+    """
+    s3 = get_s3_client()
+    s3.complete_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': [
+            {'PartNumber': part['part_number'], 'ETag': part['etag']}
+            for part in sorted(parts, key=lambda part: part['part_number'])
+        ]},
+    )
+    return s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)['ContentLength']
+
+
+def read_object(key: str, bucket: str = None) -> bytes:
+    return get_s3_client().get_object(Bucket=bucket or settings.AWS_STORAGE_BUCKET_NAME, Key=key)['Body'].read()
+
+
+def delete_object(key: str, bucket: str = None) -> None:
+    get_s3_client().delete_object(Bucket=bucket or settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+
+
+def object_exists(key: str) -> bool:
+    try:
+        get_s3_client().head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+    except ClientError:
+        return False
+    return True
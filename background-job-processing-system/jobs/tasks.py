@@ -1,115 +1,252 @@
+import uuid
+from collections import Counter
+from datetime import timedelta
 from celery import shared_task
-from .models import Job, JOB_STATUS_FAILED, JOB_STATUS_PENDING, JOB_STATUS_COMPLETED
-import time
-from django.core.mail import send_mail
-from django.conf import settings
-import boto3
-import os
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import DeadLetterJob, Job, JobBatch, JOB_STATUS_FAILED, JOB_STATUS_PENDING, JOB_STATUS_RUNNING, JOB_STATUS_COMPLETED
+from .broadcast import batch_progress_due, broadcast_batch_progress, broadcast_job_status
+from .cancellation import is_dropped, live_job_ids, version_kwargs
+from . import limits
+from .handlers import JobFailed, retry_policy, run_handler
+from .lease import Heartbeat, expired, lease_deadline
+from .priority import route_options
+from .mail import build_email_message, send_messages
+from .outbox import enqueue
 from django_celery_beat.models import PeriodicTask
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
 
-@shared_task(bind=True, max_retries=3)
-def execute_job_task(self, job_id):
+@shared_task(bind=True, max_retries=None)
+def execute_job_task(self, job_id, version=0):
     """
     Celery task to execute a background job by ID.
-    Handles email, file upload, and generic jobs. Updates job status and notifies WebSocket clients.
+    Runs the handler registered for the job type, updates job status and notifies WebSocket clients.
+    Retries are bounded by Job.max_retries and the job type's retry policy, not by Celery.
+    Messages for a cancelled job or an older version of it are dropped (see jobs/cancellation.py).
     """
+    if is_dropped(job_id, version):
+        print(f"[✗] Dropped cancelled or superseded task for job {job_id} (version {version}).")
+        return
     try:
         job = Job.objects.get(id=job_id)
     except Job.DoesNotExist:
         # Job was deleted before execution; send websocket update and exit
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            'job_status',
-            {
-                'type': 'job_status_update',
-                'data': {
-                    'id': job_id,
-                    'status': 'deleted',
-                    'result': {'error': 'Job was deleted before execution.'},
-                }
-            }
-        )
-        print(f"WebSocket update sent for deleted job {job_id}")
+        broadcast_job_status(job_id, 'deleted', {'error': 'Job was deleted before execution.'})
+        print(f"WebSocket update queued for deleted job {job_id}")
         return
-    job.status = 'running'
-    job.save()
-    # Send websocket update for running status
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        'job_status',
-        {
-            'type': 'job_status_update',
-            'data': {
-                'id': job.id,
-                'status': job.status,
-                'result': job.result,
-            }
-        }
+    if job.version != version:
+        print(f"[✗] Dropped superseded task for job {job_id} (version {version}, now {job.version}).")
+        return
+    holder = f'job:{job.id}'
+    grant = limits.acquire(job.job_type, holder)
+    if not grant.granted:
+        defer_job(job, grant, self.request.retries or 0)
+        return
+    try:
+        run_job(self, job)
+    finally:
+        limits.release(job.job_type, holder)
+
+def run_job(task, job):
+    """Claim the job, run its handler and record the outcome."""
+    if not claim_job(job):
+        return
+    try:
+        # O(1) dispatch to the handler registered for this job type (see jobs/handlers.py).
+        with Heartbeat(job.id):
+            result = run_handler(job.job_type, job.parameters, job.id)
+    except JobFailed as failure:
+        record_failure(job, failure)
+        return
+    except Exception as exc:
+        countdown = record_error(job, exc)
+        if countdown is None:
+            return
+        raise task.retry(exc=exc, countdown=countdown, **route_options(job.priority, job.job_type))
+    record_success(job, result)
+
+# --- Job state helpers (shared with the asyncio worker in jobs/async_worker.py) ---
+
+def defer_job(job, grant, retries):
+    """
+    Over the job type's concurrency or rate limit: re-queue instead of holding a worker.
+    The job stays as it was and the Celery retry count is carried over unchanged.
+    """
+    execute_job_task.apply_async(
+        args=[job.id], kwargs=version_kwargs(job), countdown=limits.defer_delay(grant), retries=retries,
+        **route_options(job.priority, job.job_type)
+    )
+
+def claimable():
+    """
+    Jobs a message may start: pending ones, failed ones whose automatic retry is due and running
+    ones whose worker died (lease expired). A completed or permanently failed job is not, so a
+    duplicate or redelivered message never runs it again; recurring jobs are made pending again by
+    the scheduler when their next run is queued.
+    """
+    return (
+        Q(status=JOB_STATUS_PENDING) | Q(status=JOB_STATUS_FAILED, retry_at__isnull=False)
+        | (Q(status=JOB_STATUS_RUNNING) & expired())
     )
+
+def claim_job(job):
+    """Mark the job running unless it is not claimable (see claimable()); returns whether it was claimed."""
+    if not Job.transition(job.id, job.status, JOB_STATUS_RUNNING, condition=claimable(), retry_at=None, lease_expires_at=lease_deadline()):
+        # Running elsewhere, already finished, or claimed by another worker just now; never run it twice.
+        print(f"[✗] Job {job.id} is {job.status} and cannot be claimed; skipping duplicate execution.")
+        return False
+    job.status = JOB_STATUS_RUNNING
+    # Send websocket update for running status
+    broadcast_job_status(job.id, job.status, job.result, job.job_type)
+    return True
+
+def record_failure(job, failure):
+    """Permanent failure: no retry, dead-lettered like a job out of retries."""
+    job.result = failure.result
+    if Job.transition(job.id, JOB_STATUS_RUNNING, JOB_STATUS_FAILED, result=job.result):
+        dead_letter(job, failure)
+    else:
+        broadcast_job_status(job.id, JOB_STATUS_FAILED, job.result, job.job_type)
+
+def record_error(job, exc):
+    """
+    The handler raised: count the attempt and return the countdown before the retry, which the
+    caller schedules. Returns None when the job is not retried and has been dead-lettered instead.
+    """
+    job.retries += 1
+    countdown = retry_policy(job.job_type).next_delay(exc, job.retries, job.max_retries)
+    if countdown is not None:
+        job.retry_at = timezone.now() + timedelta(seconds=countdown)
+        Job.transition(job.id, JOB_STATUS_RUNNING, JOB_STATUS_FAILED, retries=job.retries, retry_at=job.retry_at)
+        return countdown
+    job.result = {'error': str(exc), 'attempts': job.retries}
+    Job.transition(job.id, JOB_STATUS_RUNNING, JOB_STATUS_FAILED, retries=job.retries, result=job.result)
+    dead_letter(job, exc)
+    return None
+
+def dead_letter(job, exc):
+    """Record a job that failed for good so it can be inspected and requeued later."""
+    DeadLetterJob.record(job, exc)
+    count_in_batch(job.batch_id, failed=1)
+    broadcast_job_status(job.id, JOB_STATUS_FAILED, job.result, job.job_type)
+    print(f"[✗] Job {job.id} dead-lettered after {job.retries} attempt(s): {exc}")
+
+def record_success(job, result):
+    if Job.transition(job.id, JOB_STATUS_RUNNING, JOB_STATUS_COMPLETED, result=result):
+        count_in_batch(job.batch_id, completed=1)
+        # Notify websocket clients (coalesced and sent in batches)
+        broadcast_job_status(job.id, JOB_STATUS_COMPLETED, result, job.job_type)
+        print(f"WebSocket update queued for job {job.id} with status {JOB_STATUS_COMPLETED}")
+
+# --- Job batches ---
+
+def count_in_batch(batch_id, completed=0, failed=0):
+    """
+    Count final child outcomes towards their batch. Subscribers get one progress event per
+    JOB_BATCH_PROGRESS_INTERVAL_MS tick (plus the final one) instead of one per child, and the
+    batch's on_complete job is started by whichever worker finishes the last child.
+    """
+    if batch_id is None or not (completed or failed):
+        return
+    finished = JobBatch.record(batch_id, completed=completed, failed=failed)
+    if not finished and not batch_progress_due(batch_id):
+        return
+    batch = JobBatch.objects.filter(id=batch_id).first()
+    if batch is None:
+        return
+    broadcast_batch_progress(batch.progress())
+    if finished:
+        print(f"[✓] Batch {batch.id} finished: {batch.completed} completed, {batch.failed} failed")
+        if batch.on_complete:
+            run_batch_callback(batch)
+
+def run_batch_callback(batch):
+    """Create and dispatch the batch's on_complete job, passing it the batch's final counts."""
+    callback = batch.on_complete
+    parameters = dict(callback.get('parameters') or {}, batch=batch.progress())
+    with transaction.atomic():
+        job = Job.objects.create(
+            job_type=callback['job_type'], parameters=parameters, priority=callback.get('priority', 5)
+        )
+        JobBatch.objects.filter(id=batch.id).update(callback_job=job)
+        enqueue([execute_job_task.si(job.id).set(**route_options(job.priority, job.job_type))])
+    batch.callback_job = job
+    return job
+
+@shared_task
+def send_email_batch_task(job_ids):
+    """
+    Celery task to send many pending send_email jobs over one pooled SMTP connection.
+    Records success or failure on each job; failed messages are retried individually.
+    """
+    # Cancelled jobs are skipped without a query; rescheduled ones are waiting in the delayed store again.
+    pending = list(Job.objects.filter(
+        id__in=live_job_ids(job_ids), job_type='send_email', status=JOB_STATUS_PENDING, next_run_at__isnull=True
+    ).order_by('id'))
+    if not pending:
+        return {'sent': 0, 'failed': 0}
+    # The batch holds one send_email slot and takes one rate-limit token per message.
+    holder = f'batch:{uuid.uuid4().hex}'
+    grant = limits.acquire('send_email', holder, want=len(pending))
+    if grant.granted < len(pending):
+        deferred = [job.id for job in pending[grant.granted:]]
+        send_email_batch_task.apply_async(args=[deferred], countdown=limits.defer_delay(grant), **route_options(pending[0].priority))
+        pending = pending[:grant.granted]
     try:
-        result = None
-        if job.job_type == 'send_email':
-            params = job.parameters
-            send_mail(
-                subject=params.get('subject', ''),
-                message=params.get('body', ''),
-                from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@example.com'),
-                recipient_list=[params.get('recipient')],
-                fail_silently=False,
-            )
-            result = {'message': f"Email sent to {params.get('recipient')}", 'recipient': params.get('recipient')}
-        elif job.job_type == 'upload_file':
-            params = job.parameters
-            s3 = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                region_name=os.getenv('AWS_REGION', 'us-east-1')
-            )
-            temp_path = params['temp_path']
-            file_name = params['file_name']
-            bucket = os.getenv('AWS_STORAGE_BUCKET_NAME')
-            if not os.path.exists(temp_path):
-                job.status = JOB_STATUS_FAILED
-                job.result = {'error': f"File {file_name} not found at {temp_path}. It may have been deleted before the scheduled job ran."}
-                job.save()
-                return
-            with open(temp_path, 'rb') as f:
-                s3.put_object(Bucket=bucket, Key=file_name, Body=f)
-            region = os.getenv('AWS_REGION', 'us-east-1')
-            file_url = f"https://{bucket}.s3.{region}.amazonaws.com/{file_name}"
-            result = {
-                'message': f"File {file_name} uploaded to S3.",
-                'file_url': file_url
-            }
-            os.remove(temp_path)
+        return send_email_batch(pending)
+    finally:
+        limits.release('send_email', holder)
+
+def send_email_batch(pending):
+    """Claim, send and record a list of pending send_email jobs."""
+    # Claim each job with a conditional update so a job picked up elsewhere meanwhile is not sent twice.
+    jobs = [job for job in pending if Job.transition(job.id, JOB_STATUS_PENDING, JOB_STATUS_RUNNING, lease_expires_at=lease_deadline())]
+    # Messages are built lazily (EmailMessage.message() runs while sending), so bad parameters
+    # fail their own job inside send_messages instead of the whole batch.
+    errors = send_messages([build_email_message(job.parameters) for job in jobs])
+    # Final outcomes per batch, counted with one update per batch after the loop.
+    completed, failed = Counter(), Counter()
+    for job, error in zip(jobs, errors):
+        recipient = job.parameters.get('recipient')
+        if error is None:
+            job.status = JOB_STATUS_COMPLETED
+            job.result = {'message': f"Email sent to {recipient}", 'recipient': recipient}
+            Job.transition(job.id, JOB_STATUS_RUNNING, job.status, result=job.result)
         else:
-            # Simulate other job processing
-            time.sleep(2)
-            result = {'message': f"{job.job_type} completed successfully."}
-        job.status = JOB_STATUS_COMPLETED
-        job.result = result
-        # Notify websocket clients
-        async_to_sync(channel_layer.group_send)(
-            'job_status',
-            {
-                'type': 'job_status_update',
-                'data': {
-                    'id': job.id,
-                    'status': job.status,
-                    'result': job.result,
-                }
-            }
-        )
-        print(f"WebSocket update sent for job {job.id} with status {job.status}")
-    except Exception as exc:
-        job.status = JOB_STATUS_FAILED
-        job.retries += 1
-        job.save()
-        raise self.retry(exc=exc, countdown=2 ** job.retries)
-    job.save()
+            job.status = JOB_STATUS_FAILED
+            job.retries += 1
+            job.result = {'error': str(error), 'recipient': recipient}
+            countdown = retry_policy(job.job_type).next_delay(error, job.retries, job.max_retries)
+            job.retry_at = None if countdown is None else timezone.now() + timedelta(seconds=countdown)
+            Job.transition(job.id, JOB_STATUS_RUNNING, job.status, result=job.result, retries=job.retries, retry_at=job.retry_at)
+        broadcast_job_status(job.id, job.status, job.result, job.job_type)
+        if error is None:
+            completed[job.batch_id] += 1
+            continue
+        if countdown is None:
+            DeadLetterJob.record(job, error)
+            failed[job.batch_id] += 1
+        else:
+            execute_job_task.apply_async(args=[job.id], kwargs=version_kwargs(job), countdown=countdown, **route_options(job.priority, job.job_type))
+    for batch_id in set(completed) | set(failed):
+        count_in_batch(batch_id, completed=completed[batch_id], failed=failed[batch_id])
+    return {'sent': errors.count(None), 'failed': len(errors) - errors.count(None)}
+
+@shared_task
+def run_recurring_job_task(job_id, version=0):
+    """
+    Beat entry point for recurring jobs (JOB_RECURRING_SCHEDULER=beat): make the job pending again
+    for this run, as the scheduler does, and queue it. A run that is still going is not doubled.
+    """
+    from .scheduler import rearm
+    if is_dropped(job_id, version):
+        return
+    job = Job.objects.filter(id=job_id, version=version).first()
+    if job is None:
+        print(f"[✗] Recurring job {job_id} (version {version}) no longer exists; skipping this run.")
+        return
+    rearm([job.id])
+    execute_job_task.apply_async(args=[job.id], kwargs=version_kwargs(job), **route_options(job.priority, job.job_type))
 
 @shared_task
 def enable_periodic_task(periodic_task_id):
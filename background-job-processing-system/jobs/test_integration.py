@@ -1,16 +1,25 @@
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
 from django.utils import timezone
 from jobs.models import Job
-from unittest.mock import patch
+import unittest
+from unittest.mock import ANY, patch, AsyncMock, MagicMock
+import tempfile
 from django.core.files.uploadedfile import SimpleUploadedFile
 import os
 from django_celery_beat.models import PeriodicTask
+from django.db import OperationalError
+from django.test import override_settings
+
+try:
+    from moto import mock_aws
+except ImportError:  # moto is only needed for the S3 tests
+    mock_aws = None
 
 class JobIntegrationTests(APITestCase):
-    @patch('jobs.tasks.execute_job_task.delay')
-    def test_immediate_email_job_triggers_celery(self, mock_celery_delay):
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_immediate_email_job_triggers_celery(self, mock_apply_async):
         url = reverse('job-list')
         data = {
             'job_type': 'send_email',
@@ -21,11 +30,12 @@ class JobIntegrationTests(APITestCase):
             },
             'schedule_type': 'immediate'
         }
-        response = self.client.post(url, data, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         job = Job.objects.get(id=response.data['id'])
         self.assertEqual(job.status, 'pending')
-        mock_celery_delay.assert_called_once_with(job.id)
+        mock_apply_async.assert_called_once_with(args=[job.id], producer=ANY, queue='jobs.default', priority=5)
 
     def test_job_appears_in_db_after_creation(self):
         url = reverse('job-list')
@@ -42,8 +52,8 @@ class JobIntegrationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(Job.objects.filter(id=response.data['id']).exists())
 
-    @patch('jobs.tasks.execute_job_task.delay')
-    def test_immediate_file_upload_job_creates_file_and_job(self, mock_celery_delay):
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_immediate_file_upload_job_creates_file_and_job(self, mock_apply_async):
         url = reverse('job-upload-file')
         file_content = b'integration test file'
         file = SimpleUploadedFile('integration.txt', file_content, content_type='text/plain')
@@ -51,14 +61,15 @@ class JobIntegrationTests(APITestCase):
             'file': file,
             'schedule_type': 'immediate',
         }
-        response = self.client.post(url, data, format='multipart')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         job_id = response.data['id']
         job = Job.objects.get(id=job_id)
         self.assertEqual(job.status, 'pending')
         params = job.parameters
         self.assertTrue(os.path.exists(params['temp_path']))
-        mock_celery_delay.assert_called_once_with(job.id)
+        mock_apply_async.assert_called_once_with(args=[job.id], producer=ANY, queue='jobs.default', priority=5)
         # Clean up temp file
         os.remove(params['temp_path'])
 
@@ -75,12 +86,15 @@ class JobIntegrationTests(APITestCase):
             'schedule_type': 'scheduled',
             'scheduled_time': future_time
         }
-        with patch('jobs.tasks.execute_job_task.delay') as mock_celery_delay:
-            response = self.client.post(url, data, format='json')
+        with patch('jobs.tasks.execute_job_task.apply_async') as mock_apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data, format='json')
             self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-            mock_celery_delay.assert_not_called()
+            # Held in the delayed store until run_scheduler promotes it, not published with an eta.
+            mock_apply_async.assert_not_called()
         job = Job.objects.get(id=response.data['id'])
         self.assertEqual(job.schedule_type, 'scheduled')
+        self.assertEqual(job.next_run_at, job.scheduled_time)
         self.assertEqual(job.scheduled_time.isoformat(), response.data['scheduled_time'].replace('Z', '+00:00'))
 
     def test_job_list_pagination_integration(self):
@@ -109,8 +123,8 @@ class JobIntegrationTests(APITestCase):
         response = self.client.get(url + '?page=6')
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
-    @patch('jobs.tasks.execute_job_task.delay')
-    def test_immediate_email_job_triggers_celery_via_dedicated_endpoint(self, mock_celery_delay):
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_immediate_email_job_triggers_celery_via_dedicated_endpoint(self, mock_apply_async):
         url = reverse('job-send-email')
         data = {
             'recipient': 'integration@example.com',
@@ -118,14 +132,15 @@ class JobIntegrationTests(APITestCase):
             'body': 'Integration test',
             'schedule_type': 'immediate'
         }
-        response = self.client.post(url, data, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         job = Job.objects.get(id=response.data['id'])
         self.assertEqual(job.status, 'pending')
-        mock_celery_delay.assert_called_once_with(job.id)
+        mock_apply_async.assert_called_once_with(args=[job.id], producer=ANY, queue='jobs.default', priority=5)
 
-    @patch('jobs.tasks.execute_job_task.delay')
-    def test_immediate_file_upload_job_creates_file_and_job_via_dedicated_endpoint(self, mock_celery_delay):
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_immediate_file_upload_job_creates_file_and_job_via_dedicated_endpoint(self, mock_apply_async):
         url = reverse('job-upload-file-standalone')
         file_content = b'integration test file'
         file = SimpleUploadedFile('integration.txt', file_content, content_type='text/plain')
@@ -133,19 +148,20 @@ class JobIntegrationTests(APITestCase):
             'file': file,
             'schedule_type': 'immediate',
         }
-        response = self.client.post(url, data, format='multipart')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         job_id = response.data['id']
         job = Job.objects.get(id=job_id)
         self.assertEqual(job.status, 'pending')
         params = job.parameters
         self.assertTrue(os.path.exists(params['temp_path']))
-        mock_celery_delay.assert_called_once_with(job.id)
+        mock_apply_async.assert_called_once_with(args=[job.id], producer=ANY, queue='jobs.default', priority=5)
         # Clean up temp file
         os.remove(params['temp_path'])
 
-    @patch('jobs.tasks.execute_job_task.delay')
-    def test_personalized_bulk_email_jobs_trigger_celery(self, mock_celery_delay):
+    @patch('jobs.tasks.send_email_batch_task.apply_async')
+    def test_personalized_bulk_email_jobs_trigger_celery(self, mock_apply_async):
         url = reverse('job-send-email')
         data = {
             'emails': [
@@ -154,15 +170,43 @@ class JobIntegrationTests(APITestCase):
             ],
             'schedule_type': 'immediate'
         }
-        response = self.client.post(url, data, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data['count'], 2)
         jobs = Job.objects.filter(parameters__recipient__in=['a@example.com', 'b@example.com'])
         self.assertEqual(jobs.count(), 2)
-        # Should trigger celery for each job
-        self.assertEqual(mock_celery_delay.call_count, 2)
-        called_ids = {call.args[0] for call in mock_celery_delay.call_args_list}
-        self.assertEqual(set(jobs.values_list('id', flat=True)), called_ids)
+        # Both jobs are sent by a single batch task over one SMTP connection
+        mock_apply_async.assert_called_once()
+        self.assertEqual(set(mock_apply_async.call_args.kwargs['args'][0]), set(jobs.values_list('id', flat=True)))
+
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_bulk_email_jobs_without_batching_publish_one_group(self, mock_apply_async):
+        url = reverse('job-send-email')
+        data = {'recipients': ['a@example.com', 'b@example.com'], 'subject': 'S', 'body': 'B'}
+        with self.settings(JOB_EMAIL_BATCH_SIZE=1):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(mock_apply_async.call_count, 2)
+        called_ids = {call.kwargs['args'][0] for call in mock_apply_async.call_args_list}
+        self.assertEqual(called_ids, {response.data['first_id'], response.data['last_id']})
+        # Both published over one producer connection.
+        self.assertEqual(len({id(call.kwargs['producer']) for call in mock_apply_async.call_args_list}), 1)
+
+    @patch('jobs.tasks.send_email_batch_task.apply_async')
+    def test_bulk_recipients_are_inserted_in_chunks(self, mock_apply_async):
+        url = reverse('job-send-email')
+        recipients = [f'user{i}@example.com' for i in range(25)]
+        data = {'recipients': recipients, 'subject': 'S', 'body': 'B', 'schedule_type': 'immediate'}
+        with self.settings(JOB_BULK_CREATE_BATCH_SIZE=10, JOB_EMAIL_BATCH_SIZE=10), self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(9):
+                # savepoint + batch INSERT + savepoint + 3 chunked INSERTs + release + outbox INSERT + release
+                response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(Job.objects.filter(job_type='send_email').count(), 25)
+        self.assertEqual(mock_apply_async.call_count, 3)
 
     def test_deleting_scheduled_job_removes_periodic_task(self):
         """Deleting a scheduled job also deletes its associated PeriodicTask."""
@@ -296,3 +340,267 @@ class JobIntegrationTests(APITestCase):
         patch_response4 = self.client.patch(patch_url3, {'frequency': 'weekly'}, format='json')
         self.assertEqual(patch_response4.status_code, status.HTTP_200_OK)
         self.assertEqual(patch_response4.data['frequency'], 'weekly')
+
+
+@unittest.skipIf(mock_aws is None, 'moto is not installed')
+@override_settings(AWS_STORAGE_BUCKET_NAME='test-bucket', AWS_REGION='us-east-1',
+                   AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+                   AWS_S3_MULTIPART_THRESHOLD=5 * 1024 * 1024, AWS_S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024)
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0)
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class S3UploadIntegrationTests(APITestCase):
+    def setUp(self):
+        from jobs.storage import reset_s3_client
+        self.mock = mock_aws()
+        self.mock.start()
+        reset_s3_client()
+        from jobs.storage import get_s3_client
+        get_s3_client().create_bucket(Bucket='test-bucket')
+
+    def tearDown(self):
+        from jobs.storage import reset_s3_client
+        self.mock.stop()
+        reset_s3_client()
+
+    def run_upload_job(self, content):
+        from jobs.tasks import execute_job_task
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(content)
+        job = Job.objects.create(job_type='upload_file', parameters={'file_name': 'data.bin', 'temp_path': f.name})
+        execute_job_task(job.id)
+        return Job.objects.get(id=job.id)
+
+    def test_upload_job_reuses_cached_client(self, _layer):
+        from jobs.storage import get_s3_client
+        self.assertIs(get_s3_client(), get_s3_client())
+        job = self.run_upload_job(b'small file')
+        self.assertEqual(job.status, 'completed')
+        body = get_s3_client().get_object(Bucket='test-bucket', Key='data.bin')['Body'].read()
+        self.assertEqual(body, b'small file')
+        self.assertFalse(os.path.exists(job.parameters['temp_path']))
+
+    def test_large_upload_uses_multipart(self, _layer):
+        from jobs.storage import get_s3_client
+        content = os.urandom(11 * 1024 * 1024)
+        job = self.run_upload_job(content)
+        self.assertEqual(job.status, 'completed')
+        head = get_s3_client().head_object(Bucket='test-bucket', Key='data.bin')
+        self.assertEqual(head['ContentLength'], len(content))
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'))  # three multipart parts
+
+    def test_upload_size_limit_is_configurable(self, _layer):
+        url = reverse('job-upload-file')
+        file = SimpleUploadedFile('big.txt', b'a' * (10 * 1024 * 1024 + 1), content_type='text/plain')
+        with self.settings(JOB_UPLOAD_MAX_SIZE=20 * 1024 * 1024), patch('jobs.tasks.execute_job_task.apply_async'):
+            response = self.client.post(url, {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        os.remove(Job.objects.get(id=response.data['id']).parameters['temp_path'])
+
+    def test_direct_upload_mode_streams_to_bucket(self, _layer):
+        from jobs.storage import get_s3_client
+        from jobs.tasks import execute_job_task
+        url = reverse('job-upload-file')
+        file = SimpleUploadedFile('direct.txt', b'direct content', content_type='text/plain')
+        with self.settings(JOB_UPLOAD_STORAGE='direct'), patch('jobs.tasks.execute_job_task.apply_async'):
+            response = self.client.post(url, {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = Job.objects.get(id=response.data['id'])
+        self.assertNotIn('temp_path', job.parameters)
+        key = job.parameters['object_key']
+        self.assertEqual(get_s3_client().get_object(Bucket='test-bucket', Key=key)['Body'].read(), b'direct content')
+        execute_job_task(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.result['object_key'], key)
+
+    def test_direct_upload_sends_parts_as_the_body_is_read(self, _layer):
+        from django.core.files.uploadhandler import TemporaryFileUploadHandler
+        from jobs.storage import get_s3_client
+        content = os.urandom(11 * 1024 * 1024)
+        file = SimpleUploadedFile('big.bin', content, content_type='application/octet-stream')
+        with self.settings(JOB_UPLOAD_STORAGE='direct', JOB_UPLOAD_MAX_SIZE=20 * 1024 * 1024, AWS_S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024), \
+                patch.object(TemporaryFileUploadHandler, 'new_file') as spooled, patch('jobs.tasks.execute_job_task.apply_async'):
+            response = self.client.post(reverse('job-upload-file'), {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        spooled.assert_not_called()
+        head = get_s3_client().head_object(Bucket='test-bucket', Key=Job.objects.get(id=response.data['id']).parameters['object_key'])
+        self.assertEqual(head['ContentLength'], len(content))
+        self.assertTrue(head['ETag'].strip('"').endswith('-3'))  # three multipart parts
+
+    def test_direct_upload_keeps_one_object_per_content(self, _layer):
+        from jobs.storage import get_s3_client
+        keys = []
+        with self.settings(JOB_UPLOAD_STORAGE='direct'), patch('jobs.tasks.execute_job_task.apply_async'):
+            for name, idempotency_key in (('a.txt', 'k1'), ('b.txt', 'k2'), ('b.txt', 'k2')):
+                file = SimpleUploadedFile(name, b'same bytes', content_type='text/plain')
+                response = self.client.post(reverse('job-upload-file'), {'file': file}, format='multipart',
+                                            HTTP_IDEMPOTENCY_KEY=idempotency_key)
+                keys.append(Job.objects.get(id=response.data['id']).parameters['object_key'])
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual([item['Key'] for item in get_s3_client().list_objects_v2(Bucket='test-bucket')['Contents']], keys[:1])
+
+    def test_rejected_direct_upload_leaves_nothing_in_the_bucket(self, _layer):
+        from jobs.storage import get_s3_client
+        s3 = get_s3_client()
+        too_big = SimpleUploadedFile('big.bin', os.urandom(6 * 1024 * 1024), content_type='application/octet-stream')
+        bad_schedule = SimpleUploadedFile('f.txt', b'content', content_type='text/plain')
+        with self.settings(JOB_UPLOAD_STORAGE='direct', JOB_UPLOAD_MAX_SIZE=5 * 1024 * 1024 + 1, AWS_S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024):
+            responses = [
+                self.client.post(reverse('job-upload-file'), {'file': too_big}, format='multipart'),
+                self.client.post(reverse('job-upload-file'), {'file': bad_schedule, 'schedule_type': 'scheduled'}, format='multipart'),
+            ]
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_400_BAD_REQUEST] * 2)
+        self.assertNotIn('Contents', s3.list_objects_v2(Bucket='test-bucket'))
+        self.assertNotIn('Uploads', s3.list_multipart_uploads(Bucket='test-bucket'))
+
+    def test_presigned_multipart_upload_flow(self, _layer):
+        from jobs.storage import get_s3_client
+        content = os.urandom(6 * 1024 * 1024)
+        response = self.client.post(reverse('job-upload-url'), {'file_name': 'big.bin', 'size': len(content)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload = response.data
+        self.assertEqual(len(upload['parts']), 2)
+        # The client would PUT each chunk to its presigned URL; upload the parts directly here.
+        s3 = get_s3_client()
+        parts = []
+        for part in upload['parts']:
+            start = (part['part_number'] - 1) * upload['part_size']
+            etag = s3.upload_part(Bucket='test-bucket', Key=upload['object_key'], UploadId=upload['upload_id'],
+                                  PartNumber=part['part_number'], Body=content[start:start + upload['part_size']])['ETag']
+            parts.append({'part_number': part['part_number'], 'etag': etag})
+        with patch('jobs.tasks.execute_job_task.apply_async') as mock_apply_async, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('job-upload-complete'), {
+                'object_key': upload['object_key'], 'upload_id': upload['upload_id'],
+                'file_name': 'big.bin', 'parts': parts,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        job = Job.objects.get(id=response.data['id'])
+        self.assertEqual(job.parameters, {'file_name': 'big.bin', 'object_key': upload['object_key']})
+        mock_apply_async.assert_called_once_with(args=[job.id], producer=ANY, queue='jobs.default', priority=5)
+        self.assertEqual(s3.head_object(Bucket='test-bucket', Key=upload['object_key'])['ContentLength'], len(content))
+
+    def test_upload_complete_rejects_foreign_keys(self, _layer):
+        response = self.client.post(reverse('job-upload-complete'), {
+            'object_key': 'private/secrets.txt', 'upload_id': 'x', 'file_name': 'f',
+            'parts': [{'part_number': 1, 'etag': 'e'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_complete_checks_the_uploaded_size(self, _layer):
+        from botocore.exceptions import ClientError
+        from jobs.storage import get_s3_client
+        s3 = get_s3_client()
+        upload = self.client.post(reverse('job-upload-url'), {'file_name': 'f.bin', 'size': 1}, format='json').data
+        # One part was asked for, but nothing stops the client from uploading more.
+        parts = [
+            {'part_number': number, 'etag': s3.upload_part(
+                Bucket='test-bucket', Key=upload['object_key'], UploadId=upload['upload_id'], PartNumber=number, Body=body,
+            )['ETag']}
+            for number, body in ((1, b'a' * (5 * 1024 * 1024)), (2, b'b' * 1024))
+        ]
+        data = {'object_key': upload['object_key'], 'upload_id': upload['upload_id'], 'file_name': 'f.bin', 'parts': parts}
+        with self.settings(JOB_UPLOAD_MAX_SIZE=5 * 1024 * 1024), patch('jobs.tasks.execute_job_task.apply_async'):
+            response = self.client.post(reverse('job-upload-complete'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Job.objects.exists())
+        with self.assertRaises(ClientError):
+            s3.head_object(Bucket='test-bucket', Key=upload['object_key'])
+
+    def test_upload_complete_rejected_by_s3_is_a_bad_request(self, _layer):
+        upload = self.client.post(reverse('job-upload-url'), {'file_name': 'f.bin', 'size': 1}, format='json').data
+        # No part was uploaded, so S3 refuses the completion.
+        response = self.client.post(reverse('job-upload-complete'), {
+            'object_key': upload['object_key'], 'upload_id': upload['upload_id'], 'file_name': 'f.bin',
+            'parts': [{'part_number': 1, 'etag': '"e"'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('upload_id', response.data)
+
+    def upload(self, name, content):
+        file = SimpleUploadedFile(name, content, content_type='text/plain')
+        with patch('jobs.tasks.execute_job_task.apply_async'):
+            response = self.client.post(reverse('job-upload-file'), {'file': file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Job.objects.get(id=response.data['id'])
+
+    def test_same_name_uploads_do_not_collide(self, _layer):
+        first, second = self.upload('report.txt', b'first version'), self.upload('report.txt', b'second version')
+        self.assertNotEqual(first.parameters['temp_path'], second.parameters['temp_path'])
+        with open(first.parameters['temp_path'], 'rb') as f:
+            self.assertEqual(f.read(), b'first version')
+        for job in (first, second):
+            os.remove(job.parameters['temp_path'])
+
+    def test_identical_pending_uploads_keep_their_own_spool_files(self, _layer):
+        from jobs.tasks import execute_job_task
+        first, second = self.upload('a.txt', b'same bytes twice'), self.upload('b.txt', b'same bytes twice')
+        self.assertNotEqual(first.parameters['temp_path'], second.parameters['temp_path'])
+        execute_job_task(first.id)
+        self.assertTrue(os.path.exists(second.parameters['temp_path']))
+        execute_job_task(second.id)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('completed', 'completed'))
+        self.assertEqual(first.result['object_key'], second.result['object_key'])
+        self.assertFalse(os.path.exists(second.parameters['temp_path']))
+
+    def test_identical_content_is_uploaded_once(self, _layer):
+        from jobs import storage
+        from jobs.tasks import execute_job_task
+        first = self.upload('a.txt', b'same bytes')
+        with patch('jobs.handlers.upload_path', wraps=storage.upload_path) as upload:
+            execute_job_task(first.id)
+            second = self.upload('b.txt', b'same bytes')
+            self.assertNotIn('temp_path', second.parameters)
+            execute_job_task(second.id)
+        self.assertEqual(upload.call_count, 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'completed')
+        self.assertTrue(second.result['deduplicated'])
+        self.assertEqual(first.result['object_key'], second.result['object_key'])
+        self.assertTrue(first.result['object_key'].endswith(first.parameters['sha256']))
+
+
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0, JOB_ASYNC_JOB_TYPES=['fetch_data'])
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class AsyncWorkerIntegrationTests(APITransactionTestCase):
+    queue = 'jobs.async.test'
+
+    def test_one_process_runs_many_io_jobs_concurrently(self, _layer):
+        import asyncio
+        import threading
+        import time
+        from jobs.async_worker import AsyncJobWorker
+        from jobs.tasks import execute_job_task
+
+        async def slow_fetch(client, url):
+            await asyncio.sleep(0.5)
+            return {'url': url, 'status': 200, 'data': 'ok'}
+
+        def completed_count():
+            try:
+                return Job.objects.filter(status='completed').count()
+            except OperationalError:
+                return 0  # the in-memory SQLite test database locks tables while the worker writes
+
+        jobs = [Job.objects.create(job_type='fetch_data', parameters={'url': f'http://stub/{i}'}) for i in range(100)]
+        worker = AsyncJobWorker([self.queue], concurrency=200)
+        with patch('jobs.handlers.fetch_url', side_effect=slow_fetch):
+            thread = threading.Thread(target=worker.run)
+            thread.start()
+            try:
+                self.assertTrue(worker.ready.wait(10))
+                start = time.monotonic()
+                for job in jobs:
+                    execute_job_task.apply_async(args=[job.id], queue=self.queue)
+                while completed_count() < len(jobs) and time.monotonic() - start < 20:
+                    time.sleep(0.1)
+                elapsed = time.monotonic() - start
+            finally:
+                worker.stop()
+                thread.join(10)
+        self.assertEqual(Job.objects.filter(status='completed').count(), 100)
+        # 100 jobs of 0.5s each; run one at a time this would take 50s.
+        self.assertLess(elapsed, 10)
+
@@ -1,12 +1,21 @@
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.db import connection
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.request import Request
 from rest_framework import status
 from django.utils import timezone
-from jobs.models import Job
+from jobs.models import Job, JobStatusCounter
+from django.core.management import call_command
+from django.test import override_settings
 import tempfile
-from io import BytesIO
+from io import BytesIO, StringIO
 from django.core.files.uploadedfile import SimpleUploadedFile
 import json
+import smtplib
+import time
+import unittest
+from unittest.mock import ANY, patch, AsyncMock, MagicMock
+from django.core import mail
 
 class JobApiTests(APITestCase):
     def test_create_immediate_email_job(self):
@@ -255,12 +264,14 @@ class JobApiTests(APITestCase):
         }
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertIsInstance(response.data, list)
-        self.assertEqual(len(response.data), 3)
-        for i, email in enumerate(['a@example.com', 'b@example.com', 'c@example.com']):
-            self.assertEqual(response.data[i]['parameters']['recipient'], email)
-            self.assertEqual(response.data[i]['job_type'], 'send_email')
-            self.assertEqual(response.data[i]['schedule_type'], 'immediate')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(response.data['schedule_type'], 'immediate')
+        jobs = list(Job.objects.filter(id__gte=response.data['first_id'], id__lte=response.data['last_id']).order_by('id'))
+        self.assertEqual(len(jobs), 3)
+        for job, email in zip(jobs, ['a@example.com', 'b@example.com', 'c@example.com']):
+            self.assertEqual(job.parameters['recipient'], email)
+            self.assertEqual(job.job_type, 'send_email')
+            self.assertEqual(job.schedule_type, 'immediate')
 
     def test_emails_bulk_email_validation(self):
         url = reverse('job-send-email')
@@ -359,3 +370,1405 @@ class JobApiTests(APITestCase):
         patch_response4 = self.client.patch(patch_url3, {'frequency': 'weekly'}, format='json')
         self.assertEqual(patch_response4.status_code, status.HTTP_200_OK)
         self.assertEqual(patch_response4.data['frequency'], 'weekly')
+
+
+@unittest.skipIf(connection.vendor == 'postgresql', 'PostgreSQL prefers sequential scans on near-empty tables.')
+class JobQueryPlanTests(APITestCase):
+    """Guard the composite indexes used by the job list/filter/order endpoints."""
+
+    def explain_list_query(self, query_string=''):
+        from jobs.views import JobViewSet
+        view = JobViewSet()
+        view.action = 'list'
+        view.format_kwarg = None
+        view.request = Request(APIRequestFactory().get('/api/jobs/' + query_string))
+        return view.filter_queryset(view.get_queryset()).explain()
+
+    def assertPlanUsesIndex(self, query_string, index_name):
+        plan = self.explain_list_query(query_string)
+        self.assertIn(index_name, plan)
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_default_list_uses_created_index(self):
+        self.assertPlanUsesIndex('', 'job_created_id_idx')
+
+    def test_filter_by_status_uses_status_index(self):
+        self.assertPlanUsesIndex('?status=pending', 'job_status_created_id_idx')
+
+    def test_filter_by_job_type_uses_type_index(self):
+        self.assertPlanUsesIndex('?job_type=send_email', 'job_type_created_id_idx')
+
+    def test_filter_by_job_type_and_status_uses_composite_index(self):
+        self.assertPlanUsesIndex('?job_type=send_email&status=failed', 'job_type_status_created_id_idx')
+
+    def test_order_by_priority_uses_priority_index(self):
+        self.assertPlanUsesIndex('?ordering=priority', 'job_priority_created_idx')
+
+    def test_due_recurring_jobs_use_next_run_index(self):
+        plan = Job.objects.filter(next_run_at__lte=timezone.now()).order_by('next_run_at').explain()
+        self.assertIn('job_next_run_idx', plan)
+
+
+class JobStatsTests(APITestCase):
+    def create_job(self, status_value):
+        return Job.objects.create(job_type='send_email', parameters={"recipient": "a@a.com", "subject": "s", "body": "b"}, status=status_value)
+
+    def test_stats_use_a_single_query(self):
+        for status_value in ['pending', 'pending', 'running', 'completed', 'failed']:
+            self.create_job(status_value)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('job-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'total': 5, 'pending': 2, 'running': 1, 'completed': 1, 'failed': 1})
+
+    @override_settings(JOB_STATS_USE_COUNTERS=True)
+    def test_counters_follow_creation_transitions_and_deletion(self):
+        job = self.create_job('pending')
+        self.create_job('pending')
+        job = Job.objects.get(id=job.id)
+        job.status = 'completed'
+        job.save()
+        self.assertEqual(JobStatusCounter.snapshot(), {'pending': 1, 'completed': 1})
+        job.delete()
+        self.assertEqual(JobStatusCounter.snapshot(), {'pending': 1, 'completed': 0})
+        response = self.client.get(reverse('job-stats'))
+        self.assertEqual(response.data['total'], 1)
+        self.assertEqual(response.data['pending'], 1)
+
+    @override_settings(JOB_STATS_USE_COUNTERS=True)
+    def test_reconcile_command_repairs_drift(self):
+        self.create_job('pending')
+        self.create_job('failed')
+        Job.objects.filter(status='failed').update(status='completed')  # bypasses the counters
+        call_command('reconcile_job_counters', stdout=StringIO())
+        self.assertEqual(JobStatusCounter.snapshot(), {'pending': 1, 'failed': 0, 'completed': 1})
+
+
+class JobCursorPaginationTests(APITestCase):
+    def setUp(self):
+        self.jobs = [
+            Job.objects.create(
+                job_type='send_email' if i % 2 else 'upload_file',
+                parameters={"recipient": f"user{i}@example.com", "subject": "s", "body": "b"},
+            )
+            for i in range(12)
+        ]
+
+    def test_cursor_pages_walk_every_job_once_without_count(self):
+        url = reverse('job-list') + '?cursor=&page_size=5'
+        seen = []
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            seen.extend(job['id'] for job in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted((job.id for job in self.jobs), reverse=True))
+
+    def test_cursor_previous_link_returns_to_prior_page(self):
+        first = self.client.get(reverse('job-list') + '?cursor=&page_size=5')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual([j['id'] for j in back.data['results']], [j['id'] for j in first.data['results']])
+
+    def test_cursor_honors_filters_and_optional_count(self):
+        response = self.client.get(reverse('job-list') + '?cursor=&job_type=send_email&include_count=true')
+        self.assertEqual(response.data['count'], 6)
+        self.assertTrue(all(j['job_type'] == 'send_email' for j in response.data['results']))
+
+    def test_page_size_is_client_selectable_and_capped(self):
+        from jobs.pagination import JobPagination
+        response = self.client.get(reverse('job-list') + '?page_size=10')
+        self.assertEqual(len(response.data['results']), 10)
+        with patch.object(JobPagination, 'max_page_size', 3):
+            response = self.client.get(reverse('job-list') + '?cursor=&page_size=50')
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('job-list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_pages_are_one_index_range_scan(self):
+        from jobs.pagination import JobPagination
+        position = (self.jobs[5].created_at, self.jobs[5].id)
+        cases = [
+            (Job.objects.all(), 'job_created_id_idx'),
+            (Job.objects.filter(status='pending'), 'job_status_created_id_idx'),
+            (Job.objects.filter(job_type='send_email'), 'job_type_created_id_idx'),
+            (Job.objects.filter(job_type='send_email', status='pending'), 'job_type_status_created_id_idx'),
+        ]
+        for queryset, index_name in cases:
+            for reverse in (False, True):
+                plan = JobPagination().keyset_queryset(queryset, position, reverse)[:6].explain()
+                self.assertIn(index_name, plan)
+                if connection.vendor == 'sqlite':
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    self.assertNotIn('MULTI-INDEX OR', plan)
+
+
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0)
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class JobTransitionTests(APITestCase):
+    def create_email_job(self, **fields):
+        return Job.objects.create(job_type='send_email', parameters={"recipient": "a@a.com", "subject": "s", "body": "b"}, **fields)
+
+    @override_settings(JOB_STATS_USE_COUNTERS=True)
+    def test_transition_only_applies_from_expected_status(self, _layer):
+        job = self.create_email_job()
+        self.assertTrue(Job.transition(job.id, 'pending', 'running'))
+        self.assertFalse(Job.transition(job.id, 'pending', 'running'))
+        self.assertFalse(Job.transition(job.id + 100, 'pending', 'running'))
+        self.assertEqual(Job.objects.get(id=job.id).status, 'running')
+        self.assertEqual(JobStatusCounter.snapshot(), {'pending': 0, 'running': 1})
+
+    def test_task_skips_job_already_running(self, _layer):
+        from jobs.tasks import execute_job_task
+        job = self.create_email_job(status='running')
+        execute_job_task(job.id)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.get(id=job.id).status, 'running')
+
+    def test_task_writes_only_status_and_result(self, _layer):
+        from jobs.tasks import execute_job_task
+        job = self.create_email_job()
+
+        def send_pooled(message):
+            # A concurrent edit of another column must survive the task's status updates.
+            Job.objects.filter(id=job.id).update(priority=9)
+
+        with patch('jobs.handlers.send_pooled', side_effect=send_pooled):
+            execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.status, job.priority), ('completed', 9))
+        self.assertEqual(job.result['recipient'], 'a@a.com')
+
+
+class JobPriorityRoutingTests(APITestCase):
+    def test_priority_bands_map_to_queues_and_broker_priority(self):
+        from jobs.priority import route_options
+        self.assertEqual(route_options(10), {'queue': 'jobs.high', 'priority': 0})
+        self.assertEqual(route_options(8), {'queue': 'jobs.high', 'priority': 2})
+        self.assertEqual(route_options(5), {'queue': 'jobs.default', 'priority': 5})
+        self.assertEqual(route_options(1), {'queue': 'jobs.low', 'priority': 9})
+        self.assertEqual(route_options(0), {'queue': 'jobs.low', 'priority': 9})
+
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_created_job_is_routed_by_priority(self, apply_async):
+        data = {'recipient': 'a@a.com', 'subject': 's', 'body': 'b', 'priority': 9}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('job-send-email'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        apply_async.assert_called_once_with(args=[response.data['id']], producer=ANY, queue='jobs.high', priority=1)
+
+    @override_settings(JOB_EMAIL_BATCH_SIZE=100)
+    @patch('jobs.dispatch.enqueue')
+    def test_dispatched_signatures_carry_routing(self, enqueue):
+        from jobs.dispatch import dispatch_jobs
+        jobs = [
+            Job.objects.create(job_type=job_type, parameters={'recipient': 'a@a.com'}, priority=priority)
+            for job_type, priority in [('send_email', 2), ('send_email', 9), ('generate_report', 9)]
+        ]
+        dispatch_jobs(jobs)
+        signatures = enqueue.call_args.args[0]
+        self.assertEqual(
+            sorted((sig.task.split('.')[-1], sig.options['queue'], sig.options['priority']) for sig in signatures),
+            [('execute_job_task', 'jobs.high', 1), ('send_email_batch_task', 'jobs.high', 1), ('send_email_batch_task', 'jobs.low', 8)],
+        )
+
+
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0)
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class JobLimitTests(APITestCase):
+    def setUp(self):
+        from jobs.redis_utils import get_redis
+        redis = get_redis()
+        keys = list(redis.scan_iter('jobs:limit:*'))
+        if keys:
+            redis.delete(*keys)
+
+    def create_email_job(self, recipient='a@a.com'):
+        return Job.objects.create(job_type='send_email', parameters={"recipient": recipient, "subject": "s", "body": "b"})
+
+    @override_settings(JOB_TYPE_CONCURRENCY_LIMITS={'upload_file': 2})
+    def test_concurrency_limit_is_shared_and_released(self, _layer):
+        from jobs import limits
+        self.assertEqual(limits.acquire('upload_file', 'a').granted, 1)
+        self.assertEqual(limits.acquire('upload_file', 'b').granted, 1)
+        self.assertEqual(limits.acquire('upload_file', 'c'), limits.Grant(0, None))
+        limits.release('upload_file', 'a')
+        self.assertEqual(limits.acquire('upload_file', 'c').granted, 1)
+        self.assertEqual(limits.acquire('send_email', 'x').granted, 1)  # other types are unlimited
+
+    @override_settings(JOB_TYPE_CONCURRENCY_LIMITS={'upload_file': 1}, JOB_LIMIT_LEASE_SECONDS=0)
+    def test_expired_lease_frees_the_slot(self, _layer):
+        from jobs import limits
+        limits.acquire('upload_file', 'crashed')
+        self.assertEqual(limits.acquire('upload_file', 'next').granted, 1)
+
+    @override_settings(JOB_TYPE_RATE_LIMITS={'send_email': '3/m'})
+    def test_token_bucket_grants_up_to_available_tokens(self, _layer):
+        from jobs import limits
+        self.assertEqual(limits.acquire('send_email', 'batch', want=5).granted, 3)
+        grant = limits.acquire('send_email', 'next')
+        self.assertEqual(grant.granted, 0)
+        self.assertGreater(grant.wait, 0)
+        self.assertLessEqual(grant.wait, 20)
+
+    @override_settings(JOB_TYPE_CONCURRENCY_LIMITS={'send_email': 1})
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_job_over_limit_is_deferred_without_using_a_retry(self, apply_async, _layer):
+        from jobs import limits
+        from jobs.tasks import execute_job_task
+        job = self.create_email_job()
+        limits.acquire('send_email', 'other-worker')
+        execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.status, job.retries), ('pending', 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(apply_async.call_args.kwargs['retries'], 0)
+        self.assertGreaterEqual(apply_async.call_args.kwargs['countdown'], 1)
+        limits.release('send_email', 'other-worker')
+        execute_job_task(job.id)
+        self.assertEqual(Job.objects.get(id=job.id).status, 'completed')
+
+    @override_settings(JOB_TYPE_RATE_LIMITS={'send_email': '2/h'})
+    @patch('jobs.tasks.send_email_batch_task.apply_async')
+    def test_batch_sends_what_the_rate_allows_and_defers_the_rest(self, apply_async, _layer):
+        from jobs.tasks import send_email_batch_task
+        jobs = [self.create_email_job(f'user{i}@example.com') for i in range(5)]
+        outcome = send_email_batch_task([job.id for job in jobs])
+        self.assertEqual(outcome, {'sent': 2, 'failed': 0})
+        self.assertEqual(apply_async.call_args.kwargs['args'], [[job.id for job in jobs[2:]]])
+        self.assertEqual(Job.objects.filter(status='pending').count(), 3)
+
+
+@patch('jobs.tasks.execute_job_task.apply_async')
+class JobIdempotencyTests(APITestCase):
+    def setUp(self):
+        from jobs.redis_utils import get_redis
+        keys = list(get_redis().scan_iter('jobs:idempotency:*'))
+        if keys:
+            get_redis().delete(*keys)
+
+    def post_job(self, key='abc', recipient='a@a.com', **extra):
+        data = {'job_type': 'send_email', 'parameters': {'recipient': recipient, 'subject': 's', 'body': 'b'}}
+        if key:
+            extra['HTTP_IDEMPOTENCY_KEY'] = key
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('job-list'), data, format='json', **extra)
+
+    def test_repeated_key_returns_the_original_job(self, apply_async):
+        first, second = self.post_job(), self.post_job()
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Job.objects.count(), 1)
+        apply_async.assert_called_once()
+        self.assertEqual(self.post_job(key='other').status_code, 201)
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_key_reused_with_a_different_body_is_rejected(self, apply_async):
+        self.post_job()
+        response = self.post_job(recipient='b@b.com')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_unique_dedupe_key_catches_repeats_that_miss_redis(self, apply_async):
+        from jobs.redis_utils import get_redis
+        first = self.post_job()
+        get_redis().delete(*get_redis().scan_iter('jobs:idempotency:*'))
+        second = self.post_job()
+        self.assertEqual((second.status_code, second.data['id']), (201, first.data['id']))
+        self.assertEqual(Job.objects.count(), 1)
+        apply_async.assert_called_once()
+        # Past the TTL the key is released and a new job is created.
+        get_redis().delete(*get_redis().scan_iter('jobs:idempotency:*'))
+        Job.objects.update(created_at=timezone.now() - timezone.timedelta(days=2))
+        self.assertNotEqual(self.post_job().data['id'], first.data['id'])
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_key_reused_with_a_different_body_is_rejected_after_a_redis_miss(self, apply_async):
+        from jobs.redis_utils import get_redis
+        self.post_job()
+        get_redis().delete(*get_redis().scan_iter('jobs:idempotency:*'))
+        response = self.post_job(recipient='b@b.com')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_request_losing_the_reclaim_race_gets_409(self, apply_async):
+        # The key expired between SET NX and GET, and a concurrent request claimed it first.
+        redis = MagicMock(get=MagicMock(return_value=None), set=MagicMock(return_value=False))
+        with patch('jobs.idempotency.get_redis', return_value=redis):
+            response = self.post_job()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(redis.set.call_count, 2)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOB_IDEMPOTENCY_LOCK_SECONDS=30)
+    def test_in_progress_lock_is_short_and_the_response_is_kept_for_the_ttl(self, apply_async):
+        from jobs import idempotency
+        from jobs.redis_utils import get_redis
+        lock_ttls = []
+
+        def create_once(view, *args, **kwargs):
+            lock_ttls.append(get_redis().ttl(idempotency.cache_key(view.dedupe_scope)))
+            return real_create_once(view, *args, **kwargs)
+
+        real_create_once = idempotency.create_once
+        with patch('jobs.idempotency.create_once', side_effect=create_once):
+            self.post_job()
+        self.assertTrue(0 < lock_ttls[0] <= 30)
+        key = next(get_redis().scan_iter('jobs:idempotency:*'))
+        self.assertGreater(get_redis().ttl(key), 30)
+
+    @patch('jobs.views.dispatch_jobs')
+    def test_bulk_email_request_is_idempotent(self, dispatch_jobs, apply_async):
+        data = {'recipients': ['a@a.com', 'b@b.com', 'c@c.com'], 'subject': 's', 'body': 'b'}
+        first = self.client.post(reverse('job-send-email'), data, format='json', HTTP_IDEMPOTENCY_KEY='bulk-1')
+        second = self.client.post(reverse('job-send-email'), data, format='json', HTTP_IDEMPOTENCY_KEY='bulk-1')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(Job.objects.count(), 3)
+        self.assertEqual(dispatch_jobs.call_count, 1)
+
+    @override_settings(JOB_DEDUPE_CONTENT_TTL=60)
+    def test_identical_bodies_are_deduplicated_when_enabled(self, apply_async):
+        self.post_job(key=None)
+        self.post_job(key=None)
+        self.assertEqual(Job.objects.count(), 1)
+        self.post_job(key=None, recipient='b@b.com')
+        self.assertEqual(Job.objects.count(), 2)
+
+
+@patch('jobs.tasks.execute_job_task.apply_async')
+class OutboxTests(APITestCase):
+    def post_job(self, **extra):
+        data = {'job_type': 'send_email', 'parameters': {'recipient': 'a@a.com', 'subject': 's', 'body': 'b'}, **extra}
+        return self.client.post(reverse('job-list'), data, format='json')
+
+    def test_task_is_stored_with_the_job_and_published_after_commit(self, apply_async):
+        from jobs.models import OutboxMessage
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post_job()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.task, message.args), ('jobs.tasks.execute_job_task', [response.data['id']]))
+        apply_async.assert_not_called()
+        for callback in callbacks:
+            callback()
+        apply_async.assert_called_once_with(args=[response.data['id']], producer=ANY, queue='jobs.default', priority=5)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_rolled_back_jobs_leave_no_message(self, apply_async):
+        from django.db import transaction
+        from jobs.dispatch import dispatch_jobs
+        from jobs.models import OutboxMessage
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                dispatch_jobs([Job.objects.create(job_type='generate_report', parameters={})])
+                raise RuntimeError('rolled back')
+        self.assertFalse(OutboxMessage.objects.exists())
+        apply_async.assert_not_called()
+
+    def test_relay_publishes_what_the_web_process_could_not(self, apply_async):
+        from jobs.dispatch import requeue_dead_letters
+        from jobs.models import DeadLetterJob, OutboxMessage
+        apply_async.side_effect = OSError('broker unavailable')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_job()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        job = Job.objects.create(job_type='generate_report', parameters={}, status='failed')
+        DeadLetterJob.record(job, OSError('down'))
+        with self.captureOnCommitCallbacks(execute=True):
+            requeue_dead_letters(DeadLetterJob.objects.all(), spread=60)
+        apply_async.side_effect = None
+        out = StringIO()
+        call_command('run_outbox_relay', once=True, stdout=out)
+        self.assertIn('Published 2 outbox message(s).', out.getvalue())
+        self.assertEqual(apply_async.call_args_list[0].kwargs['args'], [response.data['id']])
+        # countdowns are stored as an absolute eta and published with it
+        self.assertIsNotNone(apply_async.call_args_list[1].kwargs['eta'])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+@patch('jobs.tasks.broadcast_batch_progress')
+class JobBatchTests(APITestCase):
+    def create_batch(self, size=3, **extra):
+        from jobs.models import JobBatch
+        batch = JobBatch.objects.create(total=size, **extra)
+        jobs = [Job.objects.create(job_type='send_email', parameters={'recipient': f'user{i}@example.com'}, batch=batch) for i in range(size)]
+        return batch, jobs
+
+    @patch('jobs.views.dispatch_jobs')
+    def test_bulk_email_creates_a_batch_with_progress_endpoint(self, dispatch_jobs, _progress):
+        data = {
+            'recipients': ['a@example.com', 'b@example.com'], 'subject': 's', 'body': 'b',
+            'on_complete': {'job_type': 'send_notification', 'parameters': {'message': 'done'}},
+        }
+        response = self.client.post(reverse('job-send-email'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        batch_id = response.data['batch_id']
+        self.assertEqual(set(Job.objects.values_list('batch_id', flat=True)), {batch_id})
+        progress = self.client.get(reverse('batch-detail', args=[batch_id])).data
+        self.assertEqual((progress['status'], progress['total'], progress['pending']), ('running', 2, 2))
+        self.assertEqual(progress['on_complete']['job_type'], 'send_notification')
+        data['on_complete'] = {'job_type': 'unknown'}
+        self.assertEqual(self.client.post(reverse('job-send-email'), data, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch('jobs.tasks.enqueue')
+    def test_progress_is_throttled_and_the_last_child_runs_the_callback(self, enqueue, progress):
+        from jobs.models import JobBatch
+        from jobs.tasks import count_in_batch
+        batch, _ = self.create_batch(on_complete={'job_type': 'send_notification', 'parameters': {'message': 'done'}})
+        with patch('jobs.tasks.batch_progress_due', side_effect=[True, False]):
+            count_in_batch(batch.id, completed=1)
+            count_in_batch(batch.id, failed=1)
+            count_in_batch(batch.id, completed=1)
+        self.assertEqual([call.args[0]['status'] for call in progress.call_args_list], ['running', 'completed_with_failures'])
+        batch.refresh_from_db()
+        self.assertEqual((batch.completed, batch.failed, batch.pending), (2, 1, 0))
+        callback = batch.callback_job
+        self.assertEqual(callback.job_type, 'send_notification')
+        self.assertEqual((callback.parameters['message'], callback.parameters['batch']['failed']), ('done', 1))
+        self.assertEqual(enqueue.call_args.args[0][0].args[0], callback.id)
+        self.assertFalse(JobBatch.record(batch.id))  # finished only once
+
+    def test_email_batch_task_counts_outcomes_once_per_batch(self, progress):
+        from jobs.tasks import send_email_batch_task
+        batch, jobs = self.create_batch()
+        with patch('jobs.tasks.JobBatch.record', return_value=True) as record:
+            send_email_batch_task([job.id for job in jobs])
+        record.assert_called_once_with(batch.id, completed=3, failed=0)
+        progress.assert_called_once()
+
+    @patch('jobs.dispatch.enqueue')
+    def test_requeued_dead_letters_reopen_their_batch(self, _enqueue, _progress):
+        from jobs.models import DeadLetterJob, JobBatch
+        batch, jobs = self.create_batch(size=2)
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(status='failed')
+        for job in jobs:
+            DeadLetterJob.record(job, ConnectionError('down'))
+        JobBatch.record(batch.id, failed=2)
+        call_command('requeue_dead_jobs', stdout=StringIO())
+        batch.refresh_from_db()
+        self.assertEqual((batch.failed, batch.status), (0, 'running'))
+
+    @patch('jobs.views.enqueue')
+    def test_retrying_a_permanently_failed_child_reopens_its_batch(self, _enqueue, _progress):
+        from jobs.handlers import JobFailed
+        from jobs.tasks import record_failure
+        batch, jobs = self.create_batch(size=2)
+        Job.objects.filter(id__in=[job.id for job in jobs]).update(status='running')
+        for job in jobs:
+            record_failure(job, JobFailed({'error': 'bad input'}))
+        # A failure waiting for its automatic retry was never counted in the batch.
+        Job.objects.filter(id=jobs[1].id).update(retry_at=timezone.now())
+        self.client.post(reverse('job-retry', args=[jobs[0].id]))
+        self.client.post(reverse('job-retry', args=[jobs[1].id]))
+        batch.refresh_from_db()
+        self.assertEqual((batch.failed, batch.status), (1, 'running'))
+
+    @patch('jobs.views.dispatch_jobs')
+    def test_single_email_with_on_complete_gets_a_batch_of_one(self, dispatch_jobs, _progress):
+        data = {
+            'recipient': 'a@example.com', 'subject': 's', 'body': 'b',
+            'on_complete': {'job_type': 'send_notification', 'parameters': {'message': 'done'}},
+        }
+        response = self.client.post(reverse('job-send-email'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        batch = Job.objects.get(id=response.data['id']).batch
+        self.assertEqual((batch.total, batch.on_complete['job_type']), (1, 'send_notification'))
+
+    @override_settings(JOB_BULK_CREATE_BATCH_SIZE=2)
+    def test_bulk_insert_reads_ids_back_when_the_backend_returns_none(self, _progress):
+        from jobs.models import bulk_create_jobs
+        recipients = [f'user{i}@example.com' for i in range(5)]
+        jobs = [
+            Job(job_type='send_email', parameters={'recipient': recipient}, dedupe_key='request:1' if i == 1 else None)
+            for i, recipient in enumerate(recipients)
+        ]
+        # As on MySQL, bulk_create leaves the primary keys unset.
+        with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False), self.assertNumQueries(9):
+            created = bulk_create_jobs(jobs)
+        self.assertEqual([Job.objects.get(id=job.id).parameters['recipient'] for job in created], recipients)
+        self.assertEqual([job.dedupe_key for job in created], [None, 'request:1', None, None, None])
+        self.assertEqual(list(Job.objects.order_by('id').values_list('dedupe_key', flat=True)), [None, 'request:1', None, None, None])
+
+
+@patch('jobs.scheduler.enqueue')
+class RecurringSchedulerTests(APITestCase):
+    def create_interval_job(self, scheduled_time, frequency='daily', **extra):
+        data = {
+            'job_type': 'generate_report', 'parameters': {}, 'schedule_type': 'interval',
+            'frequency': frequency, 'scheduled_time': scheduled_time.isoformat(), **extra,
+        }
+        response = self.client.post(reverse('job-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Job.objects.get(id=response.data['id'])
+
+    def test_next_run_follows_the_frequency_from_the_anchor(self, _enqueue):
+        from datetime import datetime, timezone as dt_timezone
+        from jobs.scheduler import next_run_after
+        anchor = datetime(2025, 1, 31, 9, 30, tzinfo=dt_timezone.utc)
+        after = datetime(2025, 2, 10, 12, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(next_run_after('hourly', anchor, after), datetime(2025, 2, 10, 12, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_run_after('daily', anchor, after), datetime(2025, 2, 11, 9, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_run_after('weekly', anchor, after), datetime(2025, 2, 14, 9, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_run_after('monthly', anchor, after), datetime(2025, 2, 28, 9, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_run_after('monthly', anchor, datetime(2025, 3, 1, tzinfo=dt_timezone.utc)),
+                         datetime(2025, 3, 31, 9, 30, tzinfo=dt_timezone.utc))
+        self.assertEqual(next_run_after('daily', after, anchor), after)
+        with self.assertRaises(ValueError):
+            next_run_after('fortnightly', anchor, after)
+
+    def test_interval_jobs_get_a_next_run_instead_of_periodic_tasks(self, _enqueue):
+        from django_celery_beat.models import PeriodicTask
+        start = timezone.now() + timezone.timedelta(hours=1)
+        job = self.create_interval_job(start)
+        self.assertEqual(job.next_run_at, start)
+        self.assertFalse(PeriodicTask.objects.exists())
+        later = start + timezone.timedelta(hours=1)
+        response = self.client.patch(
+            reverse('job-detail', args=[job.id]), {'schedule_type': 'scheduled', 'scheduled_time': later.isoformat()}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Now a one-off job waiting in the delayed store.
+        self.assertEqual(Job.objects.get(id=job.id).next_run_at, later)
+
+    def test_due_jobs_are_queued_once_and_moved_to_their_next_run(self, enqueue):
+        from jobs.scheduler import run_due
+        now = timezone.now()
+        due = [self.create_interval_job(now + timezone.timedelta(minutes=1), frequency) for frequency in ('hourly', 'daily')]
+        later = self.create_interval_job(now + timezone.timedelta(hours=5))
+        self.assertEqual(run_due(now=now), 0)
+        out = StringIO()
+        with patch('jobs.scheduler.timezone.now', return_value=now + timezone.timedelta(minutes=2)):
+            call_command('run_scheduler', once=True, stdout=out)
+        self.assertIn('Queued 2 due job run(s).', out.getvalue())
+        self.assertEqual(sorted(signature.args[0] for signature in enqueue.call_args.args[0]), [job.id for job in due])
+        next_runs = dict(Job.objects.values_list('id', 'next_run_at'))
+        self.assertEqual(next_runs[due[0].id], due[0].next_run_at + timezone.timedelta(hours=1))
+        self.assertEqual(next_runs[due[1].id], due[1].next_run_at + timezone.timedelta(days=1))
+        self.assertEqual(next_runs[later.id], later.next_run_at)
+
+    def test_scheduled_jobs_are_promoted_once_and_rescheduled_in_place(self, enqueue):
+        from jobs.scheduler import run_due
+        now = timezone.now()
+        scheduled_time = now + timezone.timedelta(hours=1)
+        data = {'recipients': ['a@example.com', 'b@example.com'], 'subject': 's', 'body': 'b',
+                'schedule_type': 'scheduled', 'scheduled_time': scheduled_time.isoformat()}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('job-send-email'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        enqueue.assert_not_called()
+        job = Job.objects.get(parameters__recipient='a@example.com')
+        self.assertEqual(job.next_run_at, scheduled_time)
+        moved = scheduled_time + timezone.timedelta(hours=1)
+        self.client.patch(reverse('job-detail', args=[job.id]), {'scheduled_time': moved.isoformat()}, format='json')
+        self.assertEqual(run_due(now=scheduled_time), 1)
+        # The due email went out as a batch; the moved one stays until its new time.
+        self.assertEqual([signature.task for signature in enqueue.call_args.args[0]], ['jobs.tasks.send_email_batch_task'])
+        self.assertEqual(run_due(now=scheduled_time), 0)
+        self.assertEqual(run_due(now=moved), 1)
+        self.assertIsNone(Job.objects.get(id=job.id).next_run_at)
+
+    def test_missed_runs_follow_the_misfire_policy(self, enqueue):
+        from jobs.scheduler import run_due
+        start = timezone.now() + timezone.timedelta(minutes=1)
+        once = self.create_interval_job(start, 'hourly')
+        skip = self.create_interval_job(start, 'hourly', misfire_policy='skip')
+        replay = self.create_interval_job(start, 'hourly', misfire_policy='run_all', misfire_max_runs=3)
+        queued = lambda: sorted(signature.args[0] for signature in enqueue.call_args.args[0])
+        # Six hourly runs missed; the latest is ten minutes late.
+        now = start + timezone.timedelta(hours=5, minutes=10)
+        out = StringIO()
+        with patch('jobs.scheduler.timezone.now', return_value=now):
+            call_command('run_scheduler', once=True, stdout=out)
+        self.assertIn('3 job(s) missed runs', out.getvalue())
+        self.assertEqual(queued(), [once.id, replay.id])
+        jobs = Job.objects.in_bulk()
+        self.assertEqual(jobs[once.id].next_run_at, start + timezone.timedelta(hours=6))
+        self.assertEqual(jobs[skip.id].next_run_at, start + timezone.timedelta(hours=6))
+        # Replays are capped and paced one per JOB_MISFIRE_CATCHUP_SECONDS.
+        self.assertEqual(jobs[replay.id].missed_runs, 2)
+        self.assertEqual(jobs[replay.id].next_run_at, now + timezone.timedelta(seconds=60))
+        now += timezone.timedelta(seconds=60)
+        self.assertEqual(run_due(now=now), 1)
+        self.assertEqual(queued(), [replay.id])
+        # Never while a run is still going.
+        Job.objects.filter(id=replay.id).update(status='running')
+        now += timezone.timedelta(seconds=60)
+        enqueue.reset_mock()
+        self.assertEqual(run_due(now=now), 1)
+        self.assertEqual(enqueue.call_args.args[0], [])
+        self.assertEqual(Job.objects.get(id=replay.id).missed_runs, 1)
+        Job.objects.filter(id=replay.id).update(status='completed')
+        now += timezone.timedelta(seconds=60)
+        run_due(now=now)
+        self.assertEqual(queued(), [replay.id])
+        replay.refresh_from_db()
+        self.assertEqual((replay.missed_runs, replay.next_run_at), (0, start + timezone.timedelta(hours=6)))
+        # A run within the grace period is not a misfire, even for skip.
+        run_due(now=start + timezone.timedelta(hours=6, seconds=10))
+        self.assertEqual(queued(), [once.id, skip.id, replay.id])
+
+    def test_runs_until_counts_runs_from_the_anchor(self, _enqueue):
+        from datetime import datetime, timezone as dt_timezone
+        from jobs.scheduler import runs_until
+        anchor = datetime(2025, 1, 31, 9, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(runs_until('daily', anchor, anchor - timezone.timedelta(seconds=1)), (0, None))
+        self.assertEqual(runs_until('hourly', anchor, datetime(2025, 1, 31, 12, 0, tzinfo=dt_timezone.utc)),
+                         (3, datetime(2025, 1, 31, 11, 30, tzinfo=dt_timezone.utc)))
+        self.assertEqual(runs_until('monthly', anchor, datetime(2025, 3, 30, tzinfo=dt_timezone.utc)),
+                         (2, datetime(2025, 2, 28, 9, 30, tzinfo=dt_timezone.utc)))
+        self.assertEqual(runs_until('yearly', anchor, datetime(2027, 1, 31, 9, 30, tzinfo=dt_timezone.utc)),
+                         (3, datetime(2027, 1, 31, 9, 30, tzinfo=dt_timezone.utc)))
+
+    def test_beat_jobs_can_be_adopted(self, _enqueue):
+        from django_celery_beat.models import PeriodicTask
+        start = timezone.now() + timezone.timedelta(hours=1)
+        with self.settings(JOB_RECURRING_SCHEDULER='beat'):
+            job = self.create_interval_job(start)
+        self.assertIsNone(job.next_run_at)
+        self.assertEqual(PeriodicTask.objects.filter(name__endswith=f'job-{job.id}').count(), 2)
+        out = StringIO()
+        call_command('adopt_beat_jobs', stdout=out)
+        self.assertIn('Moved 1 interval job(s)', out.getvalue())
+        self.assertEqual(Job.objects.get(id=job.id).next_run_at, start)
+        self.assertFalse(PeriodicTask.objects.filter(name__endswith=f'job-{job.id}').exists())
+
+
+@patch('jobs.tasks.broadcast_job_status')
+class JobCancellationTests(APITestCase):
+    def setUp(self):
+        # Job ids are reused across tests, so tokens must not outlive the test that wrote them.
+        self.addCleanup(self.clear_tokens)
+        self.clear_tokens()
+
+    def clear_tokens(self):
+        from jobs.redis_utils import get_redis
+        redis = get_redis()
+        for key in redis.scan_iter('jobs:version:*'):
+            redis.delete(key)
+
+    def test_tasks_of_deleted_jobs_are_dropped_without_queries(self, broadcast):
+        from jobs.tasks import execute_job_task
+        job = Job.objects.create(job_type='generate_report', parameters={})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('job-detail', args=[job.id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.assertNumQueries(0):
+            execute_job_task(job.id)
+        broadcast.assert_not_called()
+
+    @patch('jobs.scheduler.enqueue')
+    def test_rescheduling_drops_runs_queued_for_the_old_schedule(self, enqueue, _broadcast):
+        from jobs.scheduler import run_due
+        from jobs.tasks import execute_job_task
+        start = timezone.now() + timezone.timedelta(minutes=5)
+        data = {'job_type': 'generate_report', 'parameters': {}, 'schedule_type': 'interval',
+                'frequency': 'hourly', 'scheduled_time': start.isoformat()}
+        job_id = self.client.post(reverse('job-list'), data, format='json').data['id']
+        run_due(now=start)
+        stale = enqueue.call_args.args[0][0]
+        self.assertEqual((stale.args, stale.kwargs), ((job_id,), {}))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('job-detail', args=[job_id]), {'frequency': 'daily'}, format='json')
+        with self.assertNumQueries(0):
+            execute_job_task(*stale.args, **stale.kwargs)
+        run_due(now=Job.objects.get(id=job_id).next_run_at)
+        self.assertEqual(enqueue.call_args.args[0][0].kwargs, {'version': 1})
+        with patch('jobs.tasks.run_job') as run_job:
+            execute_job_task(job_id, version=1)
+        run_job.assert_called_once()
+
+    def test_row_version_is_checked_when_the_token_is_missing(self, _broadcast):
+        from jobs.tasks import execute_job_task
+        job = Job.objects.create(job_type='generate_report', parameters={}, version=2)
+        with patch('jobs.tasks.run_job') as run_job:
+            execute_job_task(job.id, version=1)
+        run_job.assert_not_called()
+
+    def test_email_batches_skip_cancelled_jobs(self, _broadcast):
+        from jobs.cancellation import cancel
+        from jobs.tasks import send_email_batch_task
+        jobs = [Job.objects.create(job_type='send_email', parameters={'recipient': f'u{i}@example.com'}) for i in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel([jobs[0].id])
+        with patch('jobs.tasks.send_email_batch', return_value={'sent': 1, 'failed': 0}) as send_batch:
+            send_email_batch_task([job.id for job in jobs])
+        self.assertEqual([job.id for job in send_batch.call_args.args[0]], [jobs[1].id])
+
+
+def reports_progress(params):
+    from jobs.progress import current_progress
+    progress = current_progress()
+    progress.update(total=4, step='working')
+    for _ in range(4):
+        progress.advance()
+    return {'message': 'done'}
+
+
+@patch('jobs.progress.broadcaster.publish')
+class JobProgressTests(APITestCase):
+    def setUp(self):
+        # Job ids are reused across tests, so drop reports left by jobs run in other tests.
+        from jobs.redis_utils import get_redis
+        redis = get_redis()
+        for key in redis.scan_iter('jobs:progress:*'):
+            redis.delete(key)
+
+    @override_settings(JOB_PROGRESS_INTERVAL_MS=60000)
+    def test_reports_are_throttled_and_stored_in_redis(self, publish):
+        from jobs import handlers
+        from jobs.progress import read_progress
+        job = Job.objects.create(job_type='process_image', parameters={})
+        with patch.dict(handlers.HANDLERS, {'process_image': handlers.Handler(reports_progress)}), \
+                self.assertNumQueries(0):
+            handlers.run_handler('process_image', {}, job.id)
+        # The first report and the final one; the three in between fall inside the interval.
+        self.assertEqual([call.args[0]['progress']['done'] for call in publish.call_args_list], [0, 4])
+        self.assertEqual(publish.call_args.args[0]['status'], 'running')
+        report = read_progress(job.id)
+        self.assertEqual((report['done'], report['total'], report['percent'], report['step']), (4, 4, 100.0, 'working'))
+        # The report outlives the run; the row's status says the job is done.
+        Job.objects.filter(id=job.id).update(status='completed')
+        response = self.client.get(reverse('job-progress', args=[job.id]))
+        self.assertEqual((response.data['status'], response.data['progress']['percent']), ('completed', 100.0))
+
+    def test_progress_outside_a_job_is_discarded(self, publish):
+        from jobs.progress import current_progress
+        reports_progress({})
+        current_progress().update(done=1)
+        publish.assert_not_called()
+        job = Job.objects.create(job_type='process_image', parameters={})
+        response = self.client.get(reverse('job-progress', args=[job.id]))
+        self.assertEqual((response.data['status'], response.data['progress']), ('pending', None))
+        self.assertEqual(self.client.get(reverse('job-progress', args=[999999])).status_code, status.HTTP_404_NOT_FOUND)
+
+
+def always_fails(params):
+    raise OSError('downstream unavailable')
+
+
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0)
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class JobRetryPolicyTests(APITestCase):
+    @patch('jobs.retry.random.uniform', side_effect=lambda low, high: high)
+    def test_backoff_doubles_up_to_the_cap(self, _uniform, _layer):
+        from jobs.retry import RetryPolicy
+        policy = RetryPolicy(base_delay=2, max_delay=10)
+        self.assertEqual([policy.backoff(attempt) for attempt in range(1, 6)], [2, 4, 8, 10, 10])
+
+    @override_settings(JOB_RETRY_BASE_DELAY=1, JOB_RETRY_MAX_DELAY=60, JOB_TYPE_RETRY_BACKOFF={'fetch_data': (5.0, 600.0)})
+    def test_delays_are_jittered_and_overridable_per_type(self, _layer):
+        from jobs.handlers import retry_policy
+        delays = [retry_policy('process_image').next_delay(OSError(), 3, 3) for _ in range(200)]
+        self.assertTrue(all(0 <= delay <= 4 for delay in delays))
+        self.assertGreater(len(set(delays)), 100)
+        self.assertEqual(retry_policy('fetch_data').max_delay, 600.0)
+        self.assertIsNone(retry_policy('process_image').next_delay(OSError(), 4, 3))
+
+    @override_settings(JOB_RETRY_MAX_DELAY=60, JOB_TYPE_RETRY_BACKOFF={'fetch_data': (5.0,)})
+    def test_per_type_backoff_without_a_cap_keeps_the_global_cap(self, _layer):
+        from jobs.handlers import retry_policy
+        policy = retry_policy('fetch_data')
+        self.assertEqual((policy.base_delay, policy.max_delay), (5.0, 60))
+
+    def test_exceptions_can_be_excluded_from_retries(self, _layer):
+        from jobs.handlers import retry_policy
+        refused = smtplib.SMTPRecipientsRefused({'a@a.com': (550, b'No such user')})
+        self.assertIsNone(retry_policy('send_email').next_delay(refused, 1, 3))
+        self.assertIsNotNone(retry_policy('send_email').next_delay(smtplib.SMTPDataError(451, b'later'), 1, 3))
+
+    def test_job_max_retries_is_honored_then_dead_lettered(self, _layer):
+        from jobs import handlers
+        from jobs.models import DeadLetterJob
+        from jobs.tasks import execute_job_task
+        job = Job.objects.create(job_type='process_image', parameters={}, max_retries=1)
+        with patch.dict(handlers.HANDLERS, {'process_image': handlers.Handler(always_fails)}), \
+                patch('jobs.tasks.execute_job_task.retry', side_effect=RuntimeError('retry scheduled')) as retry:
+            with self.assertRaisesMessage(RuntimeError, 'retry scheduled'):
+                execute_job_task(job.id)
+            self.assertLessEqual(retry.call_args.kwargs['countdown'], 2)
+            execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.status, job.retries), ('failed', 2))
+        letter = DeadLetterJob.objects.get(job=job)
+        self.assertEqual((letter.attempts, letter.exception, letter.error), (2, 'builtins.OSError', 'downstream unavailable'))
+
+    @patch('jobs.dispatch.enqueue')
+    def test_permanent_failures_are_dead_lettered_and_requeueable(self, enqueue, _layer):
+        from jobs.models import DeadLetterJob
+        from jobs.tasks import execute_job_task
+        job = Job.objects.create(job_type='send_notification', parameters={})
+        execute_job_task(job.id)
+        letter = DeadLetterJob.objects.get(job=job)
+        self.assertEqual((letter.attempts, letter.exception), (0, 'jobs.handlers.JobFailed'))
+        call_command('requeue_dead_jobs', stdout=StringIO())
+        self.assertEqual(Job.objects.get(id=job.id).status, 'pending')
+        self.assertIsNotNone(DeadLetterJob.objects.get(job=job).requeued_at)
+
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_refused_recipient_is_dead_lettered_without_retry(self, apply_async, _layer):
+        from jobs.models import DeadLetterJob
+        from jobs.tasks import send_email_batch_task
+        job = Job.objects.create(job_type='send_email', parameters={"recipient": "bad@example.com", "subject": "s", "body": "b"})
+        refused = smtplib.SMTPRecipientsRefused({'bad@example.com': (550, b'No such user')})
+        with patch('jobs.mail.send_pooled', side_effect=refused):
+            send_email_batch_task([job.id])
+        apply_async.assert_not_called()
+        self.assertEqual(DeadLetterJob.objects.get().exception, 'smtplib.SMTPRecipientsRefused')
+
+    @patch('jobs.dispatch.enqueue')
+    def test_requeue_dead_jobs_resets_and_staggers_jobs(self, enqueue, _layer):
+        from jobs.models import DeadLetterJob
+        jobs = [Job.objects.create(job_type='fetch_data', parameters={}, status='failed', retries=4, priority=p) for p in (1, 9)]
+        other = Job.objects.create(job_type='send_email', parameters={}, status='failed', retries=4)
+        for job in jobs + [other]:
+            DeadLetterJob.record(job, ConnectionError('down'))
+        out = StringIO()
+        call_command('requeue_dead_jobs', job_type='fetch_data', spread=10, stdout=out)
+        self.assertIn('Requeued 2 dead-lettered job(s).', out.getvalue())
+        self.assertEqual(set(Job.objects.filter(id__in=[j.id for j in jobs]).values_list('status', 'retries')), {('pending', 0)})
+        self.assertEqual(Job.objects.get(id=other.id).status, 'failed')
+        signatures = enqueue.call_args.args[0]
+        self.assertEqual([(s.args[0], s.options['countdown']) for s in signatures], [(jobs[1].id, 0), (jobs[0].id, 5)])
+        self.assertEqual(DeadLetterJob.objects.filter(requeued_at__isnull=True).get().job_id, other.id)
+        call_command('requeue_dead_jobs', job_type='fetch_data', stdout=StringIO())
+        self.assertEqual(enqueue.call_args.args[0], [])  # already requeued
+
+
+def cpu_square(params):
+    import os
+    return {'value': params['n'] ** 2, 'pid': os.getpid()}
+
+
+def png_bytes(width, height):
+    import struct
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I4sIIBBBBB', 13, b'IHDR', width, height, 8, 2, 0, 0, 0) + b'\0' * 4
+
+
+def shutdown_process_pool():
+    import os
+    from jobs import handlers
+    handlers._process_pool(os.getpid()).shutdown()
+    handlers._process_pool.cache_clear()
+
+
+@patch('jobs.tasks.broadcast_job_status')
+class JobClaimTests(APITestCase):
+    def run_task(self, job):
+        from jobs import handlers
+        from jobs.tasks import execute_job_task
+        handler = MagicMock(return_value={'ok': True})
+        with patch.dict(handlers.HANDLERS, {'generate_report': handlers.Handler(handler)}):
+            execute_job_task(job.id)
+        return handler.call_count
+
+    def test_duplicate_messages_do_not_run_finished_jobs_again(self, _broadcast):
+        job = Job.objects.create(job_type='generate_report', parameters={})
+        self.assertEqual(self.run_task(job), 1)
+        self.assertEqual(self.run_task(job), 0)
+        Job.objects.filter(id=job.id).update(status='failed', result={'error': 'permanent'})
+        self.assertEqual(self.run_task(job), 0)
+        # A failed job waiting for its automatic retry is claimable, once.
+        Job.objects.filter(id=job.id).update(retry_at=timezone.now())
+        self.assertEqual(self.run_task(job), 1)
+        self.assertIsNone(Job.objects.get(id=job.id).retry_at)
+        self.assertEqual(self.run_task(job), 0)
+
+    def test_running_jobs_are_taken_over_only_once_their_lease_expired(self, _broadcast):
+        from jobs.lease import lease_deadline
+        job = Job.objects.create(job_type='generate_report', parameters={}, status='running', lease_expires_at=lease_deadline())
+        self.assertEqual(self.run_task(job), 0)
+        Job.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timezone.timedelta(seconds=1))
+        self.assertEqual(self.run_task(job), 1)
+        self.assertEqual(Job.objects.get(id=job.id).status, 'completed')
+
+    @patch('jobs.scheduler.enqueue')
+    def test_scheduler_rearms_recurring_jobs_for_their_next_run(self, enqueue, _broadcast):
+        from jobs.scheduler import run_due
+        start = timezone.now() + timezone.timedelta(minutes=5)
+        data = {'job_type': 'generate_report', 'parameters': {}, 'schedule_type': 'interval',
+                'frequency': 'hourly', 'scheduled_time': start.isoformat()}
+        job = Job.objects.get(id=self.client.post(reverse('job-list'), data, format='json').data['id'])
+        Job.objects.filter(id=job.id).update(status='completed')
+        run_due(now=start)
+        self.assertEqual(Job.objects.get(id=job.id).status, 'pending')
+        self.assertEqual(self.run_task(job), 1)
+        self.assertEqual(self.run_task(job), 0)
+
+
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0)
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class JobHandlerTests(APITestCase):
+    def test_every_job_type_has_a_handler(self, _layer):
+        from jobs.handlers import HANDLERS
+        from jobs.models import JOB_TYPE_CHOICES
+        self.assertEqual(set(HANDLERS), {job_type for job_type, _ in JOB_TYPE_CHOICES})
+
+    def test_cpu_handlers_run_in_a_process_pool(self, _layer):
+        import os
+        from jobs import handlers
+        with patch.dict(handlers.HANDLERS, {'process_image': handlers.Handler(cpu_square, handlers.CPU)}):
+            result = handlers.run_handler('process_image', {'n': 7})
+        shutdown_process_pool()
+        self.assertEqual(result['value'], 49)
+        self.assertNotEqual(result['pid'], os.getpid())
+
+    def test_sync_handlers_on_the_event_loop_recycle_their_thread_connection(self, _layer):
+        import threading
+        from asgiref.sync import async_to_sync
+        from jobs import handlers
+        threads = []
+
+        def record_thread(params):
+            threads.append(threading.current_thread())
+            return {}
+
+        with patch.dict(handlers.HANDLERS, {'process_image': handlers.Handler(record_thread)}), \
+                patch('jobs.db.close_old_connections') as close_old_connections:
+            async_to_sync(handlers.run_handler_async)('process_image', {})
+        self.assertNotEqual(threads, [threading.current_thread()])
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    def test_process_image_leaves_the_event_loop(self, _layer):
+        import os
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from asgiref.sync import async_to_sync
+        from jobs import handlers, images
+        threads = []
+
+        def image_info(data):
+            threads.append(threading.current_thread())
+            return images.image_info(data)
+
+        async def run():
+            threads.append(threading.current_thread())
+            return await handlers.run_handler_async('process_image', {'temp_path': path})
+
+        self.assertEqual(handlers.HANDLERS['process_image'].kind, handlers.CPU)
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root), \
+                ThreadPoolExecutor(1) as pool, patch('jobs.handlers._process_pool', return_value=pool), \
+                patch('jobs.handlers.image_info', side_effect=image_info):
+            path = os.path.join(media_root, 'uploads', 'photo.png')
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as image:
+                image.write(png_bytes(640, 480))
+            result = async_to_sync(run)()
+        loop_thread, worker_thread = threads
+        self.assertNotEqual(worker_thread, loop_thread)
+        self.assertEqual((result['format'], result['width'], result['height']), ('png', 640, 480))
+
+    def test_process_image_runs_in_the_process_pool(self, _layer):
+        import hashlib
+        import os
+        from jobs.tasks import execute_job_task
+        self.addCleanup(shutdown_process_pool)
+        data = png_bytes(3, 2)
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'uploads'))
+            paths = {name: os.path.join(media_root, 'uploads', name) for name in ('photo.png', 'notes.txt')}
+            with open(paths['photo.png'], 'wb') as image, open(paths['notes.txt'], 'wb') as text:
+                image.write(data)
+                text.write(b'not an image')
+            job = Job.objects.create(job_type='process_image', parameters={'temp_path': paths['photo.png']})
+            execute_job_task(job.id)
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'completed')
+            self.assertEqual((job.result['width'], job.result['height']), (3, 2))
+            self.assertEqual(job.result['sha256'], hashlib.sha256(data).hexdigest())
+            for parameters in ({}, {'temp_path': paths['notes.txt']}, {'temp_path': __file__}):
+                job = Job.objects.create(job_type='process_image', parameters=parameters)
+                execute_job_task(job.id)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.retries), ('failed', 0))
+
+    def test_image_info_reads_gif_jpeg_and_bmp_headers(self, _layer):
+        import struct
+        from jobs.images import image_info
+        gif = b'GIF89a' + struct.pack('<HH', 10, 20)
+        jpeg = b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 4) + b'\0\0' + b'\xff\xc0' + struct.pack('>HBHH', 11, 8, 30, 40)
+        bmp = b'BM' + b'\0' * 16 + struct.pack('<ii', 50, -60)
+        sizes = [(image_info(data)['format'], image_info(data)['width'], image_info(data)['height']) for data in (gif, jpeg, bmp)]
+        self.assertEqual(sizes, [('gif', 10, 20), ('jpeg', 40, 30), ('bmp', 50, 60)])
+        with self.assertRaises(ValueError):
+            image_info(b'\x89PNG\r\n\x1a\n')
+
+    def test_backup_database_dumps_gzipped_json(self, _layer):
+        import gzip
+        from jobs import handlers
+        Job.objects.create(job_type='generate_report', parameters={})
+        with tempfile.TemporaryDirectory() as backup_dir, self.settings(JOB_BACKUP_DIR=backup_dir):
+            result = handlers.run_handler('backup_database', {'apps': ['jobs.Job']})
+            with gzip.open(result['path'], 'rt') as dump:
+                rows = json.load(dump)
+            with self.assertRaises(handlers.JobFailed):
+                handlers.run_handler('backup_database', {'apps': ['no_such_app']})
+        self.assertEqual([row['fields']['job_type'] for row in rows], ['generate_report'])
+
+    def test_send_notification_reaches_the_unfiltered_stream(self, layer):
+        from jobs import handlers
+        handlers.run_handler('send_notification', {'batch': {'batch_id': 4, 'completed': 2, 'failed': 1}})
+        group, event = layer.return_value.group_send.call_args.args
+        self.assertEqual((group, event['type']), ('job_status', 'job_notification'))
+        self.assertEqual(event['data']['message'], 'Batch 4 finished: 2 completed, 1 failed.')
+
+    def test_fetch_data_fetches_urls_concurrently(self, _layer):
+        from jobs.tasks import execute_job_task
+        job = Job.objects.create(job_type='fetch_data', parameters={'urls': ['http://a.test', 'http://b.test']})
+
+        def fetch_url(client, url):
+            if url == 'http://b.test':
+                raise OSError('unreachable')
+            return {'url': url, 'status': 200, 'data': {'ok': True}}
+
+        with patch('jobs.handlers.fetch_url', side_effect=fetch_url):
+            execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.result['results'][0]['data'], {'ok': True})
+        self.assertIn('error', job.result['results'][1])
+
+    def test_fetch_data_refuses_local_files_and_internal_addresses(self, _layer):
+        from jobs.tasks import execute_job_task
+        urls = ['file:///etc/passwd', 'http://169.254.169.254/latest/meta-data/', 'http://127.0.0.1:1/', 'http://[::ffff:10.0.0.1]/']
+        job = Job.objects.create(job_type='fetch_data', parameters={'urls': urls})
+        execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.status, job.retries), ('failed', 0))
+        self.assertEqual([result['url'] for result in job.result['results']], urls)
+        self.assertIn('non-public address', job.result['results'][1]['error'])
+
+    @override_settings(JOB_FETCH_ALLOW_PRIVATE_NETWORKS=True, JOB_FETCH_MAX_BYTES=64)
+    def test_fetch_data_caps_the_response_size(self, _layer):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from jobs.tasks import execute_job_task
+
+        class Stub(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = b'{"ok": true}' if self.path == '/small' else b'x' * 1000
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()  # no Content-Length: the cap applies while streaming
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Stub)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = f'http://127.0.0.1:{server.server_port}'
+        job = Job.objects.create(job_type='fetch_data', parameters={'urls': [f'{base}/small', f'{base}/large']})
+        execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.result['results'][0]['data'], {'ok': True})
+        self.assertIn('exceeds 64 bytes', job.result['results'][1]['error'])
+
+    @override_settings(JOB_ASYNC_JOB_TYPES=['fetch_data'])
+    @patch('jobs.retry.random.uniform', side_effect=lambda low, high: high)
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_async_execution_retries_through_the_broker(self, apply_async, _uniform, _layer):
+        from asgiref.sync import async_to_sync
+        from jobs.async_worker import execute_job
+        job = Job.objects.create(job_type='fetch_data', parameters={'url': 'http://a.test'})
+        with patch('jobs.handlers.fetch_url', side_effect=OSError('unreachable')):
+            async_to_sync(execute_job)(job.id, 1)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.status, job.retries), ('failed', 1))
+        apply_async.assert_called_once_with(args=[job.id], kwargs={}, countdown=2, retries=2, queue='jobs.async', priority=5)
+
+    @patch('jobs.dispatch.dispatch_jobs')
+    def test_batch_process_fans_out_child_jobs(self, dispatch_jobs, _layer):
+        from jobs.tasks import execute_job_task
+        items = [{"recipient": f"user{i}@example.com", "subject": "s", "body": "b"} for i in range(3)]
+        job = Job.objects.create(job_type='batch_process', parameters={'job_type': 'send_email', 'items': items})
+        execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual(job.status, 'completed')
+        children = Job.objects.filter(id__in=job.result['job_ids'])
+        self.assertEqual(sorted(c.parameters['recipient'] for c in children), [i['recipient'] for i in items])
+        self.assertEqual(len(dispatch_jobs.call_args.args[0]), 3)
+
+    def test_invalid_batch_fails_without_retry(self, _layer):
+        from jobs.tasks import execute_job_task
+        job = Job.objects.create(job_type='batch_process', parameters={'job_type': 'nope', 'items': [{}]})
+        execute_job_task(job.id)
+        job = Job.objects.get(id=job.id)
+        self.assertEqual((job.status, job.retries), ('failed', 0))
+        self.assertIn('error', job.result)
+
+    def test_cleanup_files_keeps_recent_and_unfinished_uploads(self, _layer):
+        import os
+        import time
+        from jobs.handlers import cleanup_files
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            uploads = os.path.join(media_root, 'uploads')
+            os.makedirs(uploads)
+            names = ('stale', 'pending', 'running', 'retrying', 'dead', 'recent')
+            paths = {name: os.path.join(uploads, name) for name in names}
+            for name, path in paths.items():
+                with open(path, 'wb') as f:
+                    f.write(b'x' * 10)
+                if name != 'recent':
+                    os.utime(path, (time.time() - 48 * 3600,) * 2)
+            Job.objects.create(job_type='upload_file', parameters={'file_name': 'p', 'temp_path': paths['pending']})
+            Job.objects.create(job_type='upload_file', parameters={'file_name': 'p', 'temp_path': paths['running']}, status='running')
+            Job.objects.create(job_type='upload_file', parameters={'file_name': 'p', 'temp_path': paths['retrying']},
+                               status='failed', retries=1, max_retries=1, retry_at=timezone.now())
+            Job.objects.create(job_type='upload_file', parameters={'file_name': 'p', 'temp_path': paths['dead']},
+                               status='failed', retries=3, max_retries=3)
+            result = cleanup_files({'max_age_hours': 24})
+            self.assertEqual((result['removed'], result['bytes_freed']), (2, 20))
+            self.assertEqual(sorted(os.listdir(uploads)), ['pending', 'recent', 'retrying', 'running'])
+
+
+@override_settings(JOB_STATUS_BROADCAST_WINDOW_MS=0)
+@patch('jobs.broadcast.get_channel_layer', return_value=MagicMock(group_send=AsyncMock()))
+class EmailBatchTaskTests(APITestCase):
+    def create_email_job(self, recipient):
+        return Job.objects.create(job_type='send_email', parameters={"recipient": recipient, "subject": "s", "body": "b"})
+
+    def tearDown(self):
+        from jobs.mail import close_mail_connection
+        close_mail_connection()
+
+    def test_batch_sends_every_pending_job_over_one_connection(self, _layer):
+        from jobs.tasks import send_email_batch_task
+        jobs = [self.create_email_job(f'user{i}@example.com') for i in range(3)]
+        done = self.create_email_job('done@example.com')
+        Job.objects.filter(id=done.id).update(status='completed')
+        with patch('jobs.mail.get_connection', wraps=mail.get_connection) as get_connection:
+            outcome = send_email_batch_task([job.id for job in jobs] + [done.id])
+        self.assertEqual(outcome, {'sent': 3, 'failed': 0})
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['user0@example.com', 'user1@example.com', 'user2@example.com'])
+        self.assertEqual(set(Job.objects.filter(id__in=[j.id for j in jobs]).values_list('status', flat=True)), {'completed'})
+
+    @patch('jobs.retry.random.uniform', side_effect=lambda low, high: high)
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_batch_records_per_message_failures(self, retry, _uniform, _layer):
+        from jobs.tasks import send_email_batch_task
+        ok, bad = self.create_email_job('ok@example.com'), self.create_email_job('bad@example.com')
+
+        def send_pooled(message):
+            if message.to == ['bad@example.com']:
+                raise smtplib.SMTPDataError(451, b'Try again later')
+            mail.outbox.append(message)
+
+        with patch('jobs.mail.send_pooled', side_effect=send_pooled):
+            outcome = send_email_batch_task([ok.id, bad.id])
+        self.assertEqual(outcome, {'sent': 1, 'failed': 1})
+        self.assertEqual(Job.objects.get(id=ok.id).status, 'completed')
+        bad = Job.objects.get(id=bad.id)
+        self.assertEqual((bad.status, bad.retries), ('failed', 1))
+        self.assertIn('error', bad.result)
+        retry.assert_called_once_with(args=[bad.id], kwargs={}, countdown=2, queue='jobs.default', priority=5)
+
+    @patch('jobs.tasks.execute_job_task.apply_async')
+    def test_batch_records_unexpected_errors_per_message(self, retry, _layer):
+        from jobs.tasks import send_email_batch_task
+        ok, bad = self.create_email_job('ok@example.com'), self.create_email_job('bad@example.com')
+
+        def send_pooled(message):
+            if message.to == ['bad@example.com']:
+                raise ValueError('header contains a newline')
+            mail.outbox.append(message)
+
+        with patch('jobs.mail.send_pooled', side_effect=send_pooled):
+            outcome = send_email_batch_task([ok.id, bad.id])
+        self.assertEqual(outcome, {'sent': 1, 'failed': 1})
+        self.assertEqual(Job.objects.get(id=ok.id).status, 'completed')
+        self.assertEqual(Job.objects.get(id=bad.id).status, 'failed')
+        self.assertFalse(Job.objects.filter(status='running').exists())
+
+    def test_pooled_connection_reconnects_after_disconnect(self, _layer):
+        from jobs import mail as pooled_mail
+        connection = MagicMock()
+        connection.send_messages.side_effect = [smtplib.SMTPServerDisconnected(), 1]
+        with patch('jobs.mail.get_connection', return_value=connection) as get_connection:
+            pooled_mail.send_pooled(pooled_mail.build_email_message({'recipient': 'a@a.com'}))
+        self.assertEqual(get_connection.call_count, 2)
+        connection.close.assert_called_once()
+
+
+class JobStatusBroadcastTests(APITestCase):
+    def test_updates_are_coalesced_per_job_into_one_batch(self):
+        from jobs.broadcast import JobStatusBroadcaster
+        broadcaster = JobStatusBroadcaster()
+        with self.settings(JOB_STATUS_BROADCAST_WINDOW_MS=60000), patch('jobs.broadcast.send_batch') as send_batch:
+            broadcaster.publish({'id': 1, 'status': 'running', 'result': None})
+            broadcaster.publish({'id': 2, 'status': 'running', 'result': None})
+            broadcaster.publish({'id': 1, 'status': 'completed', 'result': {'ok': True}})
+            send_batch.assert_not_called()
+            broadcaster.flush()
+        send_batch.assert_called_once_with([
+            {'id': 2, 'status': 'running', 'result': None},
+            {'id': 1, 'status': 'completed', 'result': {'ok': True}},
+        ])
+
+    def test_full_batch_is_flushed_immediately(self):
+        from jobs.broadcast import JobStatusBroadcaster
+        broadcaster = JobStatusBroadcaster()
+        with self.settings(JOB_STATUS_BROADCAST_WINDOW_MS=60000, JOB_STATUS_BROADCAST_MAX_BATCH=2), \
+                patch('jobs.broadcast.send_batch') as send_batch:
+            broadcaster.publish({'id': 1, 'status': 'running', 'result': None})
+            broadcaster.publish({'id': 2, 'status': 'running', 'result': None})
+        self.assertEqual(len(send_batch.call_args.args[0]), 2)
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_consumer_sends_batch_as_single_array_frame(self):
+        from asgiref.sync import async_to_sync
+        from channels.testing import WebsocketCommunicator
+        from jobs.consumers import JobStatusConsumer
+
+        async def scenario():
+            communicator = WebsocketCommunicator(JobStatusConsumer.as_asgi(), '/ws/jobs/status/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            from channels.layers import get_channel_layer
+            batch = [{'id': 1, 'status': 'completed', 'result': None}, {'id': 2, 'status': 'failed', 'result': None}]
+            await get_channel_layer().group_send('job_status', {'type': 'job_status_batch', 'data': batch})
+            frame = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return frame
+
+        frame = async_to_sync(scenario)()
+        self.assertEqual([update['id'] for update in frame], [1, 2])
+
+    def test_send_batch_skips_groups_without_subscribers(self):
+        from jobs.broadcast import send_batch, group_interest
+        layer = MagicMock(group_send=AsyncMock())
+        interest = {'job_status.job.1': 1, 'job_status.type.send_email': 2}
+        with patch('jobs.broadcast.get_channel_layer', return_value=layer), \
+                patch.object(group_interest, 'snapshot', return_value=interest):
+            send_batch([{'id': 1, 'job_type': 'send_email', 'status': 'completed', 'result': None}])
+        groups = sorted(call.args[0] for call in layer.group_send.call_args_list)
+        self.assertEqual(groups, ['job_status.job.1', 'job_status.type.send_email'])
+
+    @override_settings(JOB_STATUS_INTEREST_TTL_MS=0)
+    @patch('jobs.broadcast.LocalInterest._ensure_heartbeat')
+    def test_interest_is_counted_per_process_and_expires_with_it(self, _heartbeat):
+        from jobs.broadcast import INTEREST_KEY, GroupInterest, LocalInterest
+        from jobs.redis_utils import get_redis
+        redis = get_redis()
+        redis.delete(INTEREST_KEY)
+        first, second, interest = LocalInterest(), LocalInterest(), GroupInterest()
+        self.addCleanup(redis.delete, INTEREST_KEY, first.key, second.key)
+        first.register(['job_status', 'job_status.job.1'], 1)
+        second.register(['job_status'], 1)
+        # A leave that was never matched by a join (e.g. after a restart) cannot go below zero.
+        second.register(['job_status.job.1'], -1)
+        self.assertEqual(interest.snapshot(), {'job_status': 2, 'job_status.job.1': 1})
+        # The first process stops renewing: once its lease has run out its clients no longer count.
+        redis.zadd(INTEREST_KEY, {first.key: time.time() - 1})
+        self.assertEqual(interest.snapshot(), {'job_status': 1})
+        second.heartbeat()
+        self.assertEqual(redis.zrange(INTEREST_KEY, 0, -1), [second.key.encode()])
+        second.register(['job_status'], -1)
+        second.heartbeat()
+        self.assertEqual(interest.snapshot(), {})
+        self.assertFalse(redis.exists(INTEREST_KEY))
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_consumer_subscribes_to_filtered_topics(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from jobs.routing import websocket_urlpatterns
+
+        application = URLRouter(websocket_urlpatterns)
+
+        async def scenario():
+            layer = get_channel_layer()
+            by_type = WebsocketCommunicator(application, '/ws/jobs/type/send_email/status/?status=failed')
+            self.assertTrue((await by_type.connect())[0])
+            by_message = WebsocketCommunicator(application, '/ws/jobs/status/')
+            self.assertTrue((await by_message.connect())[0])
+            await by_message.send_json_to({'action': 'subscribe', 'job_id': 7})
+            subscriptions = await by_message.receive_json_from()
+            await by_message.send_json_to({'action': 'subscribe', 'job_type': 'unknown'})
+            error = await by_message.receive_json_from()
+
+            await layer.group_send('job_status', {'type': 'job_status_batch', 'data': [{'id': 1}]})
+            await layer.group_send('job_status.job.7', {'type': 'job_status_batch', 'data': [{'id': 7}]})
+            await layer.group_send('job_status.status.failed', {'type': 'job_status_batch', 'data': [{'id': 9}]})
+            frames = (await by_type.receive_json_from(), await by_message.receive_json_from())
+            self.assertTrue(await by_type.receive_nothing())
+            self.assertTrue(await by_message.receive_nothing())
+
+            rejected = WebsocketCommunicator(application, '/ws/jobs/status/?job_type=unknown')
+            accepted, _ = await rejected.connect()
+            await by_type.disconnect()
+            await by_message.disconnect()
+            return subscriptions, error, frames, accepted
+
+        with patch('jobs.consumers.register_interest') as register_interest:
+            subscriptions, error, frames, accepted = async_to_sync(scenario)()
+        self.assertEqual(subscriptions, {'subscriptions': ['job_status.job.7']})
+        self.assertIn('error', error)
+        self.assertEqual(frames, ([{'id': 9}], [{'id': 7}]))
+        self.assertFalse(accepted)
+        deltas = sum(len(call.args[0]) * call.args[1] for call in register_interest.call_args_list)
+        self.assertEqual(deltas, 0)
+
+
+@override_settings(JOB_RETENTION_DAYS={'completed': 30, 'failed': 90}, JOB_TASK_RESULT_RETENTION_DAYS=7, JOB_STATS_USE_COUNTERS=True)
+class JobRetentionTests(APITestCase):
+    def create_finished(self, status, days_ago, **fields):
+        job = Job.objects.create(job_type='generate_report', parameters={}, status=status, **fields)
+        finished = timezone.now() - timezone.timedelta(days=days_ago)
+        Job.objects.filter(id=job.id).update(created_at=finished, updated_at=finished)
+        return Job.objects.get(id=job.id)
+
+    def test_old_finished_jobs_are_archived_and_restored(self):
+        from django_celery_results.models import TaskResult
+        from jobs.models import DeadLetterJob
+        archived = [self.create_finished('completed', 31), self.create_finished('failed', 91)]
+        DeadLetterJob.record(archived[1], ConnectionError('down'))
+        kept = [
+            self.create_finished('completed', 29),
+            self.create_finished('failed', 60),
+            self.create_finished('pending', 100),
+            self.create_finished('completed', 100, schedule_type='interval', next_run_at=timezone.now()),
+            # Interval jobs run by celery beat have no next_run_at.
+            self.create_finished('completed', 100, schedule_type='interval'),
+            self.create_finished('failed', 100, retry_at=timezone.now()),
+        ]
+        TaskResult.objects.create(task_id='old')
+        TaskResult.objects.filter(task_id='old').update(date_done=timezone.now() - timezone.timedelta(days=8))
+        TaskResult.objects.create(task_id='new')
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/jobs.jsonl.gz'
+            out = StringIO()
+            call_command('archive_jobs', output=path, batch_size=1, stdout=out)
+            self.assertIn(f'Archived 2 job(s) to {path}.', out.getvalue())
+            self.assertEqual(set(Job.objects.values_list('id', flat=True)), {job.id for job in kept})
+            self.assertFalse(DeadLetterJob.objects.exists())
+            self.assertEqual(list(TaskResult.objects.values_list('task_id', flat=True)), ['new'])
+            self.assertEqual(JobStatusCounter.snapshot()['completed'], 3)
+            out = StringIO()
+            call_command('restore_jobs', path, stdout=out)
+            self.assertIn('3 restored, 0 already present', out.getvalue())
+            call_command('restore_jobs', path, stdout=out)
+            self.assertIn('0 restored, 3 already present', out.getvalue())
+        restored = Job.objects.get(id=archived[1].id)
+        # Django's serializer keeps timestamps to the millisecond.
+        self.assertEqual(restored.status, 'failed')
+        self.assertEqual(restored.created_at, archived[1].created_at.replace(microsecond=archived[1].created_at.microsecond // 1000 * 1000))
+        self.assertEqual(DeadLetterJob.objects.get().job_id, restored.id)
+        self.assertEqual(JobStatusCounter.snapshot()['completed'], 4)
+
+    @override_settings(JOB_RETENTION_DAYS={'completed': 30, 'running': 1})
+    def test_retention_of_unfinished_statuses_is_refused(self):
+        with self.assertRaises(ValueError):
+            call_command('archive_jobs', stdout=StringIO())
@@ -0,0 +1,137 @@
+"""
+Direct-mode uploads (JOB_UPLOAD_STORAGE=direct), streamed to the bucket while the request is read.
+
+Django's default upload handlers spool large files to a temporary file, which then had to be read
+again to hash it and a third time to send it. DirectUploadParser replaces them with
+BucketUploadHandler: each file is hashed as its chunks arrive and sent as parts of a multipart
+upload every AWS_S3_MULTIPART_CHUNKSIZE bytes (a single PUT when it is smaller), so it is read once
+and never touches the web node's disk. The serializer receives a StreamedFile carrying the object
+key, SHA-256 and size. Objects of requests that did not keep them (rejected, replayed, or identical
+to stored content) are deleted again by discard_unused_uploads.
+"""
+import hashlib
+from functools import wraps
+from typing import Optional
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework.parsers import MultiPartParser
+from .models import StoredObject
+from .storage import MB, delete_object, get_s3_client, new_object_key
+
+
+class StreamedFile(UploadedFile):
+    """An uploaded file already in the bucket at object_key (None when it was too large to send)."""
+
+    def __init__(self, object_key: Optional[str], sha256: Optional[str], **kwargs):
+        super().__init__(file=None, **kwargs)
+        self.object_key = object_key
+        self.sha256 = sha256
+
+    def discard(self) -> None:
+        """Delete the object of an upload that no job will use."""
+        if self.object_key:
+            delete_object(self.object_key)
+            self.object_key = None
+
+    def close(self):
+        pass  # nothing was opened locally
+
+
+class BucketUploadHandler(FileUploadHandler):
+    """Send each file of a multipart request to the bucket as it is received."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.key = new_object_key(self.file_name)
+        self.digest, self.size = hashlib.sha256(), 0
+        self.buffer, self.parts, self.upload_id = bytearray(), [], None
+        self.max_size = getattr(settings, 'JOB_UPLOAD_MAX_SIZE', 10 * MB)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            # Stop sending; the serializer rejects the file by its size.
+            self.abort()
+            return None
+        self.digest.update(raw_data)
+        self.buffer += raw_data
+        if len(self.buffer) >= getattr(settings, 'AWS_S3_MULTIPART_CHUNKSIZE', 8 * MB):
+            self.send_part()
+        return None
+
+    def file_complete(self, file_size):
+        if self.size > self.max_size:
+            object_key, sha256 = None, None
+        else:
+            self.finish()
+            object_key, sha256 = self.key, self.digest.hexdigest()
+        return StreamedFile(
+            object_key, sha256, name=self.file_name, content_type=self.content_type, size=self.size,
+            charset=self.charset, content_type_extra=self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        self.abort()
+
+    def send_part(self) -> None:
+        s3, bucket = get_s3_client(), settings.AWS_STORAGE_BUCKET_NAME
+        try:
+            if self.upload_id is None:
+                self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=self.key)['UploadId']
+            number = len(self.parts) + 1
+            etag = s3.upload_part(
+                Bucket=bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=bytes(self.buffer),
+            )['ETag']
+        except Exception:
+            self.abort()
+            raise
+        self.parts.append({'PartNumber': number, 'ETag': etag})
+        self.buffer = bytearray()
+
+    def finish(self) -> None:
+        s3, bucket = get_s3_client(), settings.AWS_STORAGE_BUCKET_NAME
+        if self.upload_id is None:
+            s3.put_object(Bucket=bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+        if self.buffer:
+            self.send_part()
+        try:
+            s3.complete_multipart_upload(
+                Bucket=bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': self.parts},
+            )
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Drop the parts sent so far (once) and the buffered data."""
+        if self.upload_id is not None:
+            get_s3_client().abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=self.key, UploadId=self.upload_id,
+            )
+            self.upload_id = None
+        self.buffer = bytearray()
+
+
+class DirectUploadParser(MultiPartParser):
+    """MultiPartParser that streams files to the bucket instead of spooling them in direct mode."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if getattr(settings, 'JOB_UPLOAD_STORAGE', 'local') == 'direct':
+            request = parser_context['request']
+            request.upload_handlers = [BucketUploadHandler(request)]
+        return super().parse(stream, media_type, parser_context)
+
+
+def discard_unused_uploads(view_method):
+    """Delete the streamed files of an upload action that no StoredObject refers to once it has answered."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        try:
+            return view_method(self, request, *args, **kwargs)
+        finally:
+            for file in request.FILES.values():
+                if isinstance(file, StreamedFile) and not StoredObject.objects.filter(object_key=file.object_key).exists():
+                    file.discard()
+    return wrapper
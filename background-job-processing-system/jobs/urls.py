@@ -1,9 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import JobViewSet, TestWebSocketView
+from .views import JobBatchViewSet, JobViewSet, TestWebSocketView
 
 router = DefaultRouter()
 router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'batches', JobBatchViewSet, basename='batch')
 
 urlpatterns = [
     path('', include(router.urls)),
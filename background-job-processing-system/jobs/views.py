@@ -2,15 +2,28 @@ from django.shortcuts import render
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
-from .models import Job, JOB_TYPE_CHOICES
-from .serializers import JobSerializer, FileUploadJobSerializer, SendEmailJobSerializer
-from .tasks import execute_job_task
+from rest_framework.parsers import FormParser
+from .models import DeadLetterJob, Job, JobBatch, JobStatusCounter, JOB_TYPE_CHOICES, job_status_counts
+from .cancellation import bump_version, cancel, version_kwargs
+from .dispatch import delay_jobs, dispatch_jobs, is_delayed, job_signature
+from .idempotency import idempotent
+from .outbox import enqueue
+from .pagination import JobPagination
+from .progress import read_progress
+from .scheduler import schedule_recurring
+from .priority import route_options
+from .storage import create_presigned_multipart_upload, get_s3_client, new_object_key
+from .uploads import DirectUploadParser, discard_unused_uploads
+from .serializers import (
+    JobSerializer, FileUploadJobSerializer, SendEmailJobSerializer,
+    PresignedUploadSerializer, CompleteUploadJobSerializer, JobBatchSerializer,
+)
 from django_celery_beat.models import PeriodicTask, CrontabSchedule, ClockedSchedule
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.views.generic import TemplateView
-import boto3
-import os
+from redis.exceptions import RedisError
 import json
 from datetime import datetime
 
@@ -24,6 +37,7 @@ class JobViewSet(viewsets.ModelViewSet):
     """ViewSet for managing background jobs."""
     queryset = Job.objects.all().order_by('-created_at')
     filter_backends = [filters.OrderingFilter]
+    pagination_class = JobPagination
     ordering_fields = ['created_at', 'priority', 'status']
 
     def get_serializer_class(self):
@@ -32,21 +46,60 @@ class JobViewSet(viewsets.ModelViewSet):
             return FileUploadJobSerializer
         elif self.action == 'send_email':
             return SendEmailJobSerializer
+        elif self.action == 'upload_url':
+            return PresignedUploadSerializer
+        elif self.action == 'upload_complete':
+            return CompleteUploadJobSerializer
         return JobSerializer
 
     def handle_job_scheduling(self, job):
         """Schedule the job for execution based on its schedule_type."""
-        if job.schedule_type == 'immediate':
-            execute_job_task.delay(job.id)
-        elif job.schedule_type == 'scheduled':
-            execute_job_task.apply_async(args=[job.id], eta=job.scheduled_time)
-        else:
+        if is_delayed(job):
+            # Promoted to the queue by manage.py run_scheduler when due (see jobs/scheduler.py).
+            delay_jobs([job])
+        elif job.schedule_type in ('immediate', 'scheduled'):
+            # Published through the outbox once the surrounding transaction commits.
+            enqueue([job_signature(job)])
+        elif getattr(settings, 'JOB_RECURRING_SCHEDULER', 'scheduler') == 'beat':
             self.create_periodic_task(job)
+        else:
+            # Picked up by manage.py run_scheduler when due (see jobs/scheduler.py).
+            schedule_recurring(job)
+
+    def save_and_schedule(self, serializer):
+        """Create the job(s) and queue their tasks in one transaction; returns what serializer.save() returned."""
+        with transaction.atomic():
+            jobs = serializer.save(dedupe_scope=self.dedupe_scope, dedupe_fingerprint=self.dedupe_fingerprint)
+            if isinstance(jobs, list):
+                dispatch_jobs(jobs)
+            else:
+                self.handle_job_scheduling(jobs)
+        return jobs
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Create a job; repeats with the same Idempotency-Key return the original job."""
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """Override to handle job scheduling after creation."""
-        job = serializer.save()
-        self.handle_job_scheduling(job)
+        self.save_and_schedule(serializer)
+
+    def created_response(self, jobs):
+        """
+        201 response for created jobs: the job itself, or a compact summary for bulk requests
+        (first_id and last_id are not a range; other requests' jobs may have ids in between).
+        """
+        if len(jobs) == 1:
+            return Response(JobSerializer(jobs[0]).data, status=status.HTTP_201_CREATED)
+        return Response({
+            'count': len(jobs),
+            'first_id': jobs[0].id,
+            'last_id': jobs[-1].id,
+            'job_type': jobs[0].job_type,
+            'schedule_type': jobs[0].schedule_type,
+            'batch_id': jobs[0].batch_id,
+        }, status=status.HTTP_201_CREATED)
 
     def get_queryset(self):
         """Optionally filter jobs by job_type and status."""
@@ -60,7 +113,7 @@ class JobViewSet(viewsets.ModelViewSet):
         return queryset
 
     def create_periodic_task(self, job):
-        """Create a periodic or clocked task for recurring jobs."""
+        """Create a periodic or clocked task for recurring jobs (JOB_RECURRING_SCHEDULER=beat)."""
         # Remove any previous task with this job ID
         PeriodicTask.objects.filter(name=f'job-{job.id}').delete()
         PeriodicTask.objects.filter(name=f'enable-job-{job.id}').delete()
@@ -89,10 +142,12 @@ class JobViewSet(viewsets.ModelViewSet):
         periodic_task = PeriodicTask.objects.create(
             crontab=schedule,
             name=f'job-{job.id}',
-            task='jobs.tasks.execute_job_task',
+            task='jobs.tasks.run_recurring_job_task',
             args=json.dumps([job.id]),
+            kwargs=json.dumps(version_kwargs(job)),
             start_time=start,
-            enabled=True
+            enabled=True,
+            **route_options(job.priority, job.job_type)
         )
         if not enabled:
             clocked = ClockedSchedule.objects.get_or_create(clocked_time=start)[0]
@@ -116,66 +171,102 @@ class JobViewSet(viewsets.ModelViewSet):
         job = self.get_object()
         if job.status != JOB_STATUS_FAILED:
             return Response({'error': 'Only failed jobs can be retried.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Only a failure with no retry left was counted in its batch (dead-lettered or JobFailed).
+        counted_in_batch = job.retry_at is None
         job.status = JOB_STATUS_PENDING
         job.retries = 0
-        job.save()
-        execute_job_task.delay(job.id)
+        job.retry_at = None
+        with transaction.atomic():
+            # A retry still waiting in the broker from the failed run must not run the job a second time.
+            bump_version(job)
+            job.save()
+            DeadLetterJob.objects.filter(job=job, requeued_at__isnull=True).update(requeued_at=timezone.now())
+            if counted_in_batch:
+                JobBatch.reopen(job.batch_id, failed=1)
+            enqueue([job_signature(job)])
         return Response({'status': 'Job retried.'})
 
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        """
+        The job's status with its latest progress report from Redis. Reports outlive the run that
+        wrote them (until JOB_PROGRESS_TTL), so the row's status tells whether it is still running.
+        """
+        job = self.get_object()
+        try:
+            report = read_progress(job.id)
+        except RedisError:
+            report = None
+        return Response({'id': job.id, 'status': job.status, 'progress': report})
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Return job statistics by status."""
+        """Return job statistics by status (one GROUP BY, or the counter table when enabled)."""
+        counts = JobStatusCounter.snapshot() if JobStatusCounter.enabled() else job_status_counts()
         return Response({
-            'total': Job.objects.count(),
-            JOB_STATUS_PENDING: Job.objects.filter(status=JOB_STATUS_PENDING).count(),
-            JOB_STATUS_RUNNING: Job.objects.filter(status=JOB_STATUS_RUNNING).count(),
-            JOB_STATUS_COMPLETED: Job.objects.filter(status=JOB_STATUS_COMPLETED).count(),
-            JOB_STATUS_FAILED: Job.objects.filter(status=JOB_STATUS_FAILED).count(),
+            'total': sum(counts.values()),
+            JOB_STATUS_PENDING: counts.get(JOB_STATUS_PENDING, 0),
+            JOB_STATUS_RUNNING: counts.get(JOB_STATUS_RUNNING, 0),
+            JOB_STATUS_COMPLETED: counts.get(JOB_STATUS_COMPLETED, 0),
+            JOB_STATUS_FAILED: counts.get(JOB_STATUS_FAILED, 0),
         })
 
     @action(detail=False, methods=['post'], url_path='send-email')
+    @idempotent
     def send_email(self, request):
-        """Create one or more email jobs (single, bulk, or personalized)."""
+        """Create one or more email jobs (single, bulk, or personalized); bulk requests return a summary."""
         serializer = SendEmailJobSerializer(data=request.data)
         if serializer.is_valid():
-            jobs = serializer.save()
-            if isinstance(jobs, list):
-                for job in jobs:
-                    self.handle_job_scheduling(job)
-                return Response([JobSerializer(job).data for job in jobs], status=status.HTTP_201_CREATED)
-            else:
-                self.handle_job_scheduling(jobs)
-                return Response(JobSerializer(jobs).data, status=status.HTTP_201_CREATED)
+            jobs = self.save_and_schedule(serializer)
+            # Compact summary instead of serializing every bulk job back.
+            return self.created_response(jobs if isinstance(jobs, list) else [jobs])
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser], url_path='upload-file-standalone')
+    @action(detail=False, methods=['post'], parser_classes=[DirectUploadParser, FormParser], url_path='upload-file-standalone')
+    @discard_unused_uploads
+    @idempotent
     def upload_file_standalone(self, request):
         """Create a file upload job (standalone endpoint)."""
         serializer = FileUploadJobSerializer(data=request.data)
         if serializer.is_valid():
-            job = serializer.save()
-            self.handle_job_scheduling(job)
+            job = self.save_and_schedule(serializer)
             return Response(JobSerializer(job).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser, FormParser], url_path='upload-file')
+    @action(detail=False, methods=['post'], parser_classes=[DirectUploadParser, FormParser], url_path='upload-file')
+    @discard_unused_uploads
+    @idempotent
     def upload_file(self, request):
         """Create a file upload job (main endpoint)."""
         serializer = FileUploadJobSerializer(data=request.data)
         if serializer.is_valid():
-            job = serializer.save()
-            self.handle_job_scheduling(job)
+            job = self.save_and_schedule(serializer)
             return Response(JobSerializer(job).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    def _get_s3_client(self):
-        """Helper to create an S3 client using environment variables."""
-        return boto3.client(
-            's3',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION', 'us-east-1')
+    @action(detail=False, methods=['post'], url_path='upload-url')
+    def upload_url(self, request):
+        """Start a presigned multipart upload so the client can send the file straight to S3."""
+        serializer = PresignedUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = create_presigned_multipart_upload(
+            new_object_key(serializer.validated_data['file_name']),
+            serializer.validated_data['size'],
         )
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='upload-complete')
+    @idempotent
+    def upload_complete(self, request):
+        """Complete a presigned multipart upload and create its upload_file job."""
+        serializer = CompleteUploadJobSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = self.save_and_schedule(serializer)
+        return Response(JobSerializer(job).data, status=status.HTTP_201_CREATED)
+
+    def _get_s3_client(self):
+        """Helper returning the process-wide cached S3 client."""
+        return get_s3_client()
 
     @action(detail=True, methods=['get'], url_path='download-url')
     def download_url(self, request, pk=None):
@@ -184,15 +275,19 @@ class JobViewSet(viewsets.ModelViewSet):
         if job.job_type != 'upload_file' or not job.result or not isinstance(job.result, dict):
             return Response({'error': 'No downloadable file for this job.'}, status=status.HTTP_400_BAD_REQUEST)
         file_url = job.result.get('file_url')
-        file_name = file_url.split('/')[-1] if file_url else job.parameters.get('file_name')
+        file_name = job.result.get('object_key') or (file_url.split('/')[-1] if file_url else job.parameters.get('file_name'))
         if not file_name:
             return Response({'error': 'File name not found.'}, status=status.HTTP_400_BAD_REQUEST)
         s3 = self._get_s3_client()
-        bucket = os.getenv('AWS_STORAGE_BUCKET_NAME')
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
         try:
             presigned_url = s3.generate_presigned_url(
                 'get_object',
-                Params={'Bucket': bucket, 'Key': file_name},
+                Params={
+                    'Bucket': bucket,
+                    'Key': file_name,
+                    'ResponseContentDisposition': f'attachment; filename="{job.parameters.get("file_name", file_name)}"',
+                },
                 ExpiresIn=3600
             )
             return Response({'download_url': presigned_url})
@@ -203,9 +298,12 @@ class JobViewSet(viewsets.ModelViewSet):
         """Ensure that deleting a job also deletes any scheduled/periodic tasks so the job will never run."""
         # Remove any periodic or clocked tasks associated with this job
         from django_celery_beat.models import PeriodicTask
-        PeriodicTask.objects.filter(name=f'job-{instance.id}').delete()
-        PeriodicTask.objects.filter(name=f'enable-job-{instance.id}').delete()
-        super().perform_destroy(instance)
+        with transaction.atomic():
+            PeriodicTask.objects.filter(name=f'job-{instance.id}').delete()
+            PeriodicTask.objects.filter(name=f'enable-job-{instance.id}').delete()
+            # Messages already in the broker are dropped by the workers without a database query.
+            cancel([instance.id])
+            super().perform_destroy(instance)
 
     def update(self, request, *args, **kwargs):
         """Allow updating only scheduled_time, frequency, and schedule_type for pending jobs with schedule_type 'interval' or 'scheduled'."""
@@ -216,25 +314,36 @@ class JobViewSet(viewsets.ModelViewSet):
         if instance.status != 'pending' or schedule_type_val not in ['interval', 'scheduled']:
             print(f"[DEBUG] Update blocked: status={instance.status}, schedule_type={instance.schedule_type}")
             return Response({'error': f'Only pending jobs with schedule_type interval or scheduled can be updated. (status={instance.status}, schedule_type={instance.schedule_type})'}, status=status.HTTP_400_BAD_REQUEST)
-        allowed_fields = {'scheduled_time', 'frequency', 'schedule_type'}
+        allowed_fields = {'scheduled_time', 'frequency', 'schedule_type', 'misfire_policy', 'misfire_max_runs'}
         data = {k: v for k, v in request.data.items() if k in allowed_fields}
         serializer = self.get_serializer(instance, data=data, partial=partial)
         serializer.is_valid(raise_exception=True)
         old_scheduled_time = instance.scheduled_time
         old_frequency = instance.frequency
         old_schedule_type = instance.schedule_type
-        self.perform_update(serializer)
-        if (
-            old_scheduled_time != serializer.instance.scheduled_time or
-            old_frequency != serializer.instance.frequency or
-            old_schedule_type != serializer.instance.schedule_type
-        ):
-            from django_celery_beat.models import PeriodicTask
-            PeriodicTask.objects.filter(name=f'job-{instance.id}').delete()
-            PeriodicTask.objects.filter(name=f'enable-job-{instance.id}').delete()
-            self.handle_job_scheduling(serializer.instance)
+        with transaction.atomic():
+            self.perform_update(serializer)
+            if (
+                old_scheduled_time != serializer.instance.scheduled_time or
+                old_frequency != serializer.instance.frequency or
+                old_schedule_type != serializer.instance.schedule_type
+            ):
+                from django_celery_beat.models import PeriodicTask
+                PeriodicTask.objects.filter(name=f'job-{instance.id}').delete()
+                PeriodicTask.objects.filter(name=f'enable-job-{instance.id}').delete()
+                Job.objects.filter(id=instance.id).update(next_run_at=None, missed_runs=0)
+                # Runs already queued for the old schedule are dropped by the workers.
+                bump_version(serializer.instance)
+                self.handle_job_scheduling(serializer.instance)
         return Response(self.get_serializer(serializer.instance).data)
 
+# --- Job Batches ---
+class JobBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    """Aggregated progress of job batches (bulk emails, batch_process runs)."""
+    queryset = JobBatch.objects.all().order_by('-created_at')
+    serializer_class = JobBatchSerializer
+    pagination_class = JobPagination
+
 # --- WebSocket Test View ---
 class TestWebSocketView(TemplateView):
     """Simple template for testing WebSocket permissions."""